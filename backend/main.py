@@ -1,15 +1,26 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field, ConfigDict
 from services.ner_service import NERService
 from services.financial_ner_service import FinancialNERService
 from services.std_service import StdService
 from services.financial_std_service import FinancialStdService
 from services.abbr_service import AbbrService
-from services.corr_service import CorrService
+from services.corr_service import PREFILTER_UNAVAILABLE, CorrService
 from services.gen_service import GenService
+from utils.reranker import DEFAULT_RERANK_MODEL, get_reranker
+from utils.single_flight import coalesce, single_flight_metrics
+from utils.admission import DEFAULT_PRIORITY, PRIORITIES, AdmissionRejected, admission_metrics, get_model_queue
+from utils.llm_pool import llm_pool_metrics
+from utils.resilience import BREAKER_RESET_S, ProviderUnavailable, breaker_metrics
+from utils.ner_cache import ner_cache_metrics
+from utils.spell_checker import get_spell_checker
 from typing import List, Dict, Optional, Literal, Union, Any
+import asyncio
 import logging
+import math
+import time
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -35,6 +46,30 @@ abbr_service = AbbrService()  # 缩写扩展服务
 gen_service = GenService()  # 文本生成服务
 corr_service = CorrService()  # 拼写纠正服务
 
+# LLM 过载时快速拒绝：429 + Retry-After
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc), "reason": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+# 模型提供方超时或熔断、且没有降级路径（如文本生成、没有词法索引的标准化）时：503 + Retry-After
+@app.exception_handler(ProviderUnavailable)
+async def provider_unavailable(request: Request, exc: ProviderUnavailable):
+    retry_after = exc.retry_after if exc.retry_after is not None else BREAKER_RESET_S
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "reason": exc.reason},
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+def _request_priority(request: Request) -> str:
+    """请求头 X-Request-Priority: interactive（默认）| batch"""
+    priority = request.headers.get("X-Request-Priority", DEFAULT_PRIORITY).lower()
+    return priority if priority in PRIORITIES else DEFAULT_PRIORITY
+
 # 基础模型类
 class BaseInputModel(BaseModel):
     """基础输入模型，包含所有模型共享的字段"""
@@ -66,10 +101,56 @@ class EmbeddingOptions(BaseModel):
         default="concepts_only_name",
         description="集合名称"
     )
+    vectorStore: Literal["default", "numpy"] = Field(
+        default="default",
+        description="检索后端：default 使用数据库自带检索（Milvus/Chroma），numpy 使用进程内精确检索"
+    )
+    artifactPath: Optional[str] = Field(
+        default=None,
+        description="numpy 后端可选的向量产物目录"
+    )
+    routeByEntityType: bool = Field(
+        default=True,
+        description="按实体类型只检索对应的 SNOMED 领域（如疾病只检索 Condition）"
+    )
+    searchMode: Literal["dense", "hybrid"] = Field(
+        default="dense",
+        description="检索模式：dense 只使用向量检索，hybrid 并行执行向量检索和词法检索（BM25 + 字符 n-gram）后按 RRF 融合"
+    )
+
+class RerankOptions(BaseModel):
+    """交叉编码器重排序选项"""
+    enabled: bool = Field(
+        default=False,
+        description="是否对向量检索结果进行交叉编码器重排序"
+    )
+    model: str = Field(
+        default=DEFAULT_RERANK_MODEL,
+        description="交叉编码器模型名称"
+    )
+    candidates: int = Field(
+        default=20,
+        description="第一阶段从向量库召回的候选数量 N",
+        ge=1
+    )
+    topK: int = Field(
+        default=5,
+        description="重排序后每个术语返回的结果数量",
+        ge=1
+    )
+    budgetMs: Optional[float] = Field(
+        default=None,
+        description="请求延迟预算（毫秒），预计超出时跳过重排序，返回向量检索顺序",
+        gt=0
+    )
 
 class TextInput(BaseInputModel):
     """文本输入模型，用于标准化和命名实体识别"""
     text: str = Field(..., description="输入文本")
+    domain: Literal["medical", "financial"] = Field(
+        default="medical",
+        description="领域"
+    )
     options: Dict[str, bool] = Field(
         default_factory=dict,
         description="处理选项"
@@ -82,6 +163,10 @@ class TextInput(BaseInputModel):
         default_factory=EmbeddingOptions,
         description="向量数据库配置选项"
     )
+    rerankOptions: RerankOptions = Field(
+        default_factory=RerankOptions,
+        description="重排序选项"
+    )
     
 class FinancialEmbeddingOptions(BaseModel):
     """金融向量数据库配置选项"""
@@ -109,14 +194,25 @@ class AbbrInput(BaseInputModel):
         default="",
         description="上下文信息"
     )
-    method: Literal["simple_ollama", "query_db_llm_rerank", "llm_rank_query_db"] = Field(
+    method: Literal["simple_ollama", "query_db_llm_rerank", "llm_rank_query_db",
+                    "llm_rank_query_db_pipelined", "document", "simple_ollama_pruned"] = Field(
         default="simple_ollama",
         description="处理方法"
     )
+    llmConcurrency: int = Field(
+        default=4,
+        description="文档模式下 LLM 并发调用上限",
+        ge=1,
+        le=32
+    )
     embeddingOptions: Optional[EmbeddingOptions] = Field(
         default_factory=EmbeddingOptions,
         description="向量数据库配置选项"
     )
+    rerankOptions: RerankOptions = Field(
+        default_factory=RerankOptions,
+        description="重排序选项"
+    )
 
 class ErrorOptions(BaseModel):
     """错误生成选项"""
@@ -135,11 +231,30 @@ class ErrorOptions(BaseModel):
         default="qwerty",
         description="键盘布局"
     )
+    seed: Optional[int] = Field(
+        default=None,
+        description="随机种子，提供时结果可复现"
+    )
+
+class ChunkOptions(BaseModel):
+    """分块纠正选项"""
+    maxConcurrency: int = Field(
+        default=4,
+        description="LLM 并发调用上限",
+        ge=1,
+        le=32
+    )
+    maxChunkChars: int = Field(
+        default=600,
+        description="分块的最大字符数",
+        ge=50
+    )
 
 class CorrInput(BaseInputModel):
     """拼写纠正输入模型"""
     text: str = Field(..., description="输入文本")
-    method: Literal["correct_spelling", "add_mistakes"] = Field(
+    method: Literal["correct_spelling", "correct_spelling_chunked", "correct_spelling_prefiltered",
+                    "add_mistakes"] = Field(
         default="correct_spelling",
         description="处理方法"
     )
@@ -147,6 +262,10 @@ class CorrInput(BaseInputModel):
         default_factory=ErrorOptions,
         description="错误生成选项"
     )
+    chunkOptions: ChunkOptions = Field(
+        default_factory=ChunkOptions,
+        description="分块纠正选项"
+    )
 
 class PatientInfo(BaseModel):
     """患者信息模型"""
@@ -185,6 +304,12 @@ class GenInput(BaseInputModel):
 # API 端点：术语标准化
 @app.post("/api/std")
 async def standardization(input: TextInput):
+    started_at = time.perf_counter()
+    # 相同的并发请求只计算一次；NER、嵌入和检索都是同步调用，放到线程中执行以免阻塞事件循环
+    return await coalesce("std", input, lambda: asyncio.to_thread(_standardize, input, started_at))
+
+def _standardize(input: TextInput, started_at: float):
+    rerank = input.rerankOptions
     try:
         # 记录请求信息
         logger.info(f"Received request: domain={input.domain}, text={input.text}, options={input.options}")
@@ -208,7 +333,10 @@ async def standardization(input: TextInput):
                 provider=input.embeddingOptions.provider,
                 model=input.embeddingOptions.model,
                 db_path=f"db/{input.embeddingOptions.dbName}.db",
-                collection_name=input.embeddingOptions.collectionName
+                collection_name=input.embeddingOptions.collectionName,
+                vector_store=input.embeddingOptions.vectorStore,
+                artifact_path=input.embeddingOptions.artifactPath,
+                search_mode=input.embeddingOptions.searchMode
             )
 
             # 获取识别到的实体
@@ -216,10 +344,19 @@ async def standardization(input: TextInput):
             if not entities:
                 return {"message": "No financial terms have been recognized", "standardized_terms": []}
 
-            # 标准化每个实体
+            # 批量标准化所有实体（开启重排序时先召回 N 个候选）
+            words = [entity['word'] for entity in entities]
+            batch_results = financial_std_service.batch_standardize(
+                words, n_results=rerank.candidates if rerank.enabled else 5
+            )
+            batch_results = [batch_results[word] for word in words]
+            rerank_info = None
+            if rerank.enabled:
+                batch_results, rerank_info = get_reranker(rerank.model).rerank(
+                    words, batch_results, "standardTerm", rerank.topK, rerank.budgetMs, started_at
+                )
             standardized_results = []
-            for entity in entities:
-                std_result = financial_std_service.search_similar_terms(entity['word'])
+            for entity, std_result in zip(entities, batch_results):
                 standardized_results.append({
                     "original_term": entity['word'],
                     "entity_group": entity['entity_group'],
@@ -239,7 +376,10 @@ async def standardization(input: TextInput):
                 provider=input.embeddingOptions.provider,
                 model=input.embeddingOptions.model,
                 db_path=f"db/{input.embeddingOptions.dbName}.db",
-                collection_name=input.embeddingOptions.collectionName
+                collection_name=input.embeddingOptions.collectionName,
+                vector_store=input.embeddingOptions.vectorStore,
+                artifact_path=input.embeddingOptions.artifactPath,
+                search_mode=input.embeddingOptions.searchMode
             )
 
             # 获取识别到的实体
@@ -247,21 +387,36 @@ async def standardization(input: TextInput):
             if not entities:
                 return {"message": "No medical terms have been recognized", "standardized_terms": []}
 
-            # 标准化每个实体
+            # 批量标准化所有实体，按实体类型路由到对应领域
+            batch_results = standardization_service.standardize_entities(
+                entities,
+                limit=rerank.candidates if rerank.enabled else 5,
+                route_by_entity_type=input.embeddingOptions.routeByEntityType
+            )
+            rerank_info = None
+            if rerank.enabled:
+                batch_results, rerank_info = get_reranker(rerank.model).rerank(
+                    [entity['word'] for entity in entities], batch_results, "concept_name",
+                    rerank.topK, rerank.budgetMs, started_at
+                )
             standardized_results = []
-            for entity in entities:
-                std_result = standardization_service.search_similar_terms(entity['word'])
+            for entity, std_result in zip(entities, batch_results):
                 standardized_results.append({
                     "original_term": entity['word'],
                     "entity_group": entity['entity_group'],
                     "standardized_results": std_result
                 })
 
-        return {
+        response = {
             "message": f"{len(entities)} medical terms have been recognized and standardized",
             "standardized_terms": standardized_results
         }
+        if rerank_info is not None:
+            response["rerank"] = rerank_info
+        return response
 
+    except ProviderUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Error in standardization processing: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -297,48 +452,118 @@ async def ner(input: TextInput):
 
 # API 端点：拼写纠正
 @app.post("/api/corr")
-async def correct_notes(input: CorrInput):
+async def correct_notes(input: CorrInput, request: Request):
+    if input.method == "add_mistakes":  # 添加错误（测试用，不调用 LLM）
+        return corr_service.add_mistakes(input.text, input.errorOptions.model_dump())
+    if input.method == "correct_spelling_prefiltered" and not (await asyncio.to_thread(get_spell_checker)).auto_correct:
+        # 没有通用英文词表时几乎每个句子都要调用 LLM，比整篇单次纠正更慢
+        raise HTTPException(status_code=400, detail=PREFILTER_UNAVAILABLE)
+
+    # 按 (provider, model) 准入，并发纠正的请求按其 LLM 并发数占用容量
+    queue = get_model_queue(input.llmOptions)
+    concurrency = min(input.chunkOptions.maxConcurrency, queue.max_concurrency)
+    weight = 1 if input.method == "correct_spelling" else concurrency
+    async with queue.slot(_request_priority(request), weight):
+        return await _correct_notes(input, concurrency)
+
+async def _correct_notes(input: CorrInput, concurrency: int):
     try:
         if input.method == "correct_spelling":  # 拼写纠正
-            return corr_service.correct_spelling(input.text, input.llmOptions)
-        elif input.method == "add_mistakes":  # 添加错误（测试用）
-            return corr_service.add_mistakes(input.text, input.errorOptions)
+            return await asyncio.to_thread(corr_service.correct_spelling, input.text, input.llmOptions)
+        elif input.method == "correct_spelling_chunked":  # 分块并发纠正（长病历）
+            return await corr_service.correct_spelling_chunked(
+                input.text,
+                input.llmOptions,
+                max_concurrency=concurrency,
+                max_chunk_chars=input.chunkOptions.maxChunkChars
+            )
+        elif input.method == "correct_spelling_prefiltered":  # 本地拼写检查，剩余句子交给 LLM
+            return await corr_service.correct_spelling_prefiltered(
+                input.text,
+                input.llmOptions,
+                max_concurrency=concurrency
+            )
         else:
             raise HTTPException(status_code=400, detail="Invalid method")
+    except ProviderUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Error in correction processing: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # API 端点：缩写扩展
 @app.post("/api/abbr")
-async def expand_abbreviations(input: AbbrInput):
+async def expand_abbreviations(input: AbbrInput, request: Request):
+    priority = _request_priority(request)
+    return await coalesce("abbr", input, lambda: _admit_abbreviations(input, priority))
+
+async def _admit_abbreviations(input: AbbrInput, priority: str):
+    # 按 (provider, model) 准入，文档模式按其 LLM 并发数占用容量
+    queue = get_model_queue(input.llmOptions)
+    concurrency = min(input.llmConcurrency, queue.max_concurrency)
+    async with queue.slot(priority, concurrency if input.method == "document" else 1):
+        return await _expand_abbreviations(input, concurrency)
+
+async def _expand_abbreviations(input: AbbrInput, concurrency: int):
     try:
         if input.method == "simple_ollama":  # 简单扩展
-            output = abbr_service.simple_ollama_expansion(input.text, input.llmOptions)
+            output = await asyncio.to_thread(abbr_service.simple_ollama_expansion, input.text, input.llmOptions)
+            return {"input": input.text, "output": output}
+        elif input.method == "simple_ollama_pruned":  # 简单扩展，只把缩写和少量上下文交给 LLM
+            output = await asyncio.to_thread(abbr_service.pruned_ollama_expansion, input.text, input.llmOptions)
             return {"input": input.text, "output": output}
         elif input.method == "query_db_llm_rerank":  # 数据库查询+重排序
-            return abbr_service.query_db_llm_rerank(
+            return await asyncio.to_thread(
+                abbr_service.query_db_llm_rerank,
                 input.text, 
                 input.context, 
                 input.llmOptions,
-                input.embeddingOptions
+                input.embeddingOptions.model_dump(),
+                input.rerankOptions.model_dump()
             )
         elif input.method == "llm_rank_query_db":  # LLM扩展+数据库标准化
-            return abbr_service.llm_rank_query_db(
+            return await asyncio.to_thread(
+                abbr_service.llm_rank_query_db,
                 input.text, 
                 input.context, 
                 input.llmOptions,
-                input.embeddingOptions
+                input.embeddingOptions.model_dump(),
+                input.rerankOptions.model_dump()
+            )
+        elif input.method == "llm_rank_query_db_pipelined":  # LLM扩展与推测检索并发执行
+            return await abbr_service.llm_rank_query_db_pipelined(
+                input.text,
+                input.context,
+                input.llmOptions,
+                input.embeddingOptions.model_dump(),
+                input.rerankOptions.model_dump()
+            )
+        elif input.method == "document":  # 整篇病历的缩写展开+标准化
+            return await abbr_service.expand_document(
+                input.text,
+                input.llmOptions,
+                input.embeddingOptions.model_dump(),
+                max_concurrency=concurrency
             )
         else:
             raise HTTPException(status_code=400, detail="Invalid method")
+    except ProviderUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Error in abbreviation expansion: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # API 端点：医疗文本生成
 @app.post("/api/gen")
-async def generate_medical_content(input: GenInput):
+async def generate_medical_content(input: GenInput, request: Request):
+    priority = _request_priority(request)
+    return await coalesce("gen", input, lambda: _admit_generation(input, priority))
+
+async def _admit_generation(input: GenInput, priority: str):
+    async with get_model_queue(input.llmOptions).slot(priority):
+        return await asyncio.to_thread(_generate_medical_content, input)
+
+def _generate_medical_content(input: GenInput):
     try:
         if input.method == "generate_medical_note":  # 生成病历
             return gen_service.generate_medical_note(
@@ -361,10 +586,28 @@ async def generate_medical_content(input: GenInput):
             )
         else:
             raise HTTPException(status_code=400, detail="Invalid method")
+    except ProviderUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Error in medical content generation: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# API 端点：运行指标
+@app.get("/api/metrics")
+async def metrics():
+    return {
+        # 各端点实际执行的计算数、被合并到进行中计算的请求数
+        "single_flight": single_flight_metrics(),
+        # 各 (provider, model) 的容量占用、排队深度、等待耗时和拒绝数
+        "admission": admission_metrics(),
+        # 多后端 Ollama：各后端的健康状况、进行中请求数、耗时，以及对冲次数
+        "llm_pool": llm_pool_metrics(),
+        # 各模型提供方（llm:* / embedding:*）的熔断器状态、失败和超时次数
+        "circuit_breakers": breaker_metrics(),
+        # NER 句子缓存的条目数和命中率
+        "ner_cache": ner_cache_metrics()
+    }
+
 # 启动服务器
 if __name__ == "__main__":
     import uvicorn
@@ -1,24 +1,46 @@
-from langchain_community.llms import Ollama
 from langchain.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
-from typing import Dict
+from typing import Dict, List, Optional
 from services.std_service import StdService
+from utils.reranker import DEFAULT_RERANK_MODEL, get_reranker
+from utils.lexical_index import rrf_fuse
+from utils.abbreviation_dictionary import (
+    get_abbreviation_dictionary, normalize_abbreviation, inline_case
+)
+from utils.llm_pool import get_ollama_llm
+from utils.resilience import ProviderUnavailable, guarded_llm
+import asyncio
 import os
+import re
+import time
 import logging
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 文档模式下交给 LLM 的上下文：缩写首次出现位置前后的字符数
+DOCUMENT_CONTEXT_CHARS = 100
+# 裁剪模式下每个缩写的上下文字符数，以及单次 LLM 调用的提示预算（按 4 个字符约 1 个 token 估算）
+PRUNED_CONTEXT_CHARS = 40
+PRUNED_TOKEN_BUDGET = 1024
+_PRUNED_ANSWER_RE = re.compile(r"^\s*(\d+)\s*[.):]\s*(.*)$")
+
 class AbbrService:
     """
     医学术语缩写扩展服务
-    提供两种方法来扩展医疗文本中的缩写：
-    1. 简单 LLM 扩展：快速但不保证准确性
-    2. LLM 生成 + 数据库查询：更准确但较慢
+    /api/abbr 按 method 分派到以下方法来扩展医疗文本中的缩写：
+    1. simple_ollama（simple_ollama_expansion）：简单 LLM 扩展，快速但不保证准确性
+    2. simple_ollama_pruned（pruned_ollama_expansion）：只把缩写和少量上下文交给 LLM，按偏移把扩展拼回原文
+    3. query_db_llm_rerank：数据库召回 + 重排序，交叉编码器（或 LLM）对候选术语重新排序
+    4. llm_rank_query_db：LLM 生成扩展 + 数据库查询，更准确但较慢
+    5. llm_rank_query_db_pipelined：与 4 相同，LLM 生成扩展的同时并发执行推测检索
+    6. document（expand_document）：一次处理整篇病历中的全部缩写并标准化
+
+    无歧义的常见缩写先由离线挖掘的缩写词典在本地展开，只有有歧义或未知的缩写才调用 LLM
     """
     def __init__(self):
-        self.std_service = None  # 按需初始化标准化服务
+        self.abbreviations = get_abbreviation_dictionary()  # 缩写词典
         
     def _get_std_service(self, embedding_options: dict) -> StdService:
         """
@@ -30,6 +52,9 @@ class AbbrService:
                 - model: 模型名称
                 - dbName: 数据库名称
                 - collectionName: 集合名称
+                - vectorStore: 检索后端
+                - artifactPath: numpy 后端可选的向量产物目录
+                - searchMode: 检索模式 (dense/hybrid)
             
         Returns:
             配置好的标准化服务实例
@@ -42,7 +67,10 @@ class AbbrService:
                 provider=embedding_options.get("provider", "huggingface"),
                 model=embedding_options.get("model", "BAAI/bge-m3"),
                 db_path=f"db/{embedding_options.get('dbName', 'snomed_bge_m3')}.db",
-                collection_name=embedding_options.get("collectionName", "concepts_only_name")
+                collection_name=embedding_options.get("collectionName", "concepts_only_name"),
+                vector_store=embedding_options.get("vectorStore", "default"),
+                artifact_path=embedding_options.get("artifactPath"),
+                search_mode=embedding_options.get("searchMode", "dense")
             )
         except Exception as e:
             logger.error(f"Failed to initialize StdService: {str(e)}")
@@ -58,7 +86,7 @@ class AbbrService:
                 - model: 模型名称
             
         Returns:
-            配置好的语言模型实例
+            配置好的语言模型实例（超时或熔断时抛出 ProviderUnavailable）
             
         Raises:
             ValueError: 当提供不支持的模型提供商时
@@ -67,20 +95,25 @@ class AbbrService:
         model = llm_options.get("model", "llama3.1:8b")
         
         if provider == "ollama":
-            return Ollama(model=model)
+            llm = get_ollama_llm(model)
         elif provider == "openai":
-            return ChatOpenAI(
+            llm = ChatOpenAI(
                 model=model,
                 temperature=0,
                 api_key=os.getenv("OPENAI_API_KEY")
             )
         else:
             raise ValueError(f"Unsupported LLM provider: {provider}")
+        # 每次调用带截止时间，按提供方熔断
+        return guarded_llm(llm, provider)
         
     def simple_ollama_expansion(self, text: str, llm_options: dict) -> Dict:
         """
         使用简单的 LLM 方法扩展缩写（快速但不保证准确性）
         
+        先用缩写词典在本地展开无歧义的缩写；文本中没有有歧义或未知的缩写时不调用 LLM，
+        否则把已在本地展开的文本交给 LLM 处理剩余缩写
+        
         Args:
             text: 包含缩写的输入文本
             llm_options: 语言模型配置选项
@@ -90,9 +123,23 @@ class AbbrService:
             {
                 "input": 原始文本,
                 "expanded_text": 扩展后的文本,
-                "method": "simple_llm"
+                "method": "dictionary"（全部本地展开）或 "simple_llm",
+                "dictionary_expansions": 本地展开的缩写（偏移相对于原始文本）,
+                "llm_abbreviations": 交给 LLM 的缩写（有歧义或未知）,
+                "degraded": LLM 超时或熔断时的原因（此时只返回词典展开的结果）
             }
         """
+        local = self.abbreviations.expand(text)
+        response = {
+            "input": text,
+            "expanded_text": local["text"],
+            "method": "dictionary",
+            "dictionary_expansions": local["resolved"],
+            "llm_abbreviations": local["unresolved"]
+        }
+        if not local["unresolved"]:
+            return response
+        
         llm = self._get_llm(llm_options)
         
         prompt = ChatPromptTemplate.from_messages([
@@ -104,18 +151,275 @@ class AbbrService:
         ])
         
         chain = prompt | llm
-        result = chain.invoke({"input": text})
+        try:
+            result = chain.invoke({"input": local["text"]})
+        except ProviderUnavailable as e:
+            # LLM 不可用：退化为只用词典展开
+            logger.warning(f"{e}; returning dictionary expansion only")
+            response["degraded"] = e.reason
+            return response
         
         # 处理可能的AIMessage对象
-        expanded_text = result.content if hasattr(result, 'content') else str(result)
+        response["expanded_text"] = result.content if hasattr(result, 'content') else str(result)
+        response["method"] = "simple_llm"
+        return response
+
+    @staticmethod
+    def _pruned_prompt() -> ChatPromptTemplate:
+        """裁剪模式的提示：编号的缩写 + 上下文片段，每行返回一个扩展"""
+        return ChatPromptTemplate.from_messages([
+            ("system", "Each numbered line contains a medical abbreviation followed by a short excerpt of the clinical note "
+                       "where it appears, with the abbreviation marked as [[ABBR]]. Known senses may be listed in parentheses."),
+            ("system", "For each line, reply with exactly one line: <number>. <expansion of the abbreviation in this context>. "
+                       "Reply <number>. NONE if the token is not an abbreviation. Do NOT include any other text."),
+            ("human", "{items}"),
+        ])
+
+    @staticmethod
+    def _pruned_item(text: str, item: Dict, context_chars: int) -> str:
+        """单个缩写的提示行：首次出现位置前后 context_chars 个字符（截到空白处），缩写用 [[ ]] 标出"""
+        start, end = item["start"], item["end"]
+        left = text[max(0, start - context_chars):start]
+        right = text[end:end + context_chars]
+        if start - context_chars > 0 and " " in left:
+            left = left[left.index(" ") + 1:]
+        if end + context_chars < len(text) and " " in right:
+            right = right[:right.rindex(" ")]
+        excerpt = " ".join(f"{left}[[{item['abbreviation']}]]{right}".split())
+        candidates = f" (known senses: {'; '.join(item['candidates'])})" if item.get("candidates") else ""
+        return f"{item['abbreviation']} | {excerpt}{candidates}"
+
+    def pruned_ollama_expansion(self, text: str, llm_options: dict, context_chars: int = PRUNED_CONTEXT_CHARS,
+                                token_budget: int = PRUNED_TOKEN_BUDGET) -> Dict:
+        """
+        裁剪模式的简单扩展：只把缩写交给 LLM，而不是让 LLM 复述整篇病历
+
+        无歧义的已知缩写由词典本地展开；其余缩写按规范形式去重，每个只带首次出现处前后少量上下文，
+        编号后放进提示（超过 token_budget 时分成多次调用），LLM 每行返回一个扩展，
+        最后按原文偏移把全部扩展拼回原文。生成的 token 数与缩写数量成正比，与病历长度无关
+
+        Args:
+            text: 包含缩写的输入文本
+            llm_options: 语言模型配置选项
+            context_chars: 每个缩写前后的上下文字符数
+            token_budget: 单次调用的提示 token 预算（估算）
+
+        Returns:
+            {
+                "input": 原始文本,
+                "expanded_text": 扩展后的文本,
+                "method": "dictionary"（全部本地展开）或 "pruned_llm",
+                "dictionary_expansions": 本地展开的缩写（偏移相对于原始文本）,
+                "llm_abbreviations": 交给 LLM 的缩写，每处额外包含 expansion 和 expansion_source
+                                     （llm / dictionary_fallback，LLM 未给出扩展时 expansion 为 None）,
+                "llm_calls": LLM 调用次数,
+                "prompt_chars": 交给 LLM 的缩写提示总字符数（对比整篇复述时的 len(input)）,
+                "degraded": LLM 超时或熔断的原因（此时有歧义的缩写使用词典中最常见的含义）
+            }
+        """
+        local = self.abbreviations.expand(text)
+        response = {
+            "input": text,
+            "expanded_text": local["text"],
+            "method": "dictionary",
+            "dictionary_expansions": local["resolved"],
+            "llm_abbreviations": local["unresolved"],
+            "llm_calls": 0,
+            "prompt_chars": 0
+        }
+        if not local["unresolved"]:
+            return response
+
+        # 相同缩写（S.O.B. / SOB）只问一次，以首次出现处为上下文
+        first_seen: Dict[str, Dict] = {}
+        for item in local["unresolved"]:
+            first_seen.setdefault(normalize_abbreviation(item["abbreviation"]), item)
+        keys = list(first_seen)
+        lines = [self._pruned_item(text, first_seen[key], context_chars) for key in keys]
+
+        # 按预算分批，每批重新从 1 编号
+        batches, batch, batch_chars = [], [], 0
+        for index, line in enumerate(lines):
+            if batch and (batch_chars + len(line)) / 4 > token_budget:
+                batches.append(batch)
+                batch, batch_chars = [], 0
+            batch.append(index)
+            batch_chars += len(line) + 1
+        batches.append(batch)
+
+        chain = self._pruned_prompt() | self._get_llm(llm_options)
+        expansions: Dict[str, Optional[str]] = {}
+        sources: Dict[str, str] = {}
+        for batch in batches:
+            items = "\n".join(f"{n + 1}. {lines[index]}" for n, index in enumerate(batch))
+            response["prompt_chars"] += len(items)
+            try:
+                result = chain.invoke({"items": items})
+            except ProviderUnavailable as e:
+                # LLM 不可用：有歧义的缩写使用词典中最常见的含义，未知缩写保持原样
+                logger.warning(f"{e}; using dictionary senses for remaining abbreviations")
+                response["degraded"] = e.reason
+                for index in batch:
+                    key = keys[index]
+                    expansions[key] = self._fallback_expansion(self.abbreviations.lookup(key))
+                    sources[key] = "dictionary_fallback"
+                continue
+            response["llm_calls"] += 1
+            output = result.content if hasattr(result, 'content') else str(result)
+            for line in output.strip().splitlines():
+                match = _PRUNED_ANSWER_RE.match(line)
+                if not match or not 1 <= int(match.group(1)) <= len(batch):
+                    continue
+                key = keys[batch[int(match.group(1)) - 1]]
+                expansion = match.group(2).strip().strip('"\'`').rstrip(".").strip()
+                if expansion and expansion.upper() != "NONE" and normalize_abbreviation(expansion) != key:
+                    expansions.setdefault(key, expansion)
+                    sources[key] = "llm"
+
+        # 按偏移把词典扩展和 LLM 扩展一起拼回原文（从后往前替换，保持前面的偏移不变）
+        replacements = [(item["start"], item["end"], item["expansion"]) for item in local["resolved"]]
+        for item in local["unresolved"]:
+            key = normalize_abbreviation(item["abbreviation"])
+            item["expansion"] = expansions.get(key)
+            item["expansion_source"] = sources.get(key)
+            if item["expansion"]:
+                replacements.append((item["start"], item["end"], item["expansion"]))
+        expanded = text
+        for start, end, expansion in sorted(replacements, reverse=True):
+            expanded = expanded[:start] + inline_case(expansion) + expanded[end:]
+
+        response.update(expanded_text=expanded, method="pruned_llm")
+        return response
+
+    def _rerank_candidates(self, query: str, candidates: List[Dict], rerank_options: Dict,
+                           started_at: float) -> tuple:
+        """使用交叉编码器对单个查询的候选术语重排序"""
+        reranker = get_reranker(rerank_options.get("model", DEFAULT_RERANK_MODEL))
+        results, info = reranker.rerank(
+            [query], [candidates], "concept_name",
+            top_k=rerank_options.get("topK", 5),
+            budget_ms=rerank_options.get("budgetMs"),
+            started_at=started_at
+        )
+        return results[0], info
+
+    def _llm_rerank_candidates(self, text: str, context: str, candidates: List[Dict],
+                               llm_options: dict, top_k: int) -> List[Dict]:
+        """让 LLM 按与缩写的匹配程度对候选术语排序（未开启交叉编码器时使用）"""
+        if not candidates:
+            return []
+        llm = self._get_llm(llm_options)
+        numbered = "\n".join(f"{i + 1}. {c.get('concept_name')}" for i, c in enumerate(candidates))
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", "Given a medical abbreviation, its context and a numbered list of candidate terms, "
+                       "rank the candidates by how likely they are the meaning of the abbreviation."),
+            ("system", "Return ONLY the candidate numbers, most likely first, separated by commas."),
+            ("human", "Abbreviation: {text}\nContext: {context}\nCandidates:\n{candidates}")
+        ])
+        chain = prompt | llm
+        result = chain.invoke({"text": text, "context": context, "candidates": numbered})
+        ranking_text = result.content if hasattr(result, 'content') else str(result)
+
+        # 解析编号，未提及的候选保持原有顺序排在后面
+        order = []
+        for number in re.findall(r"\d+", ranking_text):
+            index = int(number) - 1
+            if 0 <= index < len(candidates) and index not in order:
+                order.append(index)
+        order += [i for i in range(len(candidates)) if i not in order]
+        return [candidates[i] for i in order[:top_k]]
+
+    def query_db_llm_rerank(self, text: str, context: str, llm_options: dict, embedding_options: dict,
+                            rerank_options: Optional[dict] = None) -> Dict:
+        """
+        先从数据库召回候选术语，再对候选重排序
+
+        开启 rerank_options.enabled 时使用交叉编码器批量打分（毫秒级），否则由 LLM 排序（秒级）
         
+        Args:
+            text: 需要扩展的缩写
+            context: 缩写出现的上下文
+            llm_options: 语言模型配置选项
+            embedding_options: 嵌入模型配置选项
+            rerank_options: 重排序选项（enabled / model / candidates / topK / budgetMs）
+            
+        Returns:
+            包含重排序后候选术语的字典：
+            {
+                "input": 原始缩写,
+                "context": 上下文,
+                "standardized_terms": 重排序后的标准化术语列表,
+                "reranker": cross_encoder / llm / none（LLM 超时或熔断，保持检索顺序）,
+                "rerank": 交叉编码器重排序信息（仅 cross_encoder）,
+                "degraded": LLM 超时或熔断的原因（仅 reranker 为 none 时）,
+                "method": "query_db_llm_rerank"
+            }
+            
+        Raises:
+            ValueError: 当标准化服务初始化失败或处理失败时
+        """
+        started_at = time.perf_counter()
+        rerank_options = rerank_options or {}
+        top_k = rerank_options.get("topK", 5)
+        try:
+            std_service = self._get_std_service(embedding_options)
+            
+            # 缩写本身信息太少，召回和打分都带上上下文
+            query = f"{text} ({context})" if context else text
+            candidates = std_service.search_similar_terms(query, limit=rerank_options.get("candidates", 20))
+            
+            response = {"input": text, "context": context, "method": "query_db_llm_rerank"}
+            if rerank_options.get("enabled"):
+                std_terms, info = self._rerank_candidates(query, candidates, rerank_options, started_at)
+                response.update(standardized_terms=std_terms, reranker="cross_encoder", rerank=info)
+            else:
+                try:
+                    std_terms = self._llm_rerank_candidates(text, context, candidates, llm_options, top_k)
+                    response.update(standardized_terms=std_terms, reranker="llm")
+                except ProviderUnavailable as e:
+                    logger.warning(f"{e}; keeping retrieval order")
+                    response.update(standardized_terms=candidates[:top_k], reranker="none", degraded=e.reason)
+            return response
+        except ProviderUnavailable:
+            raise
+        except Exception as e:
+            logger.error(f"Error in query_db_llm_rerank: {str(e)}")
+            raise ValueError(f"Failed to process abbreviation expansion: {str(e)}")
+
+    @staticmethod
+    def _expansion_prompt(entry=None, document_mode: bool = False) -> ChatPromptTemplate:
+        """
+        单个缩写的 LLM 扩展提示
+
+        Args:
+            entry: 词典条目，有候选扩展时提示 LLM 优先从中选择
+            document_mode: 文档模式下只返回扩展本身，不是缩写时返回 NONE
+        """
+        messages = [
+            ("system", "Given the medical abbreviation and its context, provide the most likely expansion based on common medical usage."),
+        ]
+        if entry is not None and entry.expansions:
+            messages.append(("system", "Choose among these known expansions when one fits the context: {candidates}"))
+        if document_mode:
+            messages.append(("system", "Return ONLY the expansion, without explanation. If the token is not an abbreviation, return NONE."))
+        messages.append(("human", "Abbreviation: {text}\nContext: {context}"))
+        return ChatPromptTemplate.from_messages(messages)
+
+    @staticmethod
+    def _fallback_expansion(entry) -> Optional[str]:
+        """LLM 超时或熔断时的扩展：词典中最常见的含义，词典中没有时为 None"""
+        return entry.best["expansion"] if entry is not None and entry.expansions else None
+
+    @staticmethod
+    def _expansion_inputs(text: str, context: str, entry=None) -> Dict:
         return {
-            "input": text,
-            "expanded_text": expanded_text,
-            "method": "simple_llm"
+            "text": text,
+            "context": context,
+            "candidates": "; ".join(e["expansion"] for e in entry.expansions) if entry else ""
         }
 
-    def llm_rank_query_db(self, text: str, context: str, llm_options: dict, embedding_options: dict) -> Dict:
+    def llm_rank_query_db(self, text: str, context: str, llm_options: dict, embedding_options: dict,
+                          rerank_options: Optional[dict] = None) -> Dict:
         """
         先使用 LLM 生成扩展，然后在数据库中查找标准化术语（更准确但较慢）
         
@@ -124,47 +428,347 @@ class AbbrService:
             context: 缩写出现的上下文
             llm_options: 语言模型配置选项
             embedding_options: 嵌入模型配置选项
+            rerank_options: 重排序选项，开启时召回 N 个候选并用交叉编码器重排序
             
         Returns:
             包含扩展结果和标准化术语的字典：
             {
                 "input": 原始缩写,
                 "context": 上下文,
-                "expansion": LLM生成的扩展,
+                "expansion": 词典或 LLM 生成的扩展,
+                "expansion_source": dictionary / llm / dictionary_fallback（LLM 超时或熔断，
+                                    使用词典中最常见的含义，词典中没有时使用缩写本身）,
                 "standardized_terms": 标准化术语列表,
+                "rerank": 重排序信息（仅开启重排序时）,
+                "degraded": LLM 超时或熔断的原因（仅 dictionary_fallback）,
                 "method": "llm_db"
             }
             
         Raises:
             ValueError: 当标准化服务初始化失败时
         """
+        started_at = time.perf_counter()
+        rerank_options = rerank_options or {}
+        degraded = None
         try:
             # 获取标准化服务实例
-            self.std_service = self._get_std_service(embedding_options)
+            std_service = self._get_std_service(embedding_options)
             
-            # 使用 LLM 生成扩展
-            llm = self._get_llm(llm_options)
-            expand_prompt = ChatPromptTemplate.from_messages([
-                ("system", "Given the medical abbreviation and its context, provide the most likely expansion based on common medical usage."),
-                ("human", f"Abbreviation: {text}\nContext: {context}")
-            ])
+            entry = self.abbreviations.lookup(text)
+            if entry is not None and entry.expansions and not entry.ambiguous:
+                # 无歧义的已知缩写直接使用词典扩展
+                expansion_text = entry.best["expansion"]
+                expansion_source = "dictionary"
+            else:
+                # 使用 LLM 生成扩展，有歧义的缩写附上词典中的候选扩展
+                chain = self._expansion_prompt(entry) | self._get_llm(llm_options)
+                try:
+                    expansion_result = chain.invoke(self._expansion_inputs(text, context, entry))
+                    
+                    # 从 AIMessage 中提取实际的文本内容
+                    expansion_text = expansion_result.content if hasattr(expansion_result, 'content') else str(expansion_result)
+                    expansion_source = "llm"
+                except ProviderUnavailable as e:
+                    logger.warning(f"{e}; using dictionary expansion")
+                    expansion_text = self._fallback_expansion(entry) or text
+                    expansion_source, degraded = "dictionary_fallback", e.reason
             
-            chain = expand_prompt | llm
-            expansion_result = chain.invoke({})
-            
-            # 从 AIMessage 中提取实际的文本内容
-            expansion_text = expansion_result.content if hasattr(expansion_result, 'content') else str(expansion_result)
+            response = {
+                "input": text,
+                "context": context,
+                "expansion": expansion_text,
+                "expansion_source": expansion_source,
+                "method": "llm_db"
+            }
+            if degraded:
+                response["degraded"] = degraded
             
             # 在数据库中查找相似的标准术语
-            std_terms = self.std_service.search_similar_terms(expansion_text)
+            if rerank_options.get("enabled"):
+                candidates = std_service.search_similar_terms(
+                    expansion_text, limit=rerank_options.get("candidates", 20)
+                )
+                std_terms, response["rerank"] = self._rerank_candidates(
+                    expansion_text, candidates, rerank_options, started_at
+                )
+            else:
+                std_terms = std_service.search_similar_terms(expansion_text)
             
-            return {
+            response["standardized_terms"] = std_terms
+            return response
+        except ProviderUnavailable:
+            raise
+        except Exception as e:
+            logger.error(f"Error in llm_rank_query_db: {str(e)}")
+            raise ValueError(f"Failed to process abbreviation expansion: {str(e)}")
+
+    async def llm_rank_query_db_pipelined(self, text: str, context: str, llm_options: dict,
+                                          embedding_options: dict, rerank_options: Optional[dict] = None) -> Dict:
+        """
+        llm_rank_query_db 的流水线版本
+
+        LLM 生成扩展的同时，在线程中初始化标准化服务并用 "缩写 (上下文)" 做一次推测检索；
+        扩展返回后再检索扩展，两路候选按 RRF 合并（开启重排序时由交叉编码器对合并后的候选重新打分）。
+        无歧义的已知缩写不调用 LLM，推测检索只作为补充候选
+
+        Args:
+            text: 需要扩展的缩写
+            context: 缩写出现的上下文
+            llm_options: 语言模型配置选项
+            embedding_options: 嵌入模型配置选项
+            rerank_options: 重排序选项（enabled / model / candidates / topK / budgetMs）
+
+        Returns:
+            同 llm_rank_query_db，另含：
+            {
+                "timings": 各阶段耗时（毫秒）：std_service / speculative_search / llm / expansion_search /
+                           merge / rerank / total，sequential 为串行版本需要的耗时
+                           （std_service + llm + expansion_search + rerank）,
+                "speculative_hits": 结果中来自推测检索的候选数量,
+                "degraded": LLM 超时或熔断的原因（仅 expansion_source 为 dictionary_fallback 时）,
+                "method": "llm_db_pipelined"
+            }
+            standardized_terms 中每项额外包含 rrf_score 和 source（expansion / speculative / both）
+
+        Raises:
+            ValueError: 当标准化服务初始化失败或处理失败时
+        """
+        started_at = time.perf_counter()
+        rerank_options = rerank_options or {}
+        rerank_enabled = bool(rerank_options.get("enabled"))
+        top_k = rerank_options.get("topK", 5) if rerank_enabled else 5
+        depth = rerank_options.get("candidates", 20) if rerank_enabled else top_k
+        timings: Dict[str, float] = {}
+        degraded: Dict[str, str] = {}
+
+        def elapsed_ms(since: float) -> float:
+            return round((time.perf_counter() - since) * 1000, 2)
+
+        def speculative_search():
+            # 标准化服务初始化（加载嵌入模型、连接数据库）和推测检索都在线程中执行，不阻塞事件循环
+            t = time.perf_counter()
+            std_service = self._get_std_service(embedding_options)
+            timings["std_service"] = elapsed_ms(t)
+            t = time.perf_counter()
+            query = f"{text} ({context})" if context else text
+            hits = std_service.search_similar_terms(query, limit=depth)
+            timings["speculative_search"] = elapsed_ms(t)
+            return std_service, hits
+
+        async def expand():
+            entry = self.abbreviations.lookup(text)
+            if entry is not None and entry.expansions and not entry.ambiguous:
+                timings["llm"] = 0.0
+                return entry.best["expansion"], "dictionary"
+            t = time.perf_counter()
+            chain = self._expansion_prompt(entry) | self._get_llm(llm_options)
+            try:
+                result = await chain.ainvoke(self._expansion_inputs(text, context, entry))
+            except ProviderUnavailable as e:
+                logger.warning(f"{e}; using dictionary expansion")
+                timings["llm"] = elapsed_ms(t)
+                degraded["llm"] = e.reason
+                return self._fallback_expansion(entry) or text, "dictionary_fallback"
+            timings["llm"] = elapsed_ms(t)
+            return (result.content if hasattr(result, 'content') else str(result)), "llm"
+
+        try:
+            (std_service, speculative), (expansion_text, expansion_source) = await asyncio.gather(
+                asyncio.to_thread(speculative_search), expand()
+            )
+
+            t = time.perf_counter()
+            expanded = await asyncio.to_thread(std_service.search_similar_terms, expansion_text, depth)
+            timings["expansion_search"] = elapsed_ms(t)
+
+            # 两路候选按 RRF 合并，同一概念保留扩展检索的记录（distance 相对于扩展）
+            t = time.perf_counter()
+            by_id: Dict[str, Dict] = {}
+            for hit in expanded + speculative:
+                by_id.setdefault(str(hit["concept_id"]), hit)
+            expanded_ids = [str(hit["concept_id"]) for hit in expanded]
+            speculative_ids = [str(hit["concept_id"]) for hit in speculative]
+            merged = []
+            for concept_id, score in rrf_fuse([expanded_ids, speculative_ids]):
+                in_expanded, in_speculative = concept_id in expanded_ids, concept_id in speculative_ids
+                merged.append({
+                    **by_id[concept_id],
+                    "rrf_score": score,
+                    "source": "both" if in_expanded and in_speculative else ("expansion" if in_expanded else "speculative")
+                })
+            timings["merge"] = elapsed_ms(t)
+
+            response = {
                 "input": text,
                 "context": context,
                 "expansion": expansion_text,
-                "standardized_terms": std_terms,
-                "method": "llm_db"
+                "expansion_source": expansion_source,
+                "method": "llm_db_pipelined"
+            }
+            if degraded:
+                response["degraded"] = degraded["llm"]
+            if rerank_enabled:
+                t = time.perf_counter()
+                std_terms, response["rerank"] = self._rerank_candidates(
+                    expansion_text, merged, rerank_options, started_at
+                )
+                timings["rerank"] = elapsed_ms(t)
+            else:
+                std_terms = merged[:top_k]
+
+            timings["total"] = elapsed_ms(started_at)
+            timings["sequential"] = round(sum(
+                timings.get(stage, 0.0) for stage in ("std_service", "llm", "expansion_search", "rerank")
+            ), 2)
+            response.update(
+                standardized_terms=std_terms,
+                speculative_hits=sum(term["source"] != "expansion" for term in std_terms),
+                timings=timings
+            )
+            return response
+        except ProviderUnavailable:
+            raise
+        except Exception as e:
+            logger.error(f"Error in llm_rank_query_db_pipelined: {str(e)}")
+            raise ValueError(f"Failed to process abbreviation expansion: {str(e)}")
+
+    async def _resolve_with_llm(self, llm, semaphore: asyncio.Semaphore, abbreviation: str,
+                                context: str, entry) -> tuple:
+        """
+        在并发上限内让 LLM 给出单个缩写的扩展
+
+        Returns:
+            (扩展, 来源, 降级原因)：LLM 认为不是缩写时扩展为 None；LLM 超时或熔断时来源为 dictionary_fallback，
+            扩展取词典中最常见的含义（词典中没有时为 None），降级原因为超时或熔断，否则为 None
+        """
+        chain = self._expansion_prompt(entry, document_mode=True) | llm
+        try:
+            async with semaphore:
+                result = await chain.ainvoke(self._expansion_inputs(abbreviation, context, entry))
+        except ProviderUnavailable as e:
+            return self._fallback_expansion(entry), "dictionary_fallback", e.reason
+        text = result.content if hasattr(result, 'content') else str(result)
+
+        # 只取第一行，去掉引号和句末标点
+        lines = text.strip().splitlines()
+        expansion = lines[0].strip().strip('"\'`').rstrip(".").strip() if lines else ""
+        if not expansion or expansion.upper() == "NONE" or normalize_abbreviation(expansion) == abbreviation:
+            return None, "llm", None
+        return expansion, "llm", None
+
+    async def expand_document(self, text: str, llm_options: dict, embedding_options: dict,
+                              max_concurrency: int = 4, limit: int = 5) -> Dict:
+        """
+        文档模式：展开整篇病历中的全部缩写并标准化
+
+        检测文本中所有形如缩写的 token，相同缩写（S.O.B. / SOB）只解析一次：
+        无歧义的已知缩写由词典本地展开，其余缩写以首次出现处的上下文并发调用 LLM
+        （同时进行的调用不超过 max_concurrency），最后全部扩展一次批量向量检索完成标准化
+
+        Args:
+            text: 病历全文
+            llm_options: 语言模型配置选项
+            embedding_options: 嵌入模型配置选项
+            max_concurrency: LLM 并发调用上限
+            limit: 每个扩展返回的标准化术语数量
+
+        Returns:
+            {
+                "input": 原始文本,
+                "expanded_text": 全部缩写替换为扩展后的文本,
+                "abbreviations": 按出现顺序的每处缩写
+                    [{"abbreviation", "start", "end", "expansion", "expansion_source", "standardized_terms"}]，
+                    偏移相对于原始文本，未能展开的缩写 expansion 为 None,
+                "unique_abbreviations": 去重后的缩写数量,
+                "llm_calls": LLM 调用次数,
+                "degraded": LLM 超时或熔断的原因（有缩写改用词典，expansion_source 为 dictionary_fallback 时）,
+                "method": "document"
             }
+
+        Raises:
+            ValueError: 当标准化服务初始化失败或处理失败时
+        """
+        try:
+            occurrences = self.abbreviations.candidates(text)
+
+            # 相同缩写只保留首次出现位置作为上下文
+            first_seen: Dict[str, tuple] = {}
+            for start, end, token in occurrences:
+                first_seen.setdefault(normalize_abbreviation(token), (start, end, token))
+
+            expansions: Dict[str, Optional[str]] = {}
+            sources: Dict[str, str] = {}
+            degraded = None
+            llm_calls = 0
+            pending = []
+            for key, (start, end, token) in first_seen.items():
+                entry = self.abbreviations.lookup(key)
+                if entry is not None and entry.expansions and not entry.ambiguous:
+                    expansions[key] = entry.best["expansion"]
+                    sources[key] = "dictionary"
+                else:
+                    context = text[max(0, start - DOCUMENT_CONTEXT_CHARS):end + DOCUMENT_CONTEXT_CHARS]
+                    pending.append((key, context, entry))
+
+            # 其余缩写并发调用 LLM，整个请求共用一个 LLM 实例
+            if pending:
+                llm = self._get_llm(llm_options)
+                semaphore = asyncio.Semaphore(max(1, max_concurrency))
+                results = await asyncio.gather(*(
+                    self._resolve_with_llm(llm, semaphore, key, context, entry)
+                    for key, context, entry in pending
+                ))
+                for (key, _, _), (expansion, source, reason) in zip(pending, results):
+                    expansions[key] = expansion
+                    sources[key] = source
+                    degraded = degraded or reason
+                    # 超时或熔断后改用词典的缩写没有得到 LLM 的回答，不计入调用次数
+                    if source == "llm":
+                        llm_calls += 1
+
+            # 全部去重后的扩展一次批量检索
+            keys = [key for key in first_seen if expansions.get(key)]
+            std_terms: Dict[str, List[Dict]] = {}
+            if keys:
+                # 冷启动时加载嵌入模型、连接 Milvus，放到线程中执行，不阻塞事件循环
+                std_service = await asyncio.to_thread(self._get_std_service, embedding_options)
+                batch = await asyncio.to_thread(
+                    std_service.search_similar_terms_batch, [expansions[key] for key in keys], limit
+                )
+                std_terms = dict(zip(keys, batch))
+
+            spans = []
+            for start, end, token in occurrences:
+                key = normalize_abbreviation(token)
+                spans.append({
+                    "abbreviation": token,
+                    "start": start,
+                    "end": end,
+                    "expansion": expansions.get(key),
+                    "expansion_source": sources.get(key),
+                    "standardized_terms": std_terms.get(key, [])
+                })
+
+            # 从后往前替换，保持前面的偏移不变
+            expanded = text
+            for span in reversed(spans):
+                if span["expansion"]:
+                    expanded = expanded[:span["start"]] + inline_case(span["expansion"]) + expanded[span["end"]:]
+
+            response = {
+                "input": text,
+                "expanded_text": expanded,
+                "abbreviations": spans,
+                "unique_abbreviations": len(first_seen),
+                "llm_calls": llm_calls,
+                "method": "document"
+            }
+            if degraded:
+                logger.warning(f"LLM unavailable ({degraded}); used dictionary expansions in document mode")
+                response["degraded"] = degraded
+            return response
+        except ProviderUnavailable:
+            raise
         except Exception as e:
-            logger.error(f"Error in llm_rank_query_db: {str(e)}")
-            raise ValueError(f"Failed to process abbreviation expansion: {str(e)}") 
\ No newline at end of file
+            logger.error(f"Error in expand_document: {str(e)}")
+            raise ValueError(f"Failed to process document abbreviation expansion: {str(e)}")
@@ -1,18 +1,29 @@
-from langchain_community.llms import Ollama
 from langchain.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
-from typing import Dict
+from typing import Dict, List
+from utils.text_chunking import count_placeholders, needs_correction, reassemble, split_into_chunks
+from utils.spell_checker import get_spell_checker
+from utils.error_generator import ErrorGenerator
+from utils.llm_pool import get_ollama_llm
+from utils.resilience import ProviderUnavailable, guarded_llm
+import asyncio
 import os
+import time
 import logging
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 词表中没有通用英文词时预过滤不可用（见 tools/build_spell_vocabulary.py --english）
+PREFILTER_UNAVAILABLE = ("correct_spelling_prefiltered requires a spell vocabulary built with a general English "
+                         "lexicon (tools/build_spell_vocabulary.py --english ...)")
+
 class CorrService:
     """
     医疗文本拼写纠正服务
-    提供拼写错误纠正功能
+    提供拼写错误纠正功能，长病历可按段落 / 句子分块并发纠正，
+    也可先由本地拼写检查器纠正无歧义的错误，只把剩余的句子交给 LLM
     """
     def __init__(self):
         pass
@@ -25,7 +36,7 @@ class CorrService:
             llm_options: 语言模型配置选项
             
         Returns:
-            配置好的语言模型实例
+            配置好的语言模型实例（超时或熔断时抛出 ProviderUnavailable）
             
         Raises:
             ValueError: 当提供不支持的模型提供商时
@@ -34,16 +45,60 @@ class CorrService:
         model = llm_options.get("model", "llama3.1:8b")
         
         if provider == "ollama":
-            return Ollama(model=model)
+            llm = get_ollama_llm(model)
         elif provider == "openai":
-            return ChatOpenAI(
+            llm = ChatOpenAI(
                 model=model,
                 temperature=0,
                 api_key=os.getenv("OPENAI_API_KEY")
             )
         else:
             raise ValueError(f"Unsupported LLM provider: {provider}")
+        # 每次调用带截止时间，按提供方熔断
+        return guarded_llm(llm, provider)
+        
+    @staticmethod
+    def _correction_prompt() -> ChatPromptTemplate:
+        """拼写纠正提示（整篇与分块纠正共用）"""
+        return ChatPromptTemplate.from_messages([
+            ("system", "Your job is to return the input with ALL spelling errors corrected. DO NOT expand any abbreviations."),
+            ("system", "Input consist of clinical notes. Keep all occurrences of ___ in the output."),
+            ("system", "Do NOT include supplementary messages like -> Here is the corrected input. Return the corrected input only."),
+            ("human", "{input}"),
+        ])
+
+    def add_mistakes(self, text: str, error_options: dict) -> Dict:
+        """
+        按键盘相邻关系给文本加入拼写错误（用于测试纠正效果）
         
+        Args:
+            text: 原始文本
+            error_options: 错误生成选项，包含：
+                - probability: 每个单词被加错的概率
+                - maxErrors: 最多的错误数
+                - keyboard: 键盘布局 (qwerty/azerty)
+                - seed: 随机种子，提供时结果可复现
+            
+        Returns:
+            {
+                "input": 原始文本,
+                "text_with_mistakes": 加错后的文本,
+                "mistakes": [{"type", "start", "end", "original", "corrupted"}]，偏移相对于原始文本
+            }
+        """
+        generator = ErrorGenerator(
+            probability=error_options.get("probability", 0.3),
+            max_errors=error_options.get("maxErrors", 5),
+            keyboard=error_options.get("keyboard", "qwerty"),
+            seed=error_options.get("seed")
+        )
+        result = generator.corrupt(text)
+        return {
+            "input": text,
+            "text_with_mistakes": result.text,
+            "mistakes": result.edits
+        }
+
     def correct_spelling(self, text: str, llm_options: dict) -> Dict:
         """
         使用语言模型纠正文本中的拼写错误
@@ -53,19 +108,16 @@ class CorrService:
             llm_options: 语言模型配置选项
             
         Returns:
-            包含原始文本和纠正后文本的字典
+            包含原始文本和纠正后文本的字典；LLM 超时或熔断时原样返回输入，并带 degraded（原因）
         """
         llm = self._get_llm(llm_options)
         
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "Your job is to return the input with ALL spelling errors corrected. DO NOT expand any abbreviations."),
-            ("system", "Input consist of clinical notes. Keep all occurrences of ___ in the output."),
-            ("system", "Do NOT include supplementary messages like -> Here is the corrected input. Return the corrected input only."),
-            ("human", "{input}"),
-        ])
-        
-        chain = prompt | llm
-        result = chain.invoke({"input": text})
+        chain = self._correction_prompt() | llm
+        try:
+            result = chain.invoke({"input": text})
+        except ProviderUnavailable as e:
+            logger.warning(f"{e}; returning input uncorrected")
+            return {"input": text, "corrected_text": text, "degraded": e.reason}
         
         # 处理可能的AIMessage对象
         corrected_text = result.content if hasattr(result, 'content') else str(result)
@@ -74,3 +126,197 @@ class CorrService:
             "input": text,
             "corrected_text": corrected_text
         }
+
+    async def _correct_texts(self, texts: List[str], llm_options: dict, max_concurrency: int) -> Dict:
+        """
+        并发调用 LLM 纠正多段文本，内容相同的文本（如重复的模板段落）只提交一次
+
+        Returns:
+            {原文: (纠正结果, 耗时毫秒, 降级原因)}；输出为空或丢失 ___ 占位符时纠正结果为 None，
+            LLM 超时或熔断时纠正结果为 None、降级原因为 deadline_exceeded / circuit_open，其余情况为 None
+        """
+        unique = list(dict.fromkeys(texts))
+        if not unique:
+            return {}
+        chain = self._correction_prompt() | self._get_llm(llm_options)
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        
+        async def correct(original: str):
+            async with semaphore:
+                t = time.perf_counter()
+                try:
+                    result = await chain.ainvoke({"input": original})
+                except ProviderUnavailable as e:
+                    return None, round((time.perf_counter() - t) * 1000, 2), e.reason
+                elapsed_ms = round((time.perf_counter() - t) * 1000, 2)
+            corrected = (result.content if hasattr(result, 'content') else str(result)).strip()
+            if not corrected or count_placeholders(corrected) != count_placeholders(original):
+                return None, elapsed_ms, None
+            return corrected, elapsed_ms, None
+        
+        return dict(zip(unique, await asyncio.gather(*(correct(original) for original in unique))))
+
+    async def correct_spelling_chunked(self, text: str, llm_options: dict, max_concurrency: int = 4,
+                                       max_chunk_chars: int = 600) -> Dict:
+        """
+        分块并发纠正长病历
+
+        按段落 / 句子边界切分病历，各分块并发调用 LLM（同时进行的调用不超过 max_concurrency），
+        只有数字、占位符或缩写的分块不调用 LLM，内容相同的分块只纠正一次
+
+        Args:
+            text: 需要纠正的文本
+            llm_options: 语言模型配置选项
+            max_concurrency: LLM 并发调用上限
+            max_chunk_chars: 分块的最大字符数
+
+        Returns:
+            {
+                "input": 原始文本,
+                "corrected_text": 按原顺序拼接的纠正后文本,
+                "chunks": [{"index", "start", "end", "status", "elapsed_ms"}]，status 为
+                          corrected / unchanged / skipped（无需纠正）/ duplicate（与前面的分块相同）/
+                          rejected（输出为空或丢失 ___，保留原文）/ unavailable（LLM 超时或熔断，保留原文）,
+                "timings": {"total_ms": 实际耗时, "sequential_ms": 各分块 LLM 耗时之和,
+                            "estimated_speedup": sequential_ms / total_ms},
+                "degraded": LLM 超时或熔断的原因（有分块为 unavailable 时）,
+                "method": "chunked"
+            }
+            整篇单次调用的耗时与输出长度近似成正比，sequential_ms 可作为其估计；
+            实测对比见 tools/bench_chunked_correction.py
+        """
+        started_at = time.perf_counter()
+        chunks = split_into_chunks(text, max_chunk_chars)
+        results = await self._correct_texts(
+            [chunk.text for chunk in chunks if needs_correction(chunk.text)], llm_options, max_concurrency
+        )
+        
+        replacements: List[str] = []
+        chunk_info: List[Dict] = []
+        submitted = set()
+        degraded = None
+        for chunk in chunks:
+            info = {"index": chunk.index, "start": chunk.start, "end": chunk.end, "elapsed_ms": 0.0}
+            if chunk.text not in results:
+                info["status"] = "skipped"
+                replacements.append(chunk.text)
+            else:
+                corrected, elapsed_ms, reason = results[chunk.text]
+                if corrected is None:
+                    info["status"] = "unavailable" if reason else "rejected"
+                    degraded = degraded or reason
+                    corrected = chunk.text
+                else:
+                    info["status"] = "corrected" if corrected != chunk.text else "unchanged"
+                if chunk.text in submitted:
+                    info["status"] = "duplicate"
+                else:
+                    submitted.add(chunk.text)
+                    info["elapsed_ms"] = elapsed_ms
+                replacements.append(corrected)
+            chunk_info.append(info)
+        
+        total_ms = (time.perf_counter() - started_at) * 1000
+        sequential_ms = sum(info["elapsed_ms"] for info in chunk_info)
+        response = {
+            "input": text,
+            "corrected_text": reassemble(text, chunks, replacements),
+            "chunks": chunk_info,
+            "timings": {
+                "total_ms": round(total_ms, 2),
+                "sequential_ms": round(sequential_ms, 2),
+                "estimated_speedup": round(sequential_ms / total_ms, 2) if total_ms > 0 else None
+            },
+            "method": "chunked"
+        }
+        if degraded:
+            response["degraded"] = degraded
+        return response
+
+    async def correct_spelling_prefiltered(self, text: str, llm_options: dict, max_concurrency: int = 4) -> Dict:
+        """
+        本地拼写检查预过滤 + LLM 兜底
+
+        先用本地拼写检查器（对称删除索引）逐句检查，无歧义的拼写错误直接在本地纠正；
+        只有含未知词、有歧义错误或中文可疑片段的句子（已应用本地纠正）才并发交给 LLM。
+        词表中没有通用英文词时几乎每个句子都会交给 LLM，比整篇单次调用更慢，此时不可用
+
+        Args:
+            text: 需要纠正的文本
+            llm_options: 语言模型配置选项
+            max_concurrency: LLM 并发调用上限
+
+        Returns:
+            {
+                "input": 原始文本,
+                "corrected_text": 纠正后的文本,
+                "spans": 按句子 [{"index", "start", "end", "path", "corrections", "unresolved", "elapsed_ms"}]，
+                         path 为 unchanged / local / llm / llm_rejected（LLM 输出被丢弃，只保留本地纠正）/
+                         llm_unavailable（LLM 超时或熔断，只保留本地纠正），
+                         corrections 和 unresolved 中的偏移相对于原始文本,
+                "llm_calls": LLM 调用次数,
+                "timings": {"total_ms", "local_ms", "llm_ms"},
+                "degraded": LLM 超时或熔断的原因（有句子为 llm_unavailable 时）,
+                "method": "prefiltered"
+            }
+
+        Raises:
+            ValueError: 拼写检查词表中没有通用英文词（未开启本地自动纠正）
+        """
+        # 首次构建词表约需数百毫秒，检查本身也是 CPU 计算，都放到工作线程中，不阻塞事件循环
+        checker = await asyncio.to_thread(get_spell_checker)
+        if not checker.auto_correct:
+            raise ValueError(PREFILTER_UNAVAILABLE)
+        started_at = time.perf_counter()
+        # max_chars=1 时句子之间不合并，每个句子单独成块
+        sentences = split_into_chunks(text, max_chars=1)
+        
+        def shift(items: List[Dict], offset: int) -> List[Dict]:
+            return [{**item, "start": item["start"] + offset, "end": item["end"] + offset} for item in items]
+        
+        checks = await asyncio.to_thread(lambda: [checker.check(sentence.text) for sentence in sentences])
+        local_ms = (time.perf_counter() - started_at) * 1000
+        
+        escalated = [check["text"] for check in checks if check["unresolved"]]
+        llm_started_at = time.perf_counter()
+        results = await self._correct_texts(escalated, llm_options, max_concurrency)
+        llm_ms = (time.perf_counter() - llm_started_at) * 1000 if results else 0.0
+        
+        replacements: List[str] = []
+        spans: List[Dict] = []
+        degraded = None
+        for sentence, check in zip(sentences, checks):
+            span = {
+                "index": sentence.index,
+                "start": sentence.start,
+                "end": sentence.end,
+                "corrections": shift(check["corrections"], sentence.start),
+                "unresolved": shift(check["unresolved"], sentence.start),
+                "elapsed_ms": 0.0
+            }
+            replacement = check["text"]
+            if check["unresolved"]:
+                corrected, span["elapsed_ms"], reason = results[check["text"]]
+                span["path"] = "llm" if corrected is not None else ("llm_unavailable" if reason else "llm_rejected")
+                degraded = degraded or reason
+                replacement = corrected if corrected is not None else replacement
+            else:
+                span["path"] = "local" if check["corrections"] else "unchanged"
+            replacements.append(replacement)
+            spans.append(span)
+        
+        response = {
+            "input": text,
+            "corrected_text": reassemble(text, sentences, replacements),
+            "spans": spans,
+            "llm_calls": len(results),
+            "timings": {
+                "total_ms": round((time.perf_counter() - started_at) * 1000, 2),
+                "local_ms": round(local_ms, 2),
+                "llm_ms": round(llm_ms, 2)
+            },
+            "method": "prefiltered"
+        }
+        if degraded:
+            response["degraded"] = degraded
+        return response
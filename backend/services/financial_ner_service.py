@@ -3,11 +3,25 @@ import torch
 import logging
 import re
 from typing import List, Dict, Any
+from utils.ner_postprocess import Entity, allowed_groups, postprocess
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 术语类型 → 实体类型
+FINANCIAL_TERM_GROUPS = {
+    'currency': ('CURRENCY',),
+    'ratio': ('FINANCIAL_RATIO',),
+    'instrument': ('FINANCIAL_INSTRUMENT',),
+    'institution': ('FINANCIAL_INSTITUTION',),
+    'indicator': ('FINANCIAL_INDICATOR',),
+    'accounting': ('ACCOUNTING_TERM',),
+    'organization': ('ORG', 'MISC', 'PER'),
+}
+# 通用 NER 模型输出中可能与金融相关的实体类型
+_MODEL_GROUPS = frozenset(['ORG', 'MISC', 'PER'])
+
 class FinancialNERService:
     """
     金融术语命名实体识别服务
@@ -92,109 +106,37 @@ class FinancialNERService:
             except Exception as e:
                 logger.warning(f"模型识别失败: {e}")
         
-        # 移除重叠实体
-        non_overlapping_result = self._remove_overlapping_entities(entities)
-        
-        # 根据术语类型过滤实体
-        filtered_result = self._filter_entities(non_overlapping_result, term_types)
+        # 移除重叠实体，根据术语类型过滤实体
+        filtered_result = postprocess(
+            entities, allowed_groups(term_types, FINANCIAL_TERM_GROUPS, 'allFinancialTerms')
+        )
         
         return {
             "text": text,
             "entities": filtered_result
         }
 
-    def _extract_financial_entities(self, text: str) -> List[Dict[str, Any]]:
+    def _extract_financial_entities(self, text: str) -> List[Entity]:
         """使用正则表达式提取金融实体"""
         entities = []
         
         for category, patterns in self.compiled_patterns.items():
             for pattern in patterns:
                 for match in pattern.finditer(text):
-                    entities.append({
-                        'entity_group': category,
-                        'word': match.group(),
-                        'start': match.start(),
-                        'end': match.end(),
-                        'score': 0.9  # 规则匹配的置信度
-                    })
+                    # 规则匹配的置信度为 0.9
+                    entities.append(Entity(category, match.group(), match.start(), match.end(), 0.9))
         
         return entities
 
-    def _extract_model_entities(self, text: str) -> List[Dict[str, Any]]:
+    def _extract_model_entities(self, text: str) -> List[Entity]:
         """使用预训练模型提取实体"""
         try:
             result = self.pipe(text)
             if isinstance(result, dict):
                 result = result.get('entities', [])
             
-            # 转换模型输出为标准格式
-            model_entities = []
-            for entity in result:
-                # 只保留可能与金融相关的实体
-                if entity.get('entity_group') in ['ORG', 'MISC', 'PER']:
-                    entity['score'] = float(entity['score'])
-                    model_entities.append(entity)
-            
-            return model_entities
+            # 转换模型输出为标准格式，只保留可能与金融相关的实体
+            return Entity.from_dicts(entity for entity in result if entity.get('entity_group') in _MODEL_GROUPS)
         except Exception as e:
             logger.error(f"模型实体提取失败: {e}")
             return []
-
-    def _remove_overlapping_entities(self, entities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """移除重叠的实体，保留得分最高的实体"""
-        if not entities:
-            return []
-        
-        # 按开始位置、结束位置（降序）和得分（降序）排序
-        sorted_entities = sorted(entities, key=lambda x: (x['start'], -x['end'], -x['score']))
-        non_overlapping = []
-        last_end = -1
-
-        i = 0
-        while i < len(sorted_entities):
-            current = sorted_entities[i]
-            
-            # 如果当前实体与之前的实体不重叠，直接添加
-            if current['start'] >= last_end:
-                non_overlapping.append(current)
-                last_end = current['end']
-                i += 1
-            else:
-                # 处理重叠实体
-                same_span = [current]
-                j = i + 1
-                while (j < len(sorted_entities) and 
-                       sorted_entities[j]['start'] == current['start'] and 
-                       sorted_entities[j]['end'] == current['end']):
-                    same_span.append(sorted_entities[j])
-                    j += 1
-                
-                # 选择得分最高的实体
-                best_entity = max(same_span, key=lambda x: x['score'])
-                if best_entity['end'] > last_end:
-                    non_overlapping.append(best_entity)
-                    last_end = best_entity['end']
-                
-                i = j
-
-        return non_overlapping
-
-    def _filter_entities(self, entities: List[Dict[str, Any]], term_types: Dict[str, bool]) -> List[Dict[str, Any]]:
-        """根据术语类型过滤实体"""
-        if term_types.get('allFinancialTerms', False):
-            return entities
-        
-        filtered_result = []
-        for entity in entities:
-            entity_group = entity['entity_group']
-            
-            if ((term_types.get('currency', False) and entity_group == 'CURRENCY') or
-                (term_types.get('ratio', False) and entity_group == 'FINANCIAL_RATIO') or
-                (term_types.get('instrument', False) and entity_group == 'FINANCIAL_INSTRUMENT') or
-                (term_types.get('institution', False) and entity_group == 'FINANCIAL_INSTITUTION') or
-                (term_types.get('indicator', False) and entity_group == 'FINANCIAL_INDICATOR') or
-                (term_types.get('accounting', False) and entity_group == 'ACCOUNTING_TERM') or
-                (term_types.get('organization', False) and entity_group in ['ORG', 'MISC', 'PER'])):
-                filtered_result.append(entity)
-        
-        return filtered_result 
\ No newline at end of file
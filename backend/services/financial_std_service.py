@@ -2,7 +2,12 @@ import chromadb
 from chromadb.config import Settings
 from sentence_transformers import SentenceTransformer
 import logging
+import os
 from typing import List, Dict, Any
+from utils.hybrid_search import HybridSearcher, lexical_search_batch
+from utils.lexical_index import get_cached_lexical_index, lexical_index_path
+from utils.vector_store import ChromaVectorStore, NumpyVectorStore, SearchHit, get_cached_numpy_store
+from utils.resilience import EMBEDDING_TIMEOUT_S, ProviderUnavailable, guarded_call
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -15,7 +20,8 @@ class FinancialStdService:
     """
     
     def __init__(self, provider="huggingface", model="BAAI/bge-m3", 
-                 db_path="db/financial_bge_m3.db", collection_name="financial_concepts"):
+                 db_path="db/financial_bge_m3.db", collection_name="financial_concepts",
+                 vector_store="default", artifact_path=None, search_mode="dense", lexical_path=None):
         """
         初始化金融标准化服务
         
@@ -24,13 +30,27 @@ class FinancialStdService:
             model: 嵌入模型名称
             db_path: 向量数据库路径
             collection_name: 集合名称
+            vector_store: 检索后端，default 使用 Chroma，numpy 使用进程内精确检索
+            artifact_path: numpy 后端可选的向量产物目录，提供时不再从 Chroma 导出向量
+            search_mode: dense 只使用向量检索，hybrid 并行执行向量检索和词法检索后按 RRF 融合
+            lexical_path: 词法索引目录，默认为 <db_path>.lexical/<collection_name>
         """
+        if vector_store not in ("default", "numpy"):
+            raise ValueError(f"Unsupported vector store: {vector_store}")
+        if search_mode not in ("dense", "hybrid"):
+            raise ValueError(f"Unsupported search mode: {search_mode}")
         self.provider = provider
         self.model_name = model
         self.db_path = db_path
         self.collection_name = collection_name
+        self.vector_store = vector_store
+        self.artifact_path = artifact_path
+        self.search_mode = search_mode
+        self.lexical_path = lexical_path or lexical_index_path(db_path, collection_name)
+        self.searcher = None
         self.encoder = None
         self.collection = None
+        self.store = None
         
         # 初始化服务
         self._initialize()
@@ -53,12 +73,86 @@ class FinancialStdService:
             self.collection = client.get_collection(self.collection_name)
             logger.info(f"成功连接到集合: {self.collection_name}")
             
+            if self.vector_store == "numpy":
+                # 进程内检索：集合只导出一次，在各请求间共享
+                self.store = get_cached_numpy_store(
+                    ("chroma", self.db_path, self.collection_name, self.artifact_path),
+                    self._load_numpy_store
+                )
+            else:
+                self.store = ChromaVectorStore(self.collection)
+            
+            if self.search_mode == "hybrid":
+                if not os.path.exists(self.lexical_path):
+                    raise ValueError(f"词法索引不存在: {self.lexical_path}，请重新构建向量数据库")
+                self.searcher = HybridSearcher(self.store, get_cached_lexical_index(self.lexical_path), self._encode)
+            
         except Exception as e:
             logger.error(f"初始化失败: {e}")
             raise
     
+    def _load_numpy_store(self) -> NumpyVectorStore:
+        """加载 NumPy 检索矩阵，距离空间与 Chroma 集合的 hnsw:space 保持一致"""
+        space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+        if self.artifact_path:
+            return NumpyVectorStore.from_artifact(self.artifact_path, metric=space, document_field="fsn")
+        return NumpyVectorStore.from_chroma(self.collection, metric=space)
+    
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        """批量生成查询向量（带截止时间和熔断）"""
+        return guarded_call(f"embedding:{self.provider}", lambda: self.encoder.encode(list(texts)).tolist(),
+                            EMBEDDING_TIMEOUT_S)
+    
+    def _search_batch(self, terms: List[str], n_results: int, filters: Dict[str, Any] = None) -> List[List[SearchHit]]:
+        """向量检索或混合检索；嵌入超时或熔断时退化为只用词法索引检索（没有词法索引时抛出）"""
+        try:
+            if self.searcher is not None:
+                return self.searcher.search_batch(terms, n_results, filters)
+            return self.store.search_batch(self._encode(terms), n_results, filters)
+        except ProviderUnavailable as e:
+            if not os.path.exists(self.lexical_path):
+                raise
+            logger.warning(f"{e}，退化为词法检索")
+            return lexical_search_batch(self.store, get_cached_lexical_index(self.lexical_path), terms, n_results, filters)
+    
+    @staticmethod
+    def _format_hit(hit: SearchHit) -> Dict[str, Any]:
+        """将检索命中转换为返回格式（混合检索中只由词法检索命中的记录 similarity 为 None）"""
+        dense = hit.fusion is None or hit.fusion['dense_rank'] is not None
+        result = {
+            'conceptId': hit.metadata['conceptId'],
+            'standardTerm': hit.document,
+            'similarity': round(hit.score, 4) if dense else None,
+            'domainId': hit.metadata['domainId'],
+            'active': hit.metadata['active'],
+            'effectiveTime': hit.metadata['effectiveTime']
+        }
+        if hit.fusion is not None:
+            lexical = hit.fusion['lexical_rank'] is not None
+            result['rrfScore'] = round(hit.fusion['rrf_score'], 6)
+            result['match'] = 'both' if dense and lexical else ('dense' if dense else 'lexical')
+        return result
+    
+    def _shape_results(self, hits: List[SearchHit], min_similarity: float) -> List[Dict[str, Any]]:
+        """
+        按相似度阈值过滤并转换单个查询的检索结果
+        
+        混合检索结果保持 RRF 融合顺序，相似度阈值只作用于向量检索命中的记录
+        """
+        if hits and hits[0].fusion is not None:
+            return [
+                self._format_hit(hit) for hit in hits
+                if hit.fusion['lexical_rank'] is not None or hit.score >= min_similarity
+            ]
+        
+        similar_terms = [self._format_hit(hit) for hit in hits if hit.score >= min_similarity]
+        
+        # 按相似度排序
+        similar_terms.sort(key=lambda x: x['similarity'], reverse=True)
+        return similar_terms
+    
     def search_similar_terms(self, query_term: str, n_results: int = 5, 
-                           min_similarity: float = 0.3) -> List[Dict[str, Any]]:
+                           min_similarity: float = 0.3, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """
         搜索相似的金融术语
         
@@ -66,44 +160,23 @@ class FinancialStdService:
             query_term: 查询术语
             n_results: 返回结果数量
             min_similarity: 最小相似度阈值
+            filters: 元数据过滤条件，如 {"domainId": "finance"}
             
         Returns:
             相似术语列表
         """
         try:
-            # 生成查询向量
-            query_embedding = self.encoder.encode([query_term]).tolist()
-            
-            # 向量搜索
-            results = self.collection.query(
-                query_embeddings=query_embedding,
-                n_results=n_results,
-                include=['documents', 'metadatas', 'distances']
-            )
+            # 向量搜索（混合模式下与词法检索并行后融合）
+            hits = self._search_batch([query_term], n_results, filters)[0]
             
             # 处理结果
-            similar_terms = []
-            for i in range(len(results['documents'][0])):
-                distance = results['distances'][0][i]
-                similarity = 1 - distance  # 转换为相似度
-                
-                if similarity >= min_similarity:
-                    metadata = results['metadatas'][0][i]
-                    similar_terms.append({
-                        'conceptId': metadata['conceptId'],
-                        'standardTerm': results['documents'][0][i],
-                        'similarity': round(similarity, 4),
-                        'domainId': metadata['domainId'],
-                        'active': metadata['active'],
-                        'effectiveTime': metadata['effectiveTime']
-                    })
-            
-            # 按相似度排序
-            similar_terms.sort(key=lambda x: x['similarity'], reverse=True)
+            similar_terms = self._shape_results(hits, min_similarity)
             
             logger.info(f"为术语 '{query_term}' 找到 {len(similar_terms)} 个相似术语")
             return similar_terms
             
+        except ProviderUnavailable:
+            raise
         except Exception as e:
             logger.error(f"术语搜索失败: {e}")
             return []
@@ -119,16 +192,13 @@ class FinancialStdService:
             术语信息字典
         """
         try:
-            results = self.collection.get(
-                ids=[concept_id],
-                include=['documents', 'metadatas']
-            )
+            hits = self.store.get_by_ids([concept_id])
             
-            if results['documents']:
-                metadata = results['metadatas'][0]
+            if hits:
+                metadata = hits[0].metadata
                 return {
                     'conceptId': concept_id,
-                    'standardTerm': results['documents'][0],
+                    'standardTerm': hits[0].document,
                     'domainId': metadata['domainId'],
                     'active': metadata['active'],
                     'effectiveTime': metadata['effectiveTime']
@@ -153,10 +223,20 @@ class FinancialStdService:
         Returns:
             标准化结果字典
         """
-        results = {}
-        for term in terms:
-            results[term] = self.search_similar_terms(term, n_results, min_similarity)
-        return results
+        if not terms:
+            return {}
+        try:
+            # 一次编码、一次检索
+            batch_hits = self._search_batch(list(terms), n_results)
+            return {
+                term: self._shape_results(hits, min_similarity)
+                for term, hits in zip(terms, batch_hits)
+            }
+        except ProviderUnavailable:
+            raise
+        except Exception as e:
+            logger.error(f"批量术语搜索失败: {e}")
+            return {term: [] for term in terms}
     
     def get_financial_categories(self) -> List[str]:
         """
@@ -223,7 +303,7 @@ class FinancialStdService:
         """
         try:
             # 获取集合中的项目数量
-            count_result = self.collection.count()
+            count_result = self.store.count()
             
             return {
                 'total_terms': count_result,
@@ -1,7 +1,8 @@
-from langchain_community.llms import Ollama
 from langchain.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from typing import Dict, List
+from utils.llm_pool import get_ollama_llm
+from utils.resilience import guarded_llm
 import os
 import logging
 
@@ -9,11 +10,69 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 各方法的提示模板在导入时构建一次：系统指令是逐字节不变的前缀，患者相关的数据放在最后，
+# Ollama 保持模型常驻（OLLAMA_KEEP_ALIVE）时可以复用前缀的 KV 缓存，只需处理新增的部分
+MEDICAL_NOTE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are a professional medical note writer.
+Generate a detailed medical note in a structured format including:
+1. Patient Information
+2. Chief Complaint
+3. History of Present Illness
+4. Physical Examination
+5. Assessment and Plan
+
+Use medical terminology appropriately and maintain a professional tone."""),
+    ("human", """Patient Information:
+{patient_info}
+
+Symptoms:
+{symptoms}
+
+Diagnosis:
+{diagnosis}
+
+Treatment:
+{treatment}""")
+])
+
+DIFFERENTIAL_DIAGNOSIS_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are a medical expert.
+Generate a list of possible differential diagnoses based on the provided symptoms.
+For each diagnosis, provide:
+1. The condition name
+2. Brief explanation why it's a possibility
+3. Key distinguishing features
+
+Order the diagnoses from most likely to least likely."""),
+    ("human", "Symptoms:\n{symptoms}")
+])
+
+TREATMENT_PLAN_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are a medical expert.
+Generate a comprehensive treatment plan that includes:
+1. Immediate interventions
+2. Medications (if applicable)
+3. Follow-up recommendations
+4. Lifestyle modifications
+5. Monitoring plan
+
+Consider the patient's information and medical history in your recommendations."""),
+    ("human", """Diagnosis: {diagnosis}
+Patient Information: {patient_info}""")
+])
+
+
 class GenService:
     """
     医疗文本生成服务
     提供医疗笔记、鉴别诊断和治疗计划等医疗文本的生成功能
     """
+    # 方法名 -> 提示模板（基准测试按相同的模板渲染提示）
+    PROMPTS = {
+        "generate_medical_note": MEDICAL_NOTE_PROMPT,
+        "generate_differential_diagnosis": DIFFERENTIAL_DIAGNOSIS_PROMPT,
+        "generate_treatment_plan": TREATMENT_PLAN_PROMPT,
+    }
     def __init__(self):
         pass
         
@@ -25,7 +84,7 @@ class GenService:
             llm_options: 语言模型配置选项
             
         Returns:
-            配置好的语言模型实例
+            配置好的语言模型实例（超时或熔断时抛出 ProviderUnavailable）
             
         Raises:
             ValueError: 当提供不支持的模型提供商时
@@ -34,15 +93,17 @@ class GenService:
         model = llm_options.get("model", "llama3.1:8b")
         
         if provider == "ollama":
-            return Ollama(model=model)
+            llm = get_ollama_llm(model)
         elif provider == "openai":
-            return ChatOpenAI(
+            llm = ChatOpenAI(
                 model=model,
                 temperature=0.7,  # 稍微提高温度以获得更有创意的输出
                 api_key=os.getenv("OPENAI_API_KEY")
             )
         else:
             raise ValueError(f"Unsupported LLM provider: {provider}")
+        # 每次调用带截止时间，按提供方熔断
+        return guarded_llm(llm, provider)
 
     def generate_medical_note(self, 
                             patient_info: Dict,
@@ -65,32 +126,7 @@ class GenService:
         """
         llm = self._get_llm(llm_options)
         
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are a professional medical note writer. 
-            Generate a detailed medical note in a structured format including:
-            1. Patient Information
-            2. Chief Complaint
-            3. History of Present Illness
-            4. Physical Examination
-            5. Assessment and Plan
-            
-            Use medical terminology appropriately and maintain a professional tone."""),
-            ("human", """
-            Patient Information:
-            {patient_info}
-            
-            Symptoms:
-            {symptoms}
-            
-            Diagnosis:
-            {diagnosis}
-            
-            Treatment:
-            {treatment}
-            """)
-        ])
-        
-        chain = prompt | llm
+        chain = MEDICAL_NOTE_PROMPT | llm
         result = chain.invoke({
             "patient_info": str(patient_info),
             "symptoms": "\n".join(symptoms),
@@ -123,19 +159,7 @@ class GenService:
         """
         llm = self._get_llm(llm_options)
         
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are a medical expert. 
-            Generate a list of possible differential diagnoses based on the provided symptoms.
-            For each diagnosis, provide:
-            1. The condition name
-            2. Brief explanation why it's a possibility
-            3. Key distinguishing features
-            
-            Order the diagnoses from most likely to least likely."""),
-            ("human", "Symptoms:\n{symptoms}")
-        ])
-        
-        chain = prompt | llm
+        chain = DIFFERENTIAL_DIAGNOSIS_PROMPT | llm
         result = chain.invoke({
             "symptoms": "\n".join(symptoms)
         })
@@ -164,23 +188,7 @@ class GenService:
         """
         llm = self._get_llm(llm_options)
         
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are a medical expert.
-            Generate a comprehensive treatment plan that includes:
-            1. Immediate interventions
-            2. Medications (if applicable)
-            3. Follow-up recommendations
-            4. Lifestyle modifications
-            5. Monitoring plan
-            
-            Consider the patient's information and medical history in your recommendations."""),
-            ("human", """
-            Diagnosis: {diagnosis}
-            Patient Information: {patient_info}
-            """)
-        ])
-        
-        chain = prompt | llm
+        chain = TREATMENT_PLAN_PROMPT | llm
         result = chain.invoke({
             "diagnosis": diagnosis,
             "patient_info": str(patient_info)
@@ -1,4 +1,7 @@
 from transformers import pipeline
+from utils.ner_cache import NER_BATCH_SIZE, get_sentence_cache
+from utils.ner_postprocess import Entity, allowed_groups, combine_bio_structure, postprocess
+from utils.text_chunking import split_into_sentences
 import torch
 import logging
 
@@ -6,15 +9,26 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 术语类型 → 实体类型
+MEDICAL_TERM_GROUPS = {
+    'symptom': ('SIGN_SYMPTOM', 'COMBINED_BIO_SYMPTOM'),
+    'disease': ('DISEASE_DISORDER',),
+    'therapeuticProcedure': ('THERAPEUTIC_PROCEDURE',),
+}
+
 class NERService:
     """
     医学术语命名实体识别服务
     使用 Clinical-AI-Apollo/Medical-NER 模型进行医疗文本的实体识别
+
+    文本按句子切分，命中句子缓存的句子不再经过模型，未命中的句子批量识别
     """
+    MODEL_NAME = "Clinical-AI-Apollo/Medical-NER"
+
     def __init__(self):
         # 初始化 NER 模型，使用 GPU 如果可用
         self.pipe = pipeline("token-classification", 
-                           model="Clinical-AI-Apollo/Medical-NER", 
+                           model=self.MODEL_NAME, 
                            aggregation_strategy='simple',
                            device=0 if torch.cuda.is_available() else -1)
   
@@ -31,125 +45,63 @@ class NERService:
             包含识别出的实体和原始文本的字典
         """
         # 使用模型进行实体识别
-        result = self.pipe(text)
-        
-        # 确保结果是实体列表
-        if isinstance(result, dict):
-            result = result.get('entities', [])
+        result = self._recognize(text)
         
         # 合并相关实体（如生物结构和症状）
         combined_result = self._combine_entities(result, text, options)
         
-        # 移除重叠实体
-        non_overlapping_result = self._remove_overlapping_entities(combined_result)
-        
-        # 根据术语类型过滤实体
-        filtered_result = self._filter_entities(non_overlapping_result, term_types)
+        # 移除重叠实体，根据术语类型过滤实体
+        filtered_result = postprocess(
+            combined_result, allowed_groups(term_types, MEDICAL_TERM_GROUPS, 'allMedicalTerms')
+        )
         
         return {
             "text": text,
             "entities": filtered_result
         }
 
-    def _combine_entities(self, result, text, options):
-        """
-        合并相关的实体，如生物结构和症状
-        """
-        combined_result = []
-        i = 0
-        while i < len(result):
-            entity = result[i]
-            entity['score'] = float(entity['score'])
-
-            if options['combineBioStructure'] and entity['entity_group'] in ['SIGN_SYMPTOM', 'DISEASE_DISORDER']:
-                # 检查并合并生物结构
-                combined_entity = self._try_combine_with_bio_structure(result, i, text)
-                if combined_entity:
-                    combined_result.append(combined_entity)
-                    i += 1
-                    continue
-            combined_result.append(entity)
-            i += 1
-        return combined_result
-
-    def _try_combine_with_bio_structure(self, result, i, text):
-        """
-        尝试将当前实体与生物结构实体合并
-        """
-        # 检查前一个实体
-        if i > 0 and result[i-1]['entity_group'] == 'BIOLOGICAL_STRUCTURE':
-            return self._create_combined_entity(result[i-1], result[i], text)
-        # 检查后一个实体
-        elif i < len(result) - 1 and result[i+1]['entity_group'] == 'BIOLOGICAL_STRUCTURE':
-            return self._create_combined_entity(result[i], result[i+1], text)
-        return None
+    @staticmethod
+    def _as_entities(result):
+        """确保结果是实体列表"""
+        if isinstance(result, dict):
+            result = result.get('entities', [])
+        return result
 
-    def _create_combined_entity(self, entity1, entity2, text):
-        """
-        创建合并后的实体
+    def _recognize(self, text):
         """
-        start = min(entity1['start'], entity2['start'])
-        end = max(entity1['end'], entity2['end'])
-        word = text[start:end]
-        return {
-            'entity_group': 'COMBINED_BIO_SYMPTOM',
-            'word': word,
-            'start': start,
-            'end': end,
-            'score': (entity1['score'] + entity2['score']) / 2,
-            'original_entities': [entity1, entity2]
-        }
+        识别全文实体（偏移相对于全文）
 
-    def _remove_overlapping_entities(self, entities):
-        """
-        移除重叠的实体，保留得分最高的实体
+        关闭句子缓存时整篇文本一次交给模型；否则按句子查缓存，未命中的句子（去重后）批量交给模型，
+        再按句子在原文中的位置平移偏移
         """
-        # 按开始位置、结束位置（降序）和得分（降序）排序
-        sorted_entities = sorted(entities, key=lambda x: (x['start'], -x['end'], -x['score']))
-        non_overlapping = []
-        last_end = -1
+        cache = get_sentence_cache()
+        if cache is None:
+            return Entity.from_dicts(self._as_entities(self.pipe(text)))
 
-        i = 0
-        while i < len(sorted_entities):
-            current = sorted_entities[i]
-            
-            # 如果当前实体与之前的实体不重叠，直接添加
-            if current['start'] >= last_end:
-                non_overlapping.append(current)
-                last_end = current['end']
-                i += 1
-            else:
-                # 处理重叠实体
-                same_span = [current]
-                j = i + 1
-                while j < len(sorted_entities) and sorted_entities[j]['start'] == current['start'] and sorted_entities[j]['end'] == current['end']:
-                    same_span.append(sorted_entities[j])
-                    j += 1
-                
-                # 选择得分最高的实体
-                best_entity = max(same_span, key=lambda x: x['score'])
-                if best_entity['end'] > last_end:
-                    non_overlapping.append(best_entity)
-                    last_end = best_entity['end']
-                
-                i = j
+        sentences = split_into_sentences(text)
+        by_sentence = {}
+        for sentence in sentences:
+            if sentence.text not in by_sentence:
+                by_sentence[sentence.text] = cache.get(self.MODEL_NAME, sentence.text)
+        misses = [sentence for sentence, entities in by_sentence.items() if entities is None]
+        if misses:
+            outputs = self.pipe(misses, batch_size=NER_BATCH_SIZE)
+            computed = {
+                sentence: [{**entity, 'score': float(entity['score'])} for entity in self._as_entities(output)]
+                for sentence, output in zip(misses, outputs)
+            }
+            cache.put_many(self.MODEL_NAME, computed)
+            by_sentence.update(computed)
 
-        return non_overlapping
+        result = []
+        for sentence in sentences:
+            result.extend(Entity.from_dicts(by_sentence[sentence.text], sentence.start))
+        return result
 
-    def _filter_entities(self, entities, term_types):
+    def _combine_entities(self, result, text, options):
         """
-        根据术语类型过滤实体
+        合并相关的实体，如生物结构和症状
         """
-        filtered_result = []
-        for entity in entities:
-            if term_types.get('allMedicalTerms', False):
-                filtered_result.append(entity)
-            elif (term_types.get('symptom', False) and entity['entity_group'] in ['SIGN_SYMPTOM', 'COMBINED_BIO_SYMPTOM']) or \
-                 (term_types.get('disease', False) and entity['entity_group'] == 'DISEASE_DISORDER') or \
-                 (term_types.get('therapeuticProcedure', False) and entity['entity_group'] == 'THERAPEUTIC_PROCEDURE'):
-                filtered_result.append(entity)
-        return filtered_result
-
-
-
-
+        if not result or not options['combineBioStructure']:
+            return list(result)
+        return combine_bio_structure(result, text)
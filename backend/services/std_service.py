@@ -2,8 +2,14 @@ from pymilvus import MilvusClient
 from dotenv import load_dotenv
 from utils.embedding_factory import EmbeddingFactory
 from utils.embedding_config import EmbeddingProvider, EmbeddingConfig
+from utils.domain_routing import domains_for_entity, domain_partition_name
+from utils.index_config import get_search_params
+from utils.hybrid_search import HybridSearcher, lexical_search_batch
+from utils.lexical_index import get_cached_lexical_index, lexical_index_path
+from utils.vector_store import MilvusVectorStore, NumpyVectorStore, SearchHit, get_cached_numpy_store
+from utils.resilience import GuardedEmbeddings, ProviderUnavailable
 import os
-from typing import List, Dict
+from typing import List, Dict, Optional
 import logging
 
 # Configure logging
@@ -17,11 +23,22 @@ class StdService:
     医学术语标准化服务
     使用向量数据库进行医学术语的标准化和相似度搜索
     """
+    # 检索结果中返回的字段
+    OUTPUT_FIELDS = [
+        "concept_id", "concept_name", "domain_id",
+        "vocabulary_id", "concept_class_id", "standard_concept",
+        "concept_code", "synonyms"
+    ]
+
     def __init__(self, 
                  provider="huggingface",
                  model="BAAI/bge-m3",
                  db_path="db/snomed_bge_m3.db",
-                 collection_name="concepts_only_name"):
+                 collection_name="concepts_only_name",
+                 vector_store="default",
+                 artifact_path=None,
+                 search_mode="dense",
+                 lexical_path=None):
         """
         初始化标准化服务
         
@@ -30,6 +47,11 @@ class StdService:
             model: 使用的模型名称
             db_path: Milvus 数据库路径
             collection_name: 集合名称
+            vector_store: 检索后端，default 使用 Milvus，numpy 使用进程内精确检索
+            artifact_path: numpy 后端可选的向量产物目录，提供时不再从 Milvus 加载
+            search_mode: dense 只使用向量检索，hybrid 并行执行向量检索和词法检索后按 RRF 融合
+            lexical_path: 词法索引目录，默认为 <db_path>.lexical/<collection_name>；
+                          嵌入服务超时或熔断时也用它做降级检索
         """
         # 根据 provider 字符串匹配正确的枚举值
         provider_mapping = {
@@ -47,20 +69,108 @@ class StdService:
             provider=embedding_provider,
             model_name=model
         )
-        self.embedding_func = EmbeddingFactory.create_embedding_function(config)
+        # 嵌入调用带截止时间和按提供方的熔断
+        self.embedding_func = GuardedEmbeddings(EmbeddingFactory.create_embedding_function(config), provider.lower())
         
-        # 连接 Milvus
-        self.client = MilvusClient(db_path)
-        self.collection_name = collection_name
-        self.client.load_collection(self.collection_name)
+        self.vector_store = vector_store
+
+        if vector_store == "numpy":
+            # 进程内检索：整个集合（或向量产物）只加载一次，在各请求间共享
+            self.store = get_cached_numpy_store(
+                ("milvus", db_path, collection_name, artifact_path),
+                lambda: self._load_numpy_store(db_path, collection_name, artifact_path)
+            )
+        elif vector_store == "default":
+            # 连接 Milvus
+            self.client = MilvusClient(db_path)
+            self.collection_name = collection_name
+            self.client.load_collection(self.collection_name)
+            # 检索参数（nprobe / ef 等）来自索引调优工具写出的配置，未调优时使用 Milvus 默认值
+            self.store = MilvusVectorStore(
+                self.client, self.collection_name, self.OUTPUT_FIELDS,
+                search_params=get_search_params(self.collection_name),
+                partition_field="domain_id", partition_name=domain_partition_name
+            )
+        else:
+            raise ValueError(f"Unsupported vector store: {vector_store}")
+
+        self.search_mode = search_mode
+        self.searcher = None
+        self.lexical_path = lexical_path or lexical_index_path(db_path, collection_name)
+        if search_mode == "hybrid":
+            if not os.path.exists(self.lexical_path):
+                raise ValueError(f"Lexical index not found at {self.lexical_path}; rebuild the collection to create it")
+            self.searcher = HybridSearcher(self.store, get_cached_lexical_index(self.lexical_path),
+                                           self.embedding_func.embed_documents)
+        elif search_mode != "dense":
+            raise ValueError(f"Unsupported search mode: {search_mode}")
+
+    def _load_numpy_store(self, db_path, collection_name, artifact_path=None) -> NumpyVectorStore:
+        """加载 NumPy 检索矩阵：优先使用向量产物，否则从 Milvus 集合导出"""
+        if artifact_path:
+            return NumpyVectorStore.from_artifact(artifact_path, metric="cosine")
+        client = MilvusClient(db_path)
+        client.load_collection(collection_name)
+        try:
+            return NumpyVectorStore.from_milvus(client, collection_name, self.OUTPUT_FIELDS, metric="cosine")
+        finally:
+            client.release_collection(collection_name)
+
+    @classmethod
+    def _format_hit(cls, hit: SearchHit) -> Dict:
+        """
+        将检索命中转换为统一的返回格式（distance 为余弦相似度，越大越相似）
+
+        混合检索结果额外包含 rrf_score 和 match（dense / lexical / both），
+        只由词法检索命中的记录 distance 为 None
+        """
+        result = {field: hit.metadata.get(field) for field in cls.OUTPUT_FIELDS}
+        result["distance"] = float(hit.score)
+        if hit.fusion is not None:
+            dense = hit.fusion["dense_rank"] is not None
+            lexical = hit.fusion["lexical_rank"] is not None
+            result["distance"] = float(hit.score) if dense else None
+            result["rrf_score"] = hit.fusion["rrf_score"]
+            result["match"] = "both" if dense and lexical else ("dense" if dense else "lexical")
+        return result
+
+    def _search_embeddings(self, embeddings: List[List[float]], limit: int,
+                           filters: Optional[Dict] = None) -> List[List[Dict]]:
+        """对一批查询向量执行检索"""
+        return [
+            [self._format_hit(hit) for hit in hits]
+            for hits in self.store.search_batch(embeddings, limit, filters)
+        ]
+
+    def _lexical_fallback(self, queries: List[str], limit: int, filters: Optional[Dict],
+                          error: ProviderUnavailable) -> List[List[Dict]]:
+        """
+        嵌入服务不可用时只用词法索引检索，每条结果带 fallback 字段（超时或熔断原因）；
+        没有词法索引时抛出原异常
+        """
+        if not os.path.exists(self.lexical_path):
+            raise error
+        logger.warning(f"{error}; falling back to lexical search for {len(queries)} queries")
+        hits_batch = lexical_search_batch(self.store, get_cached_lexical_index(self.lexical_path),
+                                          queries, limit, filters)
+        return [[{**self._format_hit(hit), "fallback": error.reason} for hit in hits] for hits in hits_batch]
+
+    def get_terms_by_ids(self, concept_ids: List[str]) -> List[Dict]:
+        """根据概念ID获取术语信息"""
+        return [self._format_hit(hit) for hit in self.store.get_by_ids(concept_ids)]
+
+    def count(self) -> int:
+        """集合中的概念数量"""
+        return self.store.count()
 
-    def search_similar_terms(self, query: str, limit: int = 5) -> List[Dict]:
+    def search_similar_terms(self, query: str, limit: int = 5, filters: Optional[Dict] = None) -> List[Dict]:
         """
         搜索与查询文本相似的医学术语
         
         Args:
             query: 查询文本
             limit: 返回结果的最大数量
+            filters: 元数据过滤条件，如 {"domain_id": "Condition"}
             
         Returns:
             包含相似术语信息的列表，每个术语包含：
@@ -74,39 +184,68 @@ class StdService:
             - synonyms: 同义词
             - distance: 相似度距离
         """
+        if self.searcher is not None:
+            return self.search_similar_terms_batch([query], limit, filters)[0]
         # 获取查询的向量表示
-        query_embedding = self.embedding_func.embed_query(query)
+        try:
+            query_embedding = self.embedding_func.embed_query(query)
+        except ProviderUnavailable as e:
+            return self._lexical_fallback([query], limit, filters, e)[0]
+        return self._search_embeddings([query_embedding], limit, filters)[0]
+
+    def search_similar_terms_batch(self, queries: List[str], limit: int = 5,
+                                   filters: Optional[Dict] = None) -> List[List[Dict]]:
+        """
+        批量搜索相似的医学术语：一次嵌入、一次检索
         
-        # 设置搜索参数
-        search_params = {
-            "collection_name": self.collection_name,
-            "data": [query_embedding],
-            "limit": limit,
-            "output_fields": [
-                "concept_id", "concept_name", "domain_id", 
-                "vocabulary_id", "concept_class_id", "standard_concept",
-                "concept_code", "synonyms"
-            ],
-            # "filter": "domain_id == 'Condition'"
-        }
+        Args:
+            queries: 查询文本列表
+            limit: 每个查询返回结果的最大数量
+            filters: 元数据过滤条件
+            
+        Returns:
+            与 queries 一一对应的结果列表，每项格式同 search_similar_terms
+        """
+        if not queries:
+            return []
+        try:
+            if self.searcher is not None:
+                return [
+                    [self._format_hit(hit) for hit in hits]
+                    for hits in self.searcher.search_batch(queries, limit, filters)
+                ]
+            query_embeddings = self.embedding_func.embed_documents(list(queries))
+        except ProviderUnavailable as e:
+            return self._lexical_fallback(list(queries), limit, filters, e)
+        return self._search_embeddings(query_embeddings, limit, filters)
+
+    def standardize_entities(self, entities: List[Dict], limit: int = 5,
+                             route_by_entity_type: bool = True) -> List[List[Dict]]:
+        """
+        批量标准化 NER 实体
         
-        # 搜索相似项
-        search_result = self.client.search(**search_params)
-
-        results = []
-        for hit in search_result[0]:
-            results.append({
-                "concept_id": hit['entity'].get('concept_id'),
-                "concept_name": hit['entity'].get('concept_name'),
-                "domain_id": hit['entity'].get('domain_id'),
-                "vocabulary_id": hit['entity'].get('vocabulary_id'),
-                "concept_class_id": hit['entity'].get('concept_class_id'),
-                "standard_concept": hit['entity'].get('standard_concept'),
-                "concept_code": hit['entity'].get('concept_code'),
-                "synonyms": hit['entity'].get('synonyms'),
-                "distance": float(hit['distance'])
-            })
+        按实体类型路由到对应的 SNOMED 领域（如 DISEASE_DISORDER 只检索 Condition），
+        同一领域组合的实体合并为一次嵌入 + 一次检索
+        
+        Args:
+            entities: NER 实体列表（需包含 word 和 entity_group）
+            limit: 每个实体返回结果的最大数量
+            route_by_entity_type: 是否按实体类型限制检索领域
+            
+        Returns:
+            与 entities 一一对应的标准化结果列表
+        """
+        groups: Dict[tuple, List[int]] = {}
+        for i, entity in enumerate(entities):
+            domains = domains_for_entity(entity.get('entity_group')) if route_by_entity_type else None
+            groups.setdefault(tuple(domains or ()), []).append(i)
 
+        results: List[List[Dict]] = [[] for _ in entities]
+        for domains, indices in groups.items():
+            filters = {"domain_id": list(domains)} if domains else None
+            batch = self.search_similar_terms_batch([entities[i]['word'] for i in indices], limit, filters)
+            for i, result in zip(indices, batch):
+                results[i] = result
         return results
 
     def __del__(self):
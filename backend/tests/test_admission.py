@@ -0,0 +1,47 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from utils.admission import AdmissionRejected, ModelQueue
+
+
+def test_head_waiter_timeout_admits_next_waiter():
+    async def scenario():
+        queue = ModelQueue("test/model", max_concurrency=4, max_queue=8)
+        await queue.acquire(weight=2)
+
+        # 队首的大请求等不到 4 个容量而超时，后面的小请求在空闲容量内应立即放行，而不必等到下一次 release
+        heavy = asyncio.ensure_future(queue.acquire(weight=4, timeout=0.05))
+        await asyncio.sleep(0)
+        small = asyncio.ensure_future(queue.acquire(weight=1, timeout=1.0))
+        await asyncio.sleep(0)
+        assert not small.done()
+
+        with pytest.raises(AdmissionRejected):
+            await heavy
+        await asyncio.wait_for(small, 0.5)
+        assert queue.in_use == 3
+        assert queue.snapshot()["queue_depth"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_head_waiter_admits_next_waiter():
+    async def scenario():
+        queue = ModelQueue("test/model", max_concurrency=4, max_queue=8)
+        await queue.acquire(weight=2)
+
+        heavy = asyncio.ensure_future(queue.acquire(weight=4))
+        await asyncio.sleep(0)
+        small = asyncio.ensure_future(queue.acquire(weight=1))
+        await asyncio.sleep(0)
+
+        heavy.cancel()
+        await asyncio.wait_for(small, 0.5)
+        assert queue.in_use == 3
+
+    asyncio.run(scenario())
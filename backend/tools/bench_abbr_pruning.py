@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+缩写扩展提示裁剪基准测试
+对同一批病历分别执行整篇复述（simple_ollama_expansion）和只交给 LLM 缩写与少量上下文（pruned_ollama_expansion），
+比较提示字符数、LLM 输出字符数（生成 token 数的近似）与实际耗时
+"""
+
+import sys
+import time
+import argparse
+import logging
+import statistics
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from services.abbr_service import AbbrService, PRUNED_CONTEXT_CHARS, PRUNED_TOKEN_BUDGET
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def load_notes(path, separator):
+    """读取病历文件：多篇病历之间用单独一行的分隔符隔开"""
+    text = Path(path).read_text(encoding="utf-8")
+    notes = [note.strip() for note in text.split(f"\n{separator}\n")]
+    return [note for note in notes if note]
+
+
+def bench_note(service, note, llm_options, context_chars, token_budget):
+    """测量单篇病历两种方式的提示、输出字符数和耗时（毫秒）"""
+    start = time.perf_counter()
+    simple = service.simple_ollama_expansion(note, llm_options)
+    simple_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    pruned = service.pruned_ollama_expansion(note, llm_options, context_chars=context_chars, token_budget=token_budget)
+    pruned_ms = (time.perf_counter() - start) * 1000
+
+    llm_used = simple["method"] != "dictionary"
+    return {
+        "chars": len(note),
+        "abbreviations": len(pruned["llm_abbreviations"]),
+        "llm_calls": pruned["llm_calls"],
+        # 整篇复述时提示和输出都约等于整篇病历
+        "simple_prompt_chars": len(note) if llm_used else 0,
+        "simple_output_chars": len(simple["expanded_text"]) if llm_used else 0,
+        "pruned_prompt_chars": pruned["prompt_chars"],
+        # 每个缩写一行 "N. expansion"
+        "pruned_output_chars": sum(len(item["expansion"] or "NONE") + 4
+                                   for item in {i["abbreviation"].upper(): i for i in pruned["llm_abbreviations"]}.values()),
+        "simple_ms": simple_ms,
+        "pruned_ms": pruned_ms,
+    }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="比较整篇复述与裁剪提示的缩写扩展")
+    parser.add_argument("notes", help="病历文本文件")
+    parser.add_argument("--separator", default="=====", help="病历之间的分隔行")
+    parser.add_argument("--provider", default="ollama", help="LLM 提供商")
+    parser.add_argument("--model", default="llama3.1:8b", help="LLM 模型")
+    parser.add_argument("--context-chars", type=int, default=PRUNED_CONTEXT_CHARS, help="每个缩写前后的上下文字符数")
+    parser.add_argument("--token-budget", type=int, default=PRUNED_TOKEN_BUDGET, help="单次调用的提示 token 预算")
+    args = parser.parse_args()
+
+    notes = load_notes(args.notes, args.separator)
+    logger.info(f"加载 {len(notes)} 篇病历，平均 {statistics.mean(len(n) for n in notes):.0f} 字符")
+    service = AbbrService()
+    llm_options = {"provider": args.provider, "model": args.model}
+
+    rows = [bench_note(service, note, llm_options, args.context_chars, args.token_budget) for note in notes]
+    print(f"{'chars':>7} {'abbrs':>6} {'calls':>6} {'prompt':>15} {'output':>15} {'simple':>9} {'pruned':>9} {'speedup':>8}")
+    for row in rows:
+        speedup = row["simple_ms"] / row["pruned_ms"] if row["pruned_ms"] > 0 else 0.0
+        print(f"{row['chars']:>7} {row['abbreviations']:>6} {row['llm_calls']:>6} "
+              f"{row['simple_prompt_chars']:>7}/{row['pruned_prompt_chars']:<7} "
+              f"{row['simple_output_chars']:>7}/{row['pruned_output_chars']:<7} "
+              f"{row['simple_ms']:>7.0f}ms {row['pruned_ms']:>7.0f}ms {speedup:>7.2f}x")
+
+    simple = statistics.median(row["simple_ms"] for row in rows)
+    pruned = statistics.median(row["pruned_ms"] for row in rows)
+    output_ratio = sum(r["simple_output_chars"] for r in rows) / max(1, sum(r["pruned_output_chars"] for r in rows))
+    print(f"median simple {simple:.0f}ms, pruned {pruned:.0f}ms; output chars reduced {output_ratio:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Chroma HNSW 参数基准测试
+在 financial_terms_full.csv 的向量上比较不同 hnsw:space / M / construction_ef / search_ef 的
+recall@k（以精确余弦检索为基准）与 p50/p99 查询延迟
+"""
+
+import sys
+import time
+import argparse
+import logging
+from pathlib import Path
+
+import numpy as np
+import chromadb
+from chromadb.config import Settings
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from tools.build_financial_vectordb import FinancialVectorDBBuilder
+from utils.embedding_artifact import EmbeddingArtifactStore
+from utils.index_config import save_chroma_hnsw_config
+from utils.vector_store import NumpyVectorStore
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SPACES = ("l2", "cosine")
+M_VALUES = (8, 16, 32)
+CONSTRUCTION_EF_VALUES = (100, 200)
+SEARCH_EF_VALUES = (10, 32, 64, 128)
+
+
+def load_vectors(data_path, artifact_dir, model_name):
+    """从向量产物加载金融术语向量（产物不存在时生成一次）"""
+    builder = FinancialVectorDBBuilder(model_name=model_name, artifact_store=EmbeddingArtifactStore(artifact_dir))
+    data_df = builder.load_financial_data(data_path)
+    artifact = builder.prepare_artifact(data_path, data_df)
+    return np.asarray(artifact.vectors, dtype=np.float32)
+
+
+def run_config(base, queries, truth, space, m, construction_ef, search_ef, top_k):
+    """在内存集合上测量单组 HNSW 参数"""
+    client = chromadb.EphemeralClient(settings=Settings(anonymized_telemetry=False, allow_reset=True))
+    collection = client.create_collection(
+        name=f"bench_{space}_{m}_{construction_ef}_{search_ef}",
+        metadata={
+            "hnsw:space": space,
+            "hnsw:M": m,
+            "hnsw:construction_ef": construction_ef,
+            "hnsw:search_ef": search_ef,
+        }
+    )
+    build_start = time.perf_counter()
+    batch_size = 1000
+    for start in range(0, len(base), batch_size):
+        chunk = base[start:start + batch_size]
+        collection.add(ids=[str(start + i) for i in range(len(chunk))], embeddings=chunk)
+    build_seconds = time.perf_counter() - build_start
+
+    latencies = []
+    found = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=top_k, include=[])
+        latencies.append((time.perf_counter() - start) * 1000)
+        found += len({int(i) for i in result["ids"][0]} & set(expected))
+    client.reset()
+
+    latencies = np.array(latencies)
+    return {
+        "hnsw:space": space,
+        "hnsw:M": m,
+        "hnsw:construction_ef": construction_ef,
+        "hnsw:search_ef": search_ef,
+        "recall_at_k": found / (len(truth) * top_k),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "build_seconds": round(build_seconds, 3),
+    }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="Chroma HNSW 参数基准测试")
+    parser.add_argument("--data-path", default="backend/data/financial_terms_full.csv", help="金融术语数据")
+    parser.add_argument("--artifact-dir", default="backend/artifacts/embeddings", help="向量产物目录")
+    parser.add_argument("--model", default="BAAI/bge-m3", help="嵌入模型名称")
+    parser.add_argument("--num-queries", type=int, default=300, help="留出查询集大小")
+    parser.add_argument("--top-k", type=int, default=5, help="recall@k 中的 k")
+    parser.add_argument("--min-recall", type=float, default=0.98, help="选择配置时要求的最低召回率")
+    parser.add_argument("--collection", default="financial_concepts", help="--save 时配置对应的集合")
+    parser.add_argument("--save", action="store_true", help="把选中的配置写入 config/chroma_index.json")
+    args = parser.parse_args()
+
+    vectors = load_vectors(args.data_path, args.artifact_dir, args.model)
+    rng = np.random.default_rng(42)
+    query_rows = rng.choice(len(vectors), size=min(args.num_queries, len(vectors) // 10), replace=False)
+    mask = np.ones(len(vectors), dtype=bool)
+    mask[query_rows] = False
+    base, queries = vectors[mask], vectors[query_rows]
+
+    # 精确余弦检索作为基准
+    exact = NumpyVectorStore(base, [str(i) for i in range(len(base))], [{}] * len(base), metric="cosine")
+    truth = [[row for row, _ in hits] for hits in exact.topk(queries, args.top_k)]
+    logger.info(f"底库 {len(base)} 条，查询 {len(queries)} 条")
+
+    results = []
+    for space in SPACES:
+        for m in M_VALUES:
+            for construction_ef in CONSTRUCTION_EF_VALUES:
+                for search_ef in SEARCH_EF_VALUES:
+                    row = run_config(base, queries, truth, space, m, construction_ef, search_ef, args.top_k)
+                    results.append(row)
+                    logger.info(
+                        f"space={space:<6} M={m:<3} construction_ef={construction_ef:<4} search_ef={search_ef:<4} "
+                        f"recall@{args.top_k}={row['recall_at_k']:.4f} "
+                        f"p50={row['p50_ms']:.2f}ms p99={row['p99_ms']:.2f}ms build={row['build_seconds']:.1f}s"
+                    )
+
+    eligible = [r for r in results if r["recall_at_k"] >= args.min_recall and r["hnsw:space"] == "cosine"]
+    choice = min(eligible, key=lambda r: (r["p50_ms"], r["p99_ms"])) if eligible else \
+        max(results, key=lambda r: (r["recall_at_k"], -r["p50_ms"]))
+    logger.info(f"选中配置: {choice}")
+
+    if args.save:
+        save_chroma_hnsw_config(args.collection, {
+            **choice,
+            "min_recall": args.min_recall,
+            "num_vectors": int(len(vectors)),
+            "num_queries": int(len(queries)),
+            "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        })
+
+
+if __name__ == "__main__":
+    main()
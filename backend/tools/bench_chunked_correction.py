@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+分块拼写纠正基准测试
+对同一批病历分别执行整篇单次纠正（correct_spelling）和分块并发纠正（correct_spelling_chunked），
+比较实际耗时与加速比
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+import logging
+import statistics
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from services.corr_service import CorrService
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def load_notes(path, separator):
+    """读取病历文件：多篇病历之间用单独一行的分隔符隔开"""
+    text = Path(path).read_text(encoding="utf-8")
+    notes = [note.strip() for note in text.split(f"\n{separator}\n")]
+    return [note for note in notes if note]
+
+
+def bench_note(service, note, llm_options, concurrency, max_chunk_chars):
+    """测量单篇病历两种方式的耗时（毫秒）"""
+    start = time.perf_counter()
+    service.correct_spelling(note, llm_options)
+    single_ms = (time.perf_counter() - start) * 1000
+
+    result = asyncio.run(service.correct_spelling_chunked(
+        note, llm_options, max_concurrency=concurrency, max_chunk_chars=max_chunk_chars
+    ))
+    statuses = [chunk["status"] for chunk in result["chunks"]]
+    return {
+        "chars": len(note),
+        "chunks": len(statuses),
+        "skipped": statuses.count("skipped") + statuses.count("duplicate"),
+        "rejected": statuses.count("rejected"),
+        "single_ms": single_ms,
+        "chunked_ms": result["timings"]["total_ms"],
+    }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="比较整篇与分块并发拼写纠正的耗时")
+    parser.add_argument("notes", help="病历文本文件")
+    parser.add_argument("--separator", default="=====", help="病历之间的分隔行")
+    parser.add_argument("--provider", default="ollama", help="LLM 提供商")
+    parser.add_argument("--model", default="llama3.1:8b", help="LLM 模型")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8], help="并发上限")
+    parser.add_argument("--max-chunk-chars", type=int, default=600, help="分块的最大字符数")
+    args = parser.parse_args()
+
+    notes = load_notes(args.notes, args.separator)
+    logger.info(f"加载 {len(notes)} 篇病历，平均 {statistics.mean(len(n) for n in notes):.0f} 字符")
+    service = CorrService()
+    llm_options = {"provider": args.provider, "model": args.model}
+
+    print(f"{'concurrency':>11} {'chunks':>7} {'skipped':>8} {'rejected':>9} "
+          f"{'single p50':>11} {'chunked p50':>12} {'speedup':>8}")
+    for concurrency in args.concurrency:
+        rows = [bench_note(service, note, llm_options, concurrency, args.max_chunk_chars) for note in notes]
+        single = statistics.median(row["single_ms"] for row in rows)
+        chunked = statistics.median(row["chunked_ms"] for row in rows)
+        speedup = statistics.median(row["single_ms"] / row["chunked_ms"] for row in rows if row["chunked_ms"] > 0)
+        print(f"{concurrency:>11} {sum(r['chunks'] for r in rows):>7} {sum(r['skipped'] for r in rows):>8} "
+              f"{sum(r['rejected'] for r in rows):>9} {single:>9.0f}ms {chunked:>10.0f}ms {speedup:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
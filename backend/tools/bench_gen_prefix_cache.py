@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+文本生成前缀缓存基准测试
+按 GenService 的提示模板渲染提示，直接调用 Ollama /api/generate，比较每个方法在
+- no_reuse: 提示开头加一行随机内容，前缀无法复用（相当于模型被卸载或前缀不稳定）
+- reuse: 稳定的系统指令前缀 + 最后的患者数据，模型常驻（keep_alive）
+两种情况下的提示处理 token 数（prompt_eval_count）与耗时（prompt_eval_duration），报告节省的提示处理时间
+"""
+
+import sys
+import json
+import uuid
+import argparse
+import logging
+import statistics
+import urllib.request
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from services.gen_service import GenService
+from utils.llm_pool import OLLAMA_KEEP_ALIVE, OLLAMA_NUM_CTX
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 内置的测试病例，可用 --cases 指定 JSON 文件替换（格式相同）
+DEFAULT_CASES = [
+    {
+        "patient_info": {"name": "Patient A", "age": 64, "gender": "M", "medicalHistory": "Hypertension, type 2 diabetes"},
+        "symptoms": ["chest pain radiating to left arm", "shortness of breath", "diaphoresis"],
+        "diagnosis": "Acute coronary syndrome",
+        "treatment": "Aspirin, nitroglycerin, cardiology consult"
+    },
+    {
+        "patient_info": {"name": "Patient B", "age": 31, "gender": "F", "medicalHistory": "Asthma"},
+        "symptoms": ["wheezing", "productive cough", "fever for 3 days"],
+        "diagnosis": "Community-acquired pneumonia",
+        "treatment": "Amoxicillin, inhaled bronchodilator"
+    },
+    {
+        "patient_info": {"name": "Patient C", "age": 78, "gender": "F", "medicalHistory": "Atrial fibrillation on warfarin"},
+        "symptoms": ["sudden confusion", "right-sided weakness", "slurred speech"],
+        "diagnosis": "Ischemic stroke",
+        "treatment": "Stroke team activation, CT head, hold anticoagulation"
+    },
+    {
+        "patient_info": {"name": "Patient D", "age": 45, "gender": "M", "medicalHistory": "None"},
+        "symptoms": ["epigastric pain after meals", "nausea", "black stools"],
+        "diagnosis": "Peptic ulcer disease with upper GI bleeding",
+        "treatment": "IV proton pump inhibitor, endoscopy"
+    },
+]
+
+
+def method_inputs(method, case):
+    """与 GenService 各方法传给提示模板的变量相同"""
+    patient_info = str(case["patient_info"])
+    symptoms = "\n".join(case["symptoms"])
+    if method == "generate_medical_note":
+        return {"patient_info": patient_info, "symptoms": symptoms,
+                "diagnosis": case["diagnosis"], "treatment": case["treatment"]}
+    if method == "generate_differential_diagnosis":
+        return {"symptoms": symptoms}
+    return {"diagnosis": case["diagnosis"], "patient_info": patient_info}
+
+
+def generate(base_url, model, prompt, num_predict):
+    """调用 /api/generate（非流式），返回 Ollama 的计时字段"""
+    options = {"num_predict": num_predict, "temperature": 0}
+    if OLLAMA_NUM_CTX:
+        options["num_ctx"] = OLLAMA_NUM_CTX
+    body = json.dumps({
+        "model": model, "prompt": prompt, "stream": False, "keep_alive": OLLAMA_KEEP_ALIVE, "options": options
+    }).encode("utf-8")
+    request = urllib.request.Request(f"{base_url}/api/generate", data=body,
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=600) as response:
+        result = json.loads(response.read())
+    return {
+        "prompt_tokens": result.get("prompt_eval_count", 0),
+        "prompt_ms": result.get("prompt_eval_duration", 0) / 1e6,
+        "load_ms": result.get("load_duration", 0) / 1e6,
+    }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="测量 GenService 提示前缀复用节省的提示处理时间")
+    parser.add_argument("--base-url", default="http://localhost:11434", help="Ollama 地址")
+    parser.add_argument("--model", default="llama3.1:8b", help="Ollama 模型")
+    parser.add_argument("--cases", default=None, help="测试病例 JSON 文件（列表，格式同内置病例）")
+    parser.add_argument("--repeat", type=int, default=2, help="每个病例重复次数")
+    parser.add_argument("--num-predict", type=int, default=16, help="每次生成的 token 数（只测提示处理，取较小值）")
+    args = parser.parse_args()
+
+    cases = json.loads(Path(args.cases).read_text(encoding="utf-8")) if args.cases else DEFAULT_CASES
+    prompts = {
+        method: [template.format_prompt(**method_inputs(method, case)).to_string() for case in cases]
+        for method, template in GenService.PROMPTS.items()
+    }
+
+    # 预热：加载模型
+    generate(args.base_url, args.model, "ping", 1)
+    print(f"{'method':>32} {'mode':>9} {'prompt_tokens':>14} {'prompt_ms':>10} {'load_ms':>8}")
+    for method, rendered in prompts.items():
+        results = {"no_reuse": [], "reuse": []}
+        for _ in range(args.repeat):
+            for i, prompt in enumerate(rendered):
+                # 开头的随机内容使前缀与缓存中的任何提示都不同
+                results["no_reuse"].append(generate(args.base_url, args.model, f"[{uuid.uuid4()}]\n{prompt}",
+                                                    args.num_predict))
+                # 先处理一次相同前缀的提示（同方法的下一个病例），再测量
+                generate(args.base_url, args.model, rendered[(i + 1) % len(rendered)], args.num_predict)
+                results["reuse"].append(generate(args.base_url, args.model, prompt, args.num_predict))
+
+        summary = {}
+        for mode, runs in results.items():
+            summary[mode] = {key: statistics.mean(run[key] for run in runs) for key in runs[0]}
+            print(f"{method:>32} {mode:>9} {summary[mode]['prompt_tokens']:>14.1f} "
+                  f"{summary[mode]['prompt_ms']:>10.1f} {summary[mode]['load_ms']:>8.1f}")
+        saved_ms = summary["no_reuse"]["prompt_ms"] - summary["reuse"]["prompt_ms"]
+        saved_share = saved_ms / summary["no_reuse"]["prompt_ms"] if summary["no_reuse"]["prompt_ms"] else 0.0
+        print(f"{method:>32} {'saved':>9} {summary['no_reuse']['prompt_tokens'] - summary['reuse']['prompt_tokens']:>14.1f} "
+              f"{saved_ms:>10.1f} {saved_share:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Ollama 后端池基准测试
+在本地启动多个模拟 Ollama 服务（耗时分布可配置），经由 BackendPool 并发发出请求，
+比较单后端、负载均衡和负载均衡 + 对冲三种方式的尾延迟，以及对冲产生的额外请求与被取消的生成数
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+sys.path.append(str(Path(__file__).parent))
+
+from utils.llm_pool import BackendPool, HEDGE_MIN_SAMPLES
+from fake_ollama import FakeOllama, LatencyModel
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def raw_generate(url, model, prompt):
+    """不依赖 langchain 的最小流式客户端（被取消时关闭连接，与 Ollama 客户端行为一致）"""
+    host, port = url.split("//")[1].split(":")
+    reader, writer = await asyncio.open_connection(host, int(port))
+    try:
+        body = json.dumps({"model": model, "prompt": prompt, "stream": True}).encode("utf-8")
+        writer.write(
+            f"POST /api/generate HTTP/1.0\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode("utf-8") + body
+        )
+        await writer.drain()
+        status = (await reader.readline()).decode("utf-8")
+        if " 200 " not in status:
+            raise RuntimeError(f"Ollama error: {status.strip()}")
+        while (await reader.readline()).strip():
+            pass
+        text = []
+        while line := await reader.readline():
+            chunk = json.loads(line)
+            text.append(chunk.get("response", ""))
+            if chunk.get("done"):
+                break
+        return "".join(text)
+    finally:
+        writer.close()
+
+
+def make_call(pool, client):
+    if client == "langchain":
+        llm = pool.as_llm()
+        return lambda i: llm.ainvoke(f"request {i}")
+    return lambda i: pool.run(lambda url: raw_generate(url, pool.model, f"request {i}"))
+
+
+async def run_load(pool, client, requests, concurrency):
+    """并发执行 requests 个请求，返回每个请求的耗时（秒）"""
+    call = make_call(pool, client)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            started_at = time.perf_counter()
+            await call(i)
+            latencies.append(time.perf_counter() - started_at)
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return sorted(latencies)
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="比较多后端负载均衡与对冲请求的尾延迟")
+    parser.add_argument("--backends", nargs="+", default=["0.3:0.3:0.05:8", "0.3:0.3:0.05:8", "0.3:0.3:0.05:8"],
+                        help="每个模拟后端的耗时分布 MEDIAN[:SIGMA[:TAIL_PROBABILITY[:TAIL_FACTOR]]]")
+    parser.add_argument("--requests", type=int, default=200, help="每种方式的请求数")
+    parser.add_argument("--concurrency", type=int, default=6, help="并发请求数")
+    parser.add_argument("--parallel", type=int, default=2, help="每个模拟后端同时生成的响应数（OLLAMA_NUM_PARALLEL）")
+    parser.add_argument("--quantile", type=float, default=0.95, help="对冲阈值的分位数")
+    parser.add_argument("--client", choices=["raw", "langchain"], default="raw",
+                        help="raw: 内置最小客户端；langchain: 服务实际使用的 Ollama 客户端")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    servers = [FakeOllama(latency=LatencyModel.parse(spec, seed=args.seed + i), parallel=args.parallel).start()
+               for i, spec in enumerate(args.backends)]
+    urls = [server.url for server in servers]
+    for server in servers:
+        logger.info(f"模拟 Ollama: {server.url} ({server.latency})")
+
+    scenarios = [
+        ("single", BackendPool("fake", urls[:1], hedge=False)),
+        ("balanced", BackendPool("fake", urls, hedge=False)),
+        ("hedged", BackendPool("fake", urls, hedge=True, hedge_quantile=args.quantile)),
+    ]
+    print(f"{'mode':>10} {'p50_ms':>9} {'p95_ms':>9} {'p99_ms':>9} {'max_ms':>9} {'hedged':>7} {'wins':>5} {'cancelled':>9}")
+    for name, pool in scenarios:
+        # 预热：积累对冲阈值所需的耗时样本
+        asyncio.run(run_load(pool, args.client, HEDGE_MIN_SAMPLES, args.concurrency))
+        pool.stats.update(requests=0, hedged=0, hedge_wins=0)
+        cancelled_before = sum(server.stats["cancelled"] for server in servers)
+
+        latencies = asyncio.run(run_load(pool, args.client, args.requests, args.concurrency))
+        time.sleep(0.2)  # 等待服务端记录被取消的生成
+        cancelled = sum(server.stats["cancelled"] for server in servers) - cancelled_before
+        print(f"{name:>10} {percentile(latencies, 0.5):>9.1f} {percentile(latencies, 0.95):>9.1f} "
+              f"{percentile(latencies, 0.99):>9.1f} {latencies[-1] * 1000:>9.1f} "
+              f"{pool.stats['hedged']:>7} {pool.stats['hedge_wins']:>5} {cancelled:>9}")
+        logger.info(f"{name}: {json.dumps(pool.snapshot()['backends'], ensure_ascii=False)}")
+
+    for server in servers:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
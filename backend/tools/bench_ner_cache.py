@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+NER 句子缓存基准测试
+对同一批病历分别执行整篇识别（关闭句子缓存）和句子级缓存识别，比较耗时、缓存命中率，
+并检查两种方式识别出的实体是否一致（句子级识别时模型看不到跨句上下文，少数实体可能不同）
+"""
+
+import sys
+import time
+import argparse
+import logging
+import statistics
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+import utils.ner_cache as ner_cache
+from services.ner_service import NERService
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def load_notes(path, separator):
+    """读取病历文件：多篇病历之间用单独一行的分隔符隔开"""
+    text = Path(path).read_text(encoding="utf-8")
+    notes = [note.strip() for note in text.split(f"\n{separator}\n")]
+    return [note for note in notes if note]
+
+
+def run(service, notes, options, term_types):
+    """依次处理全部病历，返回每篇的耗时（毫秒）和实体 (start, end, entity_group)"""
+    latencies, entities = [], []
+    for note in notes:
+        start = time.perf_counter()
+        result = service.process(note, dict(options), term_types)
+        latencies.append((time.perf_counter() - start) * 1000)
+        entities.append([(e["start"], e["end"], e["entity_group"]) for e in result["entities"]])
+    return latencies, entities
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="比较整篇识别与句子级缓存识别的耗时")
+    parser.add_argument("notes", help="病历文本文件")
+    parser.add_argument("--separator", default="=====", help="病历之间的分隔行")
+    parser.add_argument("--passes", type=int, default=2, help="缓存模式下重复处理整批病历的次数（第一遍为冷缓存）")
+    args = parser.parse_args()
+
+    notes = load_notes(args.notes, args.separator)
+    logger.info(f"加载 {len(notes)} 篇病历，平均 {statistics.mean(len(n) for n in notes):.0f} 字符")
+    service = NERService()
+    options = {"combineBioStructure": True}
+    term_types = {"allMedicalTerms": True}
+
+    ner_cache.NER_SENTENCE_CACHE_ENABLED = False
+    full_ms, full_entities = run(service, notes, options, term_types)
+    print(f"{'mode':>10} {'p50_ms':>9} {'mean_ms':>9} {'hit_rate':>9} {'same':>6}")
+    print(f"{'full':>10} {statistics.median(full_ms):>9.1f} {statistics.mean(full_ms):>9.1f} {'-':>9} {'-':>6}")
+
+    ner_cache.NER_SENTENCE_CACHE_ENABLED = True
+    for i in range(args.passes):
+        before = dict(ner_cache.get_sentence_cache().stats)
+        cached_ms, cached_entities = run(service, notes, options, term_types)
+        after = ner_cache.get_sentence_cache().stats
+        hits = after["hits"] + after["disk_hits"] - before["hits"] - before["disk_hits"]
+        lookups = hits + after["misses"] - before["misses"]
+        same = sum(a == b for a, b in zip(full_entities, cached_entities))
+        print(f"{f'cached#{i + 1}':>10} {statistics.median(cached_ms):>9.1f} {statistics.mean(cached_ms):>9.1f} "
+              f"{hits / lookups if lookups else 0.0:>9.1%} {same:>3}/{len(notes):<2}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+NER 后处理基准测试
+在同一批模型输出上分别执行原来基于 dict 的后处理和 utils.ner_postprocess 的实现，逐条检查结果完全一致，并比较耗时
+
+两种实现都从句子缓存中的实体（偏移相对于句子）开始：原来的实现先复制为平移偏移后的 dict，
+再合并生物结构、移除重叠、按类型过滤；新实现直接引用原 dict 构造 Entity，只为保留下来的实体生成 dict。
+offset 为 0 对应整篇文本交给模型（或句子位于文首），不为 0 对应句子缓存中需要平移偏移的句子
+
+语料为 JSONL，每行 {"text": ..., "entities": 模型输出的实体列表}；未指定时生成随机语料
+（包含嵌套、部分重叠、相同区间不同得分、零长度实体等边界情况）
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import logging
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from utils.ner_postprocess import Entity, allowed_groups, combine_bio_structure, postprocess
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MEDICAL_GROUPS = ['SIGN_SYMPTOM', 'DISEASE_DISORDER', 'BIOLOGICAL_STRUCTURE', 'THERAPEUTIC_PROCEDURE',
+                  'MEDICATION', 'DIAGNOSTIC_PROCEDURE']
+TERM_TYPES = [
+    {'allMedicalTerms': True},
+    {'allMedicalTerms': False},
+    {'symptom': True},
+    {'disease': True, 'therapeuticProcedure': True},
+]
+MEDICAL_TERM_GROUPS = {
+    'symptom': ('SIGN_SYMPTOM', 'COMBINED_BIO_SYMPTOM'),
+    'disease': ('DISEASE_DISORDER',),
+    'therapeuticProcedure': ('THERAPEUTIC_PROCEDURE',),
+}
+
+
+# ---- 原来的实现（NERService 中基于 dict 的版本），作为对照 ----
+
+def legacy_combine(result, text, options):
+    combined_result = []
+    i = 0
+    while i < len(result):
+        entity = result[i]
+        entity['score'] = float(entity['score'])
+        if options['combineBioStructure'] and entity['entity_group'] in ['SIGN_SYMPTOM', 'DISEASE_DISORDER']:
+            combined = None
+            if i > 0 and result[i - 1]['entity_group'] == 'BIOLOGICAL_STRUCTURE':
+                combined = legacy_create_combined(result[i - 1], result[i], text)
+            elif i < len(result) - 1 and result[i + 1]['entity_group'] == 'BIOLOGICAL_STRUCTURE':
+                combined = legacy_create_combined(result[i], result[i + 1], text)
+            if combined:
+                combined_result.append(combined)
+                i += 1
+                continue
+        combined_result.append(entity)
+        i += 1
+    return combined_result
+
+
+def legacy_create_combined(entity1, entity2, text):
+    start = min(entity1['start'], entity2['start'])
+    end = max(entity1['end'], entity2['end'])
+    return {
+        'entity_group': 'COMBINED_BIO_SYMPTOM',
+        'word': text[start:end],
+        'start': start,
+        'end': end,
+        'score': (entity1['score'] + entity2['score']) / 2,
+        'original_entities': [entity1, entity2]
+    }
+
+
+def legacy_remove_overlapping(entities):
+    sorted_entities = sorted(entities, key=lambda x: (x['start'], -x['end'], -x['score']))
+    non_overlapping = []
+    last_end = -1
+    i = 0
+    while i < len(sorted_entities):
+        current = sorted_entities[i]
+        if current['start'] >= last_end:
+            non_overlapping.append(current)
+            last_end = current['end']
+            i += 1
+        else:
+            same_span = [current]
+            j = i + 1
+            while j < len(sorted_entities) and sorted_entities[j]['start'] == current['start'] and \
+                    sorted_entities[j]['end'] == current['end']:
+                same_span.append(sorted_entities[j])
+                j += 1
+            best_entity = max(same_span, key=lambda x: x['score'])
+            if best_entity['end'] > last_end:
+                non_overlapping.append(best_entity)
+                last_end = best_entity['end']
+            i = j
+    return non_overlapping
+
+
+def legacy_filter(entities, term_types):
+    filtered_result = []
+    for entity in entities:
+        if term_types.get('allMedicalTerms', False):
+            filtered_result.append(entity)
+        elif (term_types.get('symptom', False) and entity['entity_group'] in ['SIGN_SYMPTOM', 'COMBINED_BIO_SYMPTOM']) or \
+             (term_types.get('disease', False) and entity['entity_group'] == 'DISEASE_DISORDER') or \
+             (term_types.get('therapeuticProcedure', False) and entity['entity_group'] == 'THERAPEUTIC_PROCEDURE'):
+            filtered_result.append(entity)
+    return filtered_result
+
+
+def legacy_process(text, entities, options, term_types, offset=0):
+    entities = [{**entity, 'start': entity['start'] + offset, 'end': entity['end'] + offset} for entity in entities]
+    combined = legacy_combine(entities, text, options)
+    return legacy_filter(legacy_remove_overlapping(combined), term_types)
+
+
+# ---- 新实现（与 NERService.process 的步骤相同） ----
+
+def current_process(text, entities, options, term_types, offset=0):
+    result = Entity.from_dicts(entities, offset)
+    if result and options['combineBioStructure']:
+        result = combine_bio_structure(result, text)
+    return postprocess(result, allowed_groups(term_types, MEDICAL_TERM_GROUPS, 'allMedicalTerms'))
+
+
+def random_document(rng, length):
+    """随机生成文本和按开始位置排列的模型输出（与 aggregation_strategy='simple' 的输出格式相同）"""
+    text = "".join(rng.choice("abcdefgh ") for _ in range(length))
+    entities, pos = [], 0
+    while pos < length - 1:
+        start = pos + rng.randint(0, 6)
+        end = min(length, start + rng.randint(0, 12))
+        entity = {'entity_group': rng.choice(MEDICAL_GROUPS), 'score': rng.choice([0.5, 0.75, 0.9, rng.random()]),
+                  'word': text[start:end], 'start': start, 'end': end}
+        entities.append(entity)
+        if rng.random() < 0.15:
+            # 相同区间、不同类型（或相同得分）的实体
+            entities.append({**entity, 'entity_group': rng.choice(MEDICAL_GROUPS),
+                             'score': rng.choice([entity['score'], rng.random()])})
+        # 多数情况下不重叠，部分嵌套或部分重叠
+        pos = end if rng.random() < 0.7 else start + rng.randint(0, max(1, end - start))
+    return {"text": text, "entities": entities}
+
+
+def load_corpus(path, documents, length, seed):
+    if path:
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    rng = random.Random(seed)
+    return [random_document(rng, length) for _ in range(documents)]
+
+
+def run(fn, corpus, options, term_types, offset):
+    """处理整个语料一次，返回结果和耗时（毫秒）"""
+    started_at = time.perf_counter()
+    outputs = [fn(document["text"], document["entities"], options, term_types, offset) for document in corpus]
+    return outputs, (time.perf_counter() - started_at) * 1000
+
+
+def timed(corpus, options, term_types, offset, repeat):
+    """两种实现交替处理整个语料 repeat 次（减少机器负载波动的影响），返回两者的结果和各自的最短耗时（毫秒）"""
+    legacy_best = new_best = float("inf")
+    for _ in range(repeat):
+        expected, legacy_ms = run(legacy_process, corpus, options, term_types, offset)
+        actual, new_ms = run(current_process, corpus, options, term_types, offset)
+        legacy_best, new_best = min(legacy_best, legacy_ms), min(new_best, new_ms)
+    return expected, legacy_best, actual, new_best
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="检查 NER 后处理新旧实现结果一致并比较耗时")
+    parser.add_argument("--corpus", default=None, help="模型输出语料（JSONL），未指定时随机生成")
+    parser.add_argument("--documents", type=int, default=500, help="随机语料的文档数")
+    parser.add_argument("--length", type=int, default=5000, help="随机文档的字符数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--offset", type=int, default=120, help="模拟句子在全文中的位置（平移偏移）")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数（取最短耗时）")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus, args.documents, args.length, args.seed)
+    logger.info(f"{len(corpus)} 篇文档，共 {sum(len(d['entities']) for d in corpus)} 个实体")
+
+    print(f"{'offset':>6} {'combine':>8} {'term_types':>45} {'legacy_ms':>10} {'new_ms':>8} {'speedup':>8} "
+          f"{'identical':>10}")
+    mismatches = 0
+    for offset in (0, args.offset):
+        for combine in (False, True):
+            options = {'combineBioStructure': combine}
+            for term_types in TERM_TYPES:
+                expected, legacy_ms, actual, new_ms = timed(corpus, options, term_types, offset, args.repeat)
+                identical = sum(a == b for a, b in zip(expected, actual))
+                mismatches += len(corpus) - identical
+                print(f"{offset:>6} {str(combine):>8} {json.dumps(term_types):>45} {legacy_ms:>10.1f} {new_ms:>8.1f} "
+                      f"{legacy_ms / new_ms if new_ms else 0.0:>7.2f}x {identical:>5}/{len(corpus):<4}")
+    if mismatches:
+        logger.error(f"{mismatches} 篇文档的结果与原来的实现不一致")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
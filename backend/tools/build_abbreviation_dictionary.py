@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+缩写词典离线挖掘工具
+从 SNOMED 概念名称 / FSN、Neo4j 中的 Description 节点和人工整理的列表中挖掘
+缩写 -> 扩展 / 概念ID 的映射，按证据计分排序并标注歧义，写出 AbbrService 使用的词典
+"""
+
+import os
+import re
+import sys
+import argparse
+import logging
+from pathlib import Path
+
+import pandas as pd
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from utils.abbreviation_dictionary import (
+    AbbreviationDictionary, DEFAULT_ABBREVIATION_DICT_PATH, DEFAULT_CURATED_ABBREVIATIONS_PATH,
+    curated_abbreviations, curated_ambiguous, curated_evidence, is_abbreviation_like
+)
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 括号中的缩写：World Health Organization (WHO)
+_PAREN_ABBR_RE = re.compile(r"\(([A-Z][A-Za-z0-9/&+-]{1,11})\)")
+# 缩写在前：SOB - Shortness of breath
+_LEADING_ABBR_RE = re.compile(r"^([A-Z][A-Za-z0-9/&+-]{1,11}) - (.+)$")
+# 缩写在后：Shortness of breath - SOB
+_TRAILING_ABBR_RE = re.compile(r"^(.+) - ([A-Z][A-Za-z0-9/&+-]{1,11})$")
+# 整个描述就是一个缩写（如 Dyspnea 的同义词 SOB）
+_WHOLE_ABBR_RE = re.compile(r"^[A-Z][A-Za-z0-9/&+-]{1,11}$")
+# FSN 末尾的语义标签：(disorder)、(procedure)
+_SEMANTIC_TAG_RE = re.compile(r"\s*\([a-z /]+\)$")
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+_STOPWORDS = {"a", "an", "and", "by", "for", "in", "of", "on", "the", "to", "with"}
+
+
+def _letters(abbreviation):
+    return [c.lower() for c in abbreviation if c.isalpha()]
+
+
+def _initials_match(words, letters):
+    return len(words) == len(letters) and all(w[0].lower() == c for w, c in zip(words, letters))
+
+
+def _window_matches(words, letters):
+    """
+    窗口以实词开头，且全部单词（SOB = Shortness Of Breath）或只算实词
+    （WHO = World Health Organization）的首字母与缩写字母一一对应
+    """
+    if not words or words[0].lower() in _STOPWORDS:
+        return False
+    content = [w for w in words if w.lower() not in _STOPWORDS]
+    return _initials_match(words, letters) or _initials_match(content, letters)
+
+
+def expansion_before(prefix, abbreviation):
+    """在缩写前的文本末尾寻找首字母匹配的扩展"""
+    letters = _letters(abbreviation)
+    words = list(_WORD_RE.finditer(prefix))
+    for m in range(len(letters), min(len(letters) + 4, len(words)) + 1):
+        window = words[-m:]
+        if _window_matches([w.group() for w in window], letters):
+            return prefix[window[0].start():window[-1].end()]
+    return None
+
+
+def expansion_after(rest, abbreviation):
+    """在缩写后的文本开头寻找首字母匹配的扩展"""
+    letters = _letters(abbreviation)
+    words = list(_WORD_RE.finditer(rest))
+    for m in range(len(letters), min(len(letters) + 4, len(words)) + 1):
+        window = words[:m]
+        if _window_matches([w.group() for w in window], letters):
+            return rest[window[0].start():window[-1].end()]
+    return None
+
+
+def mine_terms(concept_id, preferred_name, terms, name_index, source):
+    """
+    从单个概念的全部描述中挖掘缩写证据
+
+    Yields:
+        (缩写, 扩展, 概念ID或None, 来源, 权重)
+    """
+    preferred_name = _SEMANTIC_TAG_RE.sub("", str(preferred_name)).strip()
+    for term in terms:
+        term = _SEMANTIC_TAG_RE.sub("", str(term)).strip()
+        if not term or term == "NA":
+            continue
+
+        # 描述本身就是缩写：缩写 -> 概念首选名称
+        if _WHOLE_ABBR_RE.match(term):
+            if is_abbreviation_like(term) and preferred_name and not is_abbreviation_like(preferred_name) \
+                    and len(preferred_name) > len(term):
+                yield term, preferred_name, concept_id, source, 1.0
+            continue
+
+        # 描述中显式给出的缩写：扩展按首字母匹配，概念ID按扩展名称查找
+        for match in _PAREN_ABBR_RE.finditer(term):
+            abbreviation = match.group(1)
+            if not is_abbreviation_like(abbreviation):
+                continue
+            expansion = expansion_before(term[:match.start()], abbreviation)
+            if expansion:
+                yield abbreviation, expansion, name_index.get(expansion.lower()), source, 1.0
+
+        leading = _LEADING_ABBR_RE.match(term)
+        if leading and is_abbreviation_like(leading.group(1)):
+            expansion = expansion_after(leading.group(2), leading.group(1))
+            if expansion:
+                yield leading.group(1), expansion, name_index.get(expansion.lower()), source, 1.0
+
+        trailing = _TRAILING_ABBR_RE.match(term)
+        if trailing and is_abbreviation_like(trailing.group(2)):
+            expansion = expansion_before(trailing.group(1), trailing.group(2))
+            if expansion:
+                yield trailing.group(2), expansion, name_index.get(expansion.lower()), source, 1.0
+
+
+def iter_neo4j_descriptions(concept_codes, batch_size=1000):
+    """分批从 Neo4j 获取概念的全部描述（连接参数与 create_milvus_db_with_graph.py 相同）"""
+    from neo4j import GraphDatabase
+
+    driver = GraphDatabase.driver(
+        os.getenv("NEO4J_URI", "bolt://localhost:7687"),
+        auth=(os.getenv("NEO4J_USER", "neo4j"), os.getenv("NEO4J_PASSWORD", "neo4j"))
+    )
+    try:
+        for start in range(0, len(concept_codes), batch_size):
+            with driver.session() as session:
+                result = session.run("""
+                    UNWIND $codes AS code
+                    MATCH (c:ObjectConcept {id: code})-[:HAS_DESCRIPTION]->(d:Description)
+                    RETURN c.id AS concept_code, collect(d.term) AS terms
+                """, codes=concept_codes[start:start + batch_size])
+                for record in result:
+                    yield record["concept_code"], record["terms"]
+            logger.info(f"已读取 {min(start + batch_size, len(concept_codes))}/{len(concept_codes)} 个概念的描述")
+    finally:
+        driver.close()
+
+
+def build_dictionary(snomed_path, curated_path, use_neo4j=False):
+    """挖掘全部来源并构建词典"""
+    df = pd.read_csv(snomed_path, dtype=str, low_memory=False).fillna("NA")
+    logger.info(f"加载 {len(df)} 个 SNOMED 概念: {snomed_path}")
+
+    # 概念名称 -> 概念ID，用于给显式缩写和人工列表中的扩展补充概念ID
+    name_index = {}
+    for _, row in df.iterrows():
+        name_index.setdefault(str(row['concept_name']).lower(), str(row['concept_id']))
+
+    evidence = []
+    for _, row in df.iterrows():
+        terms = [row['concept_name']] + str(row.get('FSN', 'NA')).split("; ")
+        evidence.extend(mine_terms(str(row['concept_id']), row['concept_name'], terms, name_index, "snomed"))
+    logger.info(f"从 SNOMED 名称 / FSN 挖掘到 {len(evidence)} 条证据")
+
+    if use_neo4j:
+        code_to_row = {str(row['concept_code']): row for _, row in df.iterrows()}
+        before = len(evidence)
+        for code, terms in iter_neo4j_descriptions(list(code_to_row)):
+            row = code_to_row[code]
+            evidence.extend(mine_terms(str(row['concept_id']), row['concept_name'], terms, name_index, "neo4j"))
+        logger.info(f"从 Neo4j Description 挖掘到 {len(evidence) - before} 条证据")
+
+    for abbreviation, expansion, _, source, weight in curated_evidence(curated_path):
+        evidence.append((abbreviation, expansion, name_index.get(expansion.lower()), source, weight))
+
+    # 人工整理过的缩写以人工标注的歧义为准
+    dictionary = AbbreviationDictionary.from_evidence(
+        evidence, curated_ambiguous(curated_path), curated_abbreviations(curated_path)
+    )
+    ambiguous = sum(entry.ambiguous for entry in dictionary.entries.values())
+    logger.info(f"词典共 {len(dictionary)} 个缩写，其中 {ambiguous} 个有歧义")
+    return dictionary
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="挖掘缩写词典")
+    parser.add_argument("--snomed", default="backend/data/SNOMED_5000.csv", help="SNOMED 概念 CSV")
+    parser.add_argument("--curated", default=str(DEFAULT_CURATED_ABBREVIATIONS_PATH), help="人工整理的缩写列表")
+    parser.add_argument("--neo4j", action="store_true", help="同时从 Neo4j 的 Description 节点挖掘")
+    parser.add_argument("--output", default=str(DEFAULT_ABBREVIATION_DICT_PATH), help="输出词典路径")
+    args = parser.parse_args()
+
+    dictionary = build_dictionary(args.snomed, args.curated, use_neo4j=args.neo4j)
+    dictionary.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,17 +6,26 @@
 
 import os
 import sys
+import numpy as np
 import pandas as pd
 import chromadb
 from chromadb.config import Settings
 from sentence_transformers import SentenceTransformer
+import argparse
 import logging
+import time
+from contextlib import ExitStack
 from pathlib import Path
 
 # 添加项目根目录到路径
 project_root = Path(__file__).parent.parent
 sys.path.append(str(project_root))
 
+from utils.index_sync import content_hash, plan_sync, row_metadata
+from utils.embedding_artifact import EmbeddingArtifactStore
+from utils.index_config import get_chroma_hnsw_metadata
+from utils.lexical_index import LexicalIndex, lexical_index_path, lexical_text
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,19 +33,31 @@ logger = logging.getLogger(__name__)
 class FinancialVectorDBBuilder:
     """金融术语向量数据库构建器"""
     
-    def __init__(self, model_name="BAAI/bge-m3"):
+    def __init__(self, model_name="BAAI/bge-m3", chunk_size=1000, encode_batch_size=64,
+                 artifact_store=None, artifact_dtype="float32"):
         """
         初始化构建器
         
         Args:
             model_name: 嵌入模型名称
+            chunk_size: 流式构建时每块编码并写入的行数
+            encode_batch_size: 模型单次前向的批大小
+            artifact_store: 向量产物仓库（EmbeddingArtifactStore），为 None 时不读写产物
+            artifact_dtype: 新生成产物的存储精度 (float32/float16)
         """
         self.model_name = model_name
+        self.chunk_size = chunk_size
+        self.encode_batch_size = encode_batch_size
+        self.artifact_store = artifact_store
+        self.artifact_dtype = artifact_dtype
+        self.artifact = None
         self.model = None
         self.client = None
         
     def load_model(self):
-        """加载嵌入模型"""
+        """加载嵌入模型（已加载时直接返回）"""
+        if self.model is not None:
+            return
         try:
             logger.info(f"正在加载嵌入模型: {self.model_name}")
             self.model = SentenceTransformer(self.model_name)
@@ -75,8 +96,13 @@ class FinancialVectorDBBuilder:
             logger.error(f"数据加载失败: {e}")
             raise
     
-    def create_collection(self, collection_name, data_df):
-        """创建向量集合"""
+    def create_collection(self, collection_name, data_df, artifact_writer=None):
+        """
+        创建向量集合
+        
+        Args:
+            artifact_writer: 不为 None 时，编码出的每一块向量同时写入向量产物
+        """
         try:
             # 删除已存在的集合
             try:
@@ -85,70 +111,257 @@ class FinancialVectorDBBuilder:
             except:
                 pass
             
-            # 创建新集合
+            # 创建新集合（显式指定 cosine 空间和 HNSW 参数）
             collection = self.client.create_collection(
                 name=collection_name,
-                metadata={"description": "金融术语向量集合"}
+                metadata=self._collection_metadata(collection_name)
             )
             
-            # 准备数据
-            documents = []
-            metadatas = []
-            ids = []
-            
-            for idx, row in data_df.iterrows():
-                concept_id = str(row['conceptId'])
-                fsn = row['fsn']
-                domain_id = row['domainId']
-                
-                documents.append(fsn)
-                metadatas.append({
-                    'conceptId': concept_id,
-                    'domainId': domain_id,
-                    'active': str(row['active']),
-                    'effectiveTime': str(row['effectiveTime']),
-                })
-                ids.append(concept_id)
-            
-            # 生成向量
-            logger.info("正在生成向量嵌入...")
-            embeddings = self.model.encode(documents, convert_to_tensor=False).tolist()
-            
-            # 批量添加到集合
-            batch_size = 1000
-            for i in range(0, len(documents), batch_size):
-                end_idx = min(i + batch_size, len(documents))
-                
-                collection.add(
-                    embeddings=embeddings[i:end_idx],
-                    documents=documents[i:end_idx],
-                    metadatas=metadatas[i:end_idx],
-                    ids=ids[i:end_idx]
-                )
-                
-                logger.info(f"已处理 {end_idx}/{len(documents)} 条记录")
+            # 分块流式编码并写入，峰值内存只与 chunk_size 相关
+            total = self._write_in_chunks(collection.add, data_df, artifact_writer=artifact_writer)
             
-            logger.info(f"集合 {collection_name} 创建成功，共 {len(documents)} 条记录")
+            logger.info(f"集合 {collection_name} 创建成功，共 {total} 条记录")
             return collection
             
         except Exception as e:
             logger.error(f"集合创建失败: {e}")
             raise
     
-    def build_database(self, data_path, db_path, collection_name):
-        """构建完整的向量数据库"""
+    def _collection_metadata(self, collection_name):
+        """集合元数据：描述 + HNSW 配置（space / M / construction_ef / search_ef）"""
+        return {"description": "金融术语向量集合", **get_chroma_hnsw_metadata(collection_name)}
+    
+    def _write_in_chunks(self, write, data_df, chunk_size=None, artifact_writer=None):
+        """
+        分块编码并写入集合
+        
+        每块内按文本长度排序以减少 padding 浪费，向量直接以 numpy 数组传给 Chroma，
+        不再转换为 Python float 列表
+        
+        Args:
+            write: collection.add 或 collection.upsert，为 None 时只写入向量产物
+            data_df: 待写入的术语数据
+            chunk_size: 每块行数，默认使用 self.chunk_size
+            artifact_writer: 向量产物写入器，每块编码后按原顺序写入产物（行号与 data_df 一致）
+            
+        Returns:
+            写入的行数
+        """
+        chunk_size = chunk_size or self.chunk_size
+        total = len(data_df)
+        written = 0
+        start_time = time.perf_counter()
+        
+        for start in range(0, total, chunk_size):
+            chunk_df = data_df.iloc[start:start + chunk_size]
+            
+            # 块内按长度排序（ids/documents/metadatas 同步重排，写入顺序不影响结果）
+            chunk_rows = [row for _, row in chunk_df.iterrows()]
+            order = sorted(range(len(chunk_rows)), key=lambda i: len(str(chunk_rows[i]['fsn'])))
+            rows = [chunk_rows[i] for i in order]
+            documents = [str(row['fsn']) for row in rows]
+            ids = [str(row['conceptId']) for row in rows]
+            metadatas = [self._build_metadata(row) for row in rows]
+            
+            embeddings = self._embed(documents, ids)
+            
+            if write is not None:
+                write(
+                    embeddings=embeddings,
+                    documents=documents,
+                    metadatas=metadatas,
+                    ids=ids
+                )
+            
+            if artifact_writer is not None:
+                # 产物按 data_df 的行顺序保存，排序后的向量按原位置写回
+                vectors = np.empty_like(embeddings)
+                vectors[order] = embeddings
+                artifact_metadata = [None] * len(rows)
+                for pos, i in enumerate(order):
+                    # 额外保存 fsn，供 NumPy 检索后端直接从产物返回标准术语
+                    artifact_metadata[i] = dict(metadatas[pos], fsn=rows[pos]['fsn'])
+                artifact_writer.write(
+                    start,
+                    vectors,
+                    ids=[str(row['conceptId']) for row in chunk_rows],
+                    metadata=artifact_metadata
+                )
+            
+            written += len(rows)
+            elapsed = max(time.perf_counter() - start_time, 1e-9)
+            logger.info(f"已处理 {written}/{total} 条记录 ({written / elapsed:.1f} rows/s)")
+        
+        elapsed = max(time.perf_counter() - start_time, 1e-9)
+        if written:
+            logger.info(f"写入完成: {written} 条记录，耗时 {elapsed:.1f}s，平均 {written / elapsed:.1f} rows/s")
+        return written
+    
+    def _embed(self, documents, ids):
+        """生成一块文本的向量：优先从向量产物读取，否则运行嵌入模型"""
+        if self.artifact is not None:
+            try:
+                return self.artifact.take(ids)
+            except KeyError:
+                pass  # 产物中没有的行（如增量同步新增的术语）回退到模型编码
+        self.load_model()
+        return self.model.encode(
+            documents,
+            batch_size=self.encode_batch_size,
+            convert_to_numpy=True
+        )
+    
+    def open_artifact_writer(self, data_path, total):
+        """创建数据源对应的向量产物写入器（用于 with 块）"""
+        self.load_model()
+        dim = self.model.get_sentence_embedding_dimension()
+        return self.artifact_store.writer(self.model_name, data_path, total, dim, dtype=self.artifact_dtype)
+    
+    def prepare_artifact(self, data_path, data_df, build_missing=True):
+        """
+        加载（或一次性生成）数据源对应的向量产物
+        
+        产物以模型名称和数据源文件哈希为键，之后更换后端、索引类型或集合结构时
+        直接复用产物中的向量，无需再次运行嵌入模型。构建集合时不经过这里生成产物，
+        而是在 create_collection 中边编码边写入集合和产物
+        
+        Args:
+            build_missing: 产物不存在时是否只编码全部术语并写入产物（不写入集合）
+        """
+        self.artifact = self.artifact_store.load(self.model_name, data_path)
+        if self.artifact is not None:
+            logger.info(f"复用向量产物: {self.artifact.path} ({len(self.artifact)} 条)")
+            return self.artifact
+        if not build_missing:
+            return None
+        
+        with self.open_artifact_writer(data_path, len(data_df)) as writer:
+            self._write_in_chunks(None, data_df, artifact_writer=writer)
+        
+        self.artifact = self.artifact_store.load(self.model_name, data_path)
+        return self.artifact
+    
+    def _build_metadata(self, row):
+        """构建单条术语的元数据，contentHash 用于增量同步时判断内容是否变化"""
+        return {
+            'conceptId': str(row['conceptId']),
+            'domainId': row['domainId'],
+            'active': str(row['active']),
+            'effectiveTime': str(row['effectiveTime']),
+            'contentHash': self._content_hash(row),
+        }
+    
+    def _content_hash(self, row):
+        """术语名称、模型和元数据（domainId / active / effectiveTime）的哈希，元数据变化也会触发重新写入"""
+        return content_hash(row['fsn'], model_name=self.model_name,
+                            metadata=row_metadata(row, ('domainId', 'active', 'effectiveTime')))
+    
+    def sync_collection(self, collection_name, data_df, batch_size=1000):
+        """
+        增量同步向量集合
+        
+        只对新增或内容变化的术语重新生成向量并 upsert，删除数据源中已不存在的术语
+        
+        Returns:
+            {"added": n, "updated": n, "deleted": n, "unchanged": n}
+        """
         try:
-            # 加载模型
-            self.load_model()
+            collection = self.client.get_or_create_collection(
+                name=collection_name,
+                metadata=self._collection_metadata(collection_name)
+            )
+            expected_space = self._collection_metadata(collection_name)["hnsw:space"]
+            actual_space = (collection.metadata or {}).get("hnsw:space", "l2")
+            if actual_space != expected_space:
+                logger.warning(
+                    f"集合 {collection_name} 使用 {actual_space} 空间，配置为 {expected_space}，"
+                    f"请运行 tools/migrate_chroma_collection.py 迁移"
+                )
+            
+            # 数据源中的内容哈希（同一ID出现多次时以最后一行为准）
+            source_rows = {}
+            for _, row in data_df.iterrows():
+                source_rows[str(row['conceptId'])] = row
+            source_hashes = {
+                cid: self._content_hash(row)
+                for cid, row in source_rows.items()
+            }
+            
+            # 集合中已有的内容哈希（旧集合没有 contentHash 时视为需要更新）
+            existing = collection.get(include=['metadatas'])
+            existing_hashes = {
+                cid: (metadata or {}).get('contentHash', '')
+                for cid, metadata in zip(existing['ids'], existing['metadatas'])
+            }
+            
+            plan = plan_sync(source_hashes, existing_hashes)
+            logger.info(f"增量同步计划: {plan.summary()}")
+            
+            # 只对新增和变化的术语生成向量
+            to_embed = plan.to_embed
+            if to_embed:
+                self._write_in_chunks(collection.upsert, pd.DataFrame([source_rows[cid] for cid in to_embed]))
             
+            # 删除数据源中已不存在的术语
+            for i in range(0, len(plan.deleted), batch_size):
+                collection.delete(ids=plan.deleted[i:i + batch_size])
+            
+            summary = plan.summary()
+            logger.info(
+                f"集合 {collection_name} 增量同步完成: 新增 {summary['added']}，更新 {summary['updated']}，"
+                f"删除 {summary['deleted']}，未变化 {summary['unchanged']}"
+            )
+            return summary
+            
+        except Exception as e:
+            logger.error(f"集合增量同步失败: {e}")
+            raise
+    
+    def build_lexical_index(self, db_path, collection_name, data_df):
+        """构建与集合对应的词法索引（BM25 + 字符 n-gram），供混合检索使用"""
+        lexical_df = data_df.drop_duplicates('conceptId', keep='last')
+        index = LexicalIndex.build(
+            [str(cid) for cid in lexical_df['conceptId']],
+            [lexical_text(fsn) for fsn in lexical_df['fsn']],
+            fields={'domainId': lexical_df['domainId'].tolist()}
+        )
+        return index.save(lexical_index_path(db_path, collection_name))
+    
+    def build_database(self, data_path, db_path, collection_name, incremental=False, lexical=True):
+        """
+        构建完整的向量数据库
+        
+        Args:
+            incremental: 为 True 时增量同步已有集合，而不是删除后重建
+            lexical: 是否同时重建词法索引
+        """
+        try:
             # 初始化数据库
             self.initialize_db(db_path)
             
             # 加载数据
             data_df = self.load_financial_data(data_path)
             
-            # 创建集合
-            collection = self.create_collection(collection_name, data_df)
+            # 向量产物：有则复用；增量同步只复用已有产物，避免全量重新嵌入
+            if self.artifact_store is not None:
+                self.prepare_artifact(data_path, data_df, build_missing=False)
+            
+            if incremental:
+                summary = self.sync_collection(collection_name, data_df)
+                if lexical:
+                    self.build_lexical_index(db_path, collection_name, data_df)
+                return summary
+            
+            # 创建集合；全量构建时产物缺失则边编码边写入集合和产物，不必先编码完整个语料再写入集合
+            with ExitStack() as stack:
+                artifact_writer = None
+                if self.artifact_store is not None and self.artifact is None:
+                    artifact_writer = stack.enter_context(self.open_artifact_writer(data_path, len(data_df)))
+                collection = self.create_collection(collection_name, data_df, artifact_writer)
+            if artifact_writer is not None:
+                self.artifact = self.artifact_store.load(self.model_name, data_path)
+            if lexical:
+                self.build_lexical_index(db_path, collection_name, data_df)
             
             logger.info("金融术语向量数据库构建完成！")
             return collection
@@ -159,14 +372,29 @@ class FinancialVectorDBBuilder:
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="构建金融术语向量数据库")
+    parser.add_argument("--incremental", action="store_true",
+                        help="增量同步：只重新嵌入新增或变化的术语，并删除已移除的术语")
+    parser.add_argument("--artifact-dir", default="backend/artifacts/embeddings",
+                        help="向量产物目录，同一模型和数据源的向量只生成一次")
+    parser.add_argument("--no-artifact", action="store_true",
+                        help="不读写向量产物，直接运行嵌入模型")
+    parser.add_argument("--artifact-dtype", choices=["float32", "float16"], default="float32",
+                        help="新生成向量产物的存储精度")
+    parser.add_argument("--no-lexical", action="store_true",
+                        help="不构建词法索引（混合检索需要）")
+    args = parser.parse_args()
+    
     # 配置路径
     data_path = "backend/data/financial_terms_full.csv"
     db_path = "backend/db/financial_bge_m3.db"
     collection_name = "financial_concepts"
     
     # 构建数据库
-    builder = FinancialVectorDBBuilder()
-    builder.build_database(data_path, db_path, collection_name)
+    artifact_store = None if args.no_artifact else EmbeddingArtifactStore(args.artifact_dir)
+    builder = FinancialVectorDBBuilder(artifact_store=artifact_store, artifact_dtype=args.artifact_dtype)
+    builder.build_database(data_path, db_path, collection_name, incremental=args.incremental,
+                           lexical=not args.no_lexical)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+拼写检查词表构建工具
+合并 SNOMED 概念名称 / FSN 同义词、缩写词典中的扩展和通用英文、中文词表，
+写出 CorrService 本地拼写检查使用的词表（每行 "词\t词频"）
+"""
+
+import sys
+import argparse
+import logging
+from collections import Counter
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from utils.abbreviation_dictionary import get_abbreviation_dictionary
+from utils.spell_checker import (
+    DEFAULT_SNOMED_PATH, DEFAULT_SPELL_VOCABULARY_PATH,
+    read_vocabulary, snomed_word_counts, vocabulary_words, write_vocabulary
+)
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def lexicon_counts(path, min_count, lowercase):
+    """读取通用词表（SymSpell 频率词典 / jieba 词典 / 每行一个词），过滤低频词"""
+    counts = Counter()
+    for word, count in read_vocabulary(path):
+        if count >= min_count:
+            counts[word.lower() if lowercase else word] += count
+    logger.info(f"从 {path} 读取 {len(counts)} 个词")
+    return counts
+
+
+def build_vocabulary(snomed_path, english_paths, chinese_paths, min_count, domain_boost):
+    """
+    合并各来源的词频
+
+    SNOMED 和缩写扩展中的词频乘以 domain_boost，使医学词在与通用词编辑距离相同时优先
+    """
+    domain = snomed_word_counts(snomed_path)
+    logger.info(f"从 SNOMED 名称 / FSN 统计到 {len(domain)} 个词: {snomed_path}")
+    for entry in get_abbreviation_dictionary().entries.values():
+        for expansion in entry.expansions:
+            domain.update(vocabulary_words(expansion["expansion"]))
+
+    counts = Counter({word: count * domain_boost for word, count in domain.items()})
+    for path in english_paths:
+        counts.update(lexicon_counts(path, min_count, lowercase=True))
+    for path in chinese_paths:
+        counts.update(lexicon_counts(path, min_count, lowercase=False))
+    return counts
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="构建拼写检查词表")
+    parser.add_argument("--snomed", default=str(DEFAULT_SNOMED_PATH), help="SNOMED 概念 CSV")
+    # 只有医学词的词表会把常见英文单词误纠为相近的医学词（since → sine），通用英文词表为必选
+    parser.add_argument("--english", nargs="+", required=True,
+                        help="通用英文词表，如 SymSpell 的 frequency_dictionary_en_82_765.txt")
+    parser.add_argument("--chinese", nargs="*", default=[], help="中文词表，如 jieba 的 dict.txt")
+    parser.add_argument("--min-count", type=int, default=1, help="通用词表中保留的最低词频")
+    parser.add_argument("--domain-boost", type=int, default=1000, help="医学词的词频倍数")
+    parser.add_argument("--output", default=str(DEFAULT_SPELL_VOCABULARY_PATH), help="输出词表路径")
+    args = parser.parse_args()
+
+    counts = build_vocabulary(args.snomed, args.english, args.chinese, args.min_count, args.domain_boost)
+    write_vocabulary(counts, args.output, general_lexicon=True)
+
+
+if __name__ == "__main__":
+    main()
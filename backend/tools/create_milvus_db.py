@@ -7,10 +7,27 @@ from dotenv import load_dotenv
 load_dotenv()
 import torch    
 from pymilvus import MilvusClient, DataType, FieldSchema, CollectionSchema
+import os
+import sys
+from contextlib import ExitStack
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.append(str(Path(__file__).parent.parent))
+from utils.index_sync import (
+    MissingContentHashError, content_hash, plan_sync, fetch_milvus_index, milvus_in_filter, row_metadata
+)
+from utils.domain_routing import insert_by_domain_partition
+from utils.index_config import add_vector_index
+from utils.embedding_artifact import EmbeddingArtifactStore
+from utils.lexical_index import LexicalIndex, lexical_index_path, lexical_text
 
 # 设置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# 嵌入模型名称（参与内容哈希计算，换模型会触发全部重新嵌入）
+embedding_model_name = 'BAAI/bge-m3'
+
 # 初始化 OpenAI 嵌入函数
 embedding_function = model.dense.SentenceTransformerEmbeddingFunction(
             # model_name='nvidia/NV-Embed-v2', 
@@ -18,7 +35,7 @@ embedding_function = model.dense.SentenceTransformerEmbeddingFunction(
             # model_name='all-mpnet-base-v2',
             # model_name='intfloat/multilingual-e5-large-instruct',
             # model_name='Alibaba-NLP/gte-Qwen2-1.5B-instruct',
-            model_name='BAAI/bge-m3',
+            model_name=embedding_model_name,
             # model_name='jinaai/jina-embeddings-v3',
             device='cuda:0' if torch.cuda.is_available() else 'cpu',
             trust_remote_code=True
@@ -35,6 +52,19 @@ client = MilvusClient(db_path)
 collection_name = "concepts_only_name"
 # collection_name = "concepts_with_synonym"
 
+# 增量同步模式：INCREMENTAL_SYNC=true 时只重新嵌入新增/变化的概念，并删除数据源中已移除的概念
+incremental = os.getenv("INCREMENTAL_SYNC", "false").lower() == "true"
+existing_hashes, existing_primary_keys = {}, {}
+if incremental and client.has_collection(collection_name):
+    try:
+        existing_hashes, existing_primary_keys = fetch_milvus_index(client, collection_name)
+        logging.info(f"Incremental sync: {len(existing_hashes)} concepts already indexed")
+    except MissingContentHashError as e:
+        # 旧集合没有内容哈希，无法判断哪些概念变化：删除后全量重建
+        logging.warning(f"{e}; dropping {collection_name} and rebuilding it from scratch")
+        client.drop_collection(collection_name)
+        incremental = False
+
 # 加载数据
 logging.info("Loading data from CSV")
 df = pd.read_csv(file_path, 
@@ -42,10 +72,24 @@ df = pd.read_csv(file_path,
                 low_memory=False,
                  ).fillna("NA")
 
+# 向量产物：同一模型 + 数据源的向量只生成一次，更换索引或集合结构时直接复用
+# USE_EMBEDDING_ARTIFACT=false 可关闭
+artifact_variant = "concept_name"
+artifact_store = None
+artifact = None
+if os.getenv("USE_EMBEDDING_ARTIFACT", "true").lower() == "true":
+    artifact_store = EmbeddingArtifactStore(os.getenv("EMBEDDING_ARTIFACT_DIR", "backend/artifacts/embeddings"))
+    artifact = artifact_store.load(embedding_model_name, file_path, variant=artifact_variant)
+    if artifact is not None:
+        logging.info(f"Reusing embedding artifact: {artifact.path} ({len(artifact)} vectors)")
+
 # 获取向量维度（使用一个样本文档）
-sample_doc = "Sample Text"
-sample_embedding = embedding_function([sample_doc])[0]
-vector_dim = len(sample_embedding)
+if artifact is not None:
+    vector_dim = artifact.dim
+else:
+    sample_doc = "Sample Text"
+    sample_embedding = embedding_function([sample_doc])[0]
+    vector_dim = len(sample_embedding)
 
 # 构造Schema
 fields = [
@@ -64,6 +108,7 @@ fields = [
     # FieldSchema(name="synonyms", dtype=DataType.VARCHAR, max_length=1000), # 同义词
     # FieldSchema(name="definitions", dtype=DataType.VARCHAR, max_length=1000), # 定义
     FieldSchema(name="input_file", dtype=DataType.VARCHAR, max_length=500),
+    FieldSchema(name="content_hash", dtype=DataType.VARCHAR, max_length=64), # 名称+模型+元数据的哈希，用于增量同步
 ]
 schema = CollectionSchema(fields, 
                           "SNOMED-CT Concepts", 
@@ -79,84 +124,166 @@ if not client.has_collection(collection_name):
     logging.info(f"Created new collection: {collection_name}")
 
 # # 在创建集合后添加索引
+# 使用 tools/tune_milvus_index.py 调优得到的索引类型和参数（config/milvus_index.json），未调优时使用 AUTOINDEX
 index_params = client.prepare_index_params()
-index_params.add_index(
-    field_name="vector",  # 指定要为哪个字段创建索引，这里是向量字段
-    index_type="AUTOINDEX",  # 使用自动索引类型，Milvus会根据数据特性选择最佳索引
-    metric_type="COSINE",  # 使用余弦相似度作为向量相似度度量方式
-    params={"nlist": 1024}  # 索引参数：nlist表示聚类中心的数量，值越大检索精度越高但速度越慢
-)
+add_vector_index(index_params, collection_name, field_name="vector")
 
 client.create_index(
     collection_name=collection_name,
     index_params=index_params
 )
 
+# 按 domain_id 分区（PARTITION_BY_DOMAIN=false 可关闭）
+partition_by_domain = os.getenv("PARTITION_BY_DOMAIN", "true").lower() == "true"
+
 # 批量处理
 batch_size = 1024
+sync_counts = {"added": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+source_concept_ids = set()
 
-for start_idx in tqdm(range(0, len(df), batch_size), desc="Processing batches"):
-    end_idx = min(start_idx + batch_size, len(df))
-    batch_df = df.iloc[start_idx:end_idx]
+# 全量构建且没有可用产物时，边嵌入边写入新产物；退出 with 块时产物才落盘，中途出错则丢弃
+with ExitStack() as artifact_stack:
+    artifact_writer = None
+    if artifact_store is not None and artifact is None and not incremental:
+        artifact_writer = artifact_stack.enter_context(
+            artifact_store.writer(embedding_model_name, file_path, len(df), vector_dim, variant=artifact_variant)
+        )
 
-    # 准备文档
-    # docs = [f"Term: {row['concept_name']}; Synonyms: {row['Synonyms']}" for _, row in batch_df.iterrows()]
-    docs = []
-    for _, row in batch_df.iterrows():
-        doc_parts = [row['concept_name']]
+    for start_idx in tqdm(range(0, len(df), batch_size), desc="Processing batches"):
+        end_idx = min(start_idx + batch_size, len(df))
+        batch_df = df.iloc[start_idx:end_idx]
 
-        # if row['Full Name'] != "NA" and row['Full Name'] != row['concept_name']:
-        #     doc_parts.append(",Full Name: " + row['Full Name'])
+        # 准备文档
+        # docs = [f"Term: {row['concept_name']}; Synonyms: {row['Synonyms']}" for _, row in batch_df.iterrows()]
+        docs = []
+        for _, row in batch_df.iterrows():
+            doc_parts = [row['concept_name']]
 
-        # if row['Synonyms'] != "NA" and row['Synonyms'] != row['concept_name']:
-        #     doc_parts.append(", Synonyms: " + row['Synonyms'])
+            # if row['Full Name'] != "NA" and row['Full Name'] != row['concept_name']:
+            #     doc_parts.append(",Full Name: " + row['Full Name'])
 
-        # if row['Definitions'] != "NA" and row['Definitions'] not in [row['concept_name'], row.get('Full Name', '')]:
-        #     doc_parts.append(", Definitions: " + row['Definitions'])
+            # if row['Synonyms'] != "NA" and row['Synonyms'] != row['concept_name']:
+            #     doc_parts.append(", Synonyms: " + row['Synonyms'])
 
-        docs.append(" ".join(doc_parts))
+            # if row['Definitions'] != "NA" and row['Definitions'] not in [row['concept_name'], row.get('Full Name', '')]:
+            #     doc_parts.append(", Definitions: " + row['Definitions'])
 
-    # 生成嵌入
-    try:
-        embeddings = embedding_function(docs)
-        logging.info(f"Generated embeddings for batch {start_idx // batch_size + 1}")
-    except Exception as e:
-        logging.error(f"Error generating embeddings for batch {start_idx // batch_size + 1}: {e}")
-        continue
-
-    # 准备数据
-    data = [
-        {
-            # "id": idx + start_idx,
-            "vector": embeddings[idx],
-            "concept_id": str(row['concept_id']),
-            "concept_name": str(row['concept_name']),
-            "domain_id": str(row['domain_id']),
-            "vocabulary_id": str(row['vocabulary_id']),
-            "concept_class_id": str(row['concept_class_id']),
-            "standard_concept": str(row['standard_concept']),
-            "concept_code": str(row['concept_code']),
-            "valid_start_date": str(row['valid_start_date']),
-            "valid_end_date": str(row['valid_end_date']),
-            # "invalid_reason": str(row['invalid_reason']),
-            # "full_name": str(row['Full Name']),
-            # "synonyms": str(row['Synonyms']),
-            # "definitions": str(row['Definitions']),
-            "input_file": file_path
-        } for idx, (_, row) in enumerate(batch_df.iterrows())
-    ]
-
-    # 插入数据 - 1024个向量条目，即1024个医疗术语（标准概念）
-    try:
-        res = client.insert(
-            collection_name=collection_name,
-            data=data
-        )
-        logging.info(f"Inserted batch {start_idx // batch_size + 1}, result: {res}")
-    except Exception as e:
-        logging.error(f"Error inserting batch {start_idx // batch_size + 1}: {e}")
+            docs.append(" ".join(doc_parts))
+
+        batch_hashes = [
+            content_hash(doc, model_name=embedding_model_name, metadata=row_metadata(row))
+            for doc, (_, row) in zip(docs, batch_df.iterrows())
+        ]
+        batch_ids = [str(cid) for cid in batch_df['concept_id']]
+        source_concept_ids.update(batch_ids)
+
+        if incremental:
+            # 只保留新增或内容变化的概念
+            plan = plan_sync(
+                dict(zip(batch_ids, batch_hashes)),
+                {cid: existing_hashes[cid] for cid in batch_ids if cid in existing_hashes}
+            )
+            for key, value in plan.summary().items():
+                sync_counts[key] += value
+            to_embed = set(plan.to_embed)
+            keep = [idx for idx, cid in enumerate(batch_ids) if cid in to_embed]
+            if not keep:
+                continue
+            batch_df = batch_df.iloc[keep]
+            docs = [docs[idx] for idx in keep]
+            batch_hashes = [batch_hashes[idx] for idx in keep]
+
+            # 更新的概念的旧向量（主键为 auto_id，无法直接 upsert）在新向量写入成功后按旧主键删除，
+            # 嵌入或写入失败时保留旧向量，概念不会从索引中消失
+            stale_primary_keys = [pk for cid in plan.updated for pk in existing_primary_keys.get(cid, [])]
+        else:
+            sync_counts["added"] += len(batch_ids)
+            stale_primary_keys = []
+
+        # 生成嵌入
+        try:
+            if artifact is not None:
+                embeddings = artifact.take(batch_df['concept_id'].tolist())
+                logging.info(f"Loaded embeddings from artifact for batch {start_idx // batch_size + 1}")
+            else:
+                embeddings = embedding_function(docs)
+                logging.info(f"Generated embeddings for batch {start_idx // batch_size + 1}")
+        except Exception as e:
+            logging.error(f"Error generating embeddings for batch {start_idx // batch_size + 1}: {e}")
+            if artifact_writer is not None:
+                # 产物不完整，放弃写入
+                artifact_writer.abort()
+                artifact_writer = None
+            continue
+
+        if artifact_writer is not None:
+            artifact_writer.write(start_idx, embeddings, batch_df['concept_id'].tolist(),
+                                  [{"concept_id": row['concept_id'], "concept_name": row['concept_name'],
+                                    "domain_id": row['domain_id'], "vocabulary_id": row['vocabulary_id'],
+                                    "concept_class_id": row['concept_class_id'],
+                                    "standard_concept": row['standard_concept'], "concept_code": row['concept_code'],
+                                    "content_hash": batch_hashes[idx]}
+                                   for idx, (_, row) in enumerate(batch_df.iterrows())])
+
+        # 准备数据
+        data = [
+            {
+                # "id": idx + start_idx,
+                "vector": embeddings[idx],
+                "concept_id": str(row['concept_id']),
+                "concept_name": str(row['concept_name']),
+                "domain_id": str(row['domain_id']),
+                "vocabulary_id": str(row['vocabulary_id']),
+                "concept_class_id": str(row['concept_class_id']),
+                "standard_concept": str(row['standard_concept']),
+                "concept_code": str(row['concept_code']),
+                "valid_start_date": str(row['valid_start_date']),
+                "valid_end_date": str(row['valid_end_date']),
+                # "invalid_reason": str(row['invalid_reason']),
+                # "full_name": str(row['Full Name']),
+                # "synonyms": str(row['Synonyms']),
+                # "definitions": str(row['Definitions']),
+                "input_file": file_path,
+                "content_hash": batch_hashes[idx]
+            } for idx, (_, row) in enumerate(batch_df.iterrows())
+        ]
+
+        # 插入数据 - 1024个向量条目，即1024个医疗术语（标准概念）
+        try:
+            if partition_by_domain:
+                # 按 domain_id 写入分区，检索时可按实体类型只检索相关领域
+                res = insert_by_domain_partition(client, collection_name, data)
+            else:
+                res = client.insert(
+                    collection_name=collection_name,
+                    data=data
+                )
+            logging.info(f"Inserted batch {start_idx // batch_size + 1}, result: {res}")
+        except Exception as e:
+            logging.error(f"Error inserting batch {start_idx // batch_size + 1}: {e}")
+            continue
+
+        if stale_primary_keys:
+            client.delete(collection_name=collection_name, ids=stale_primary_keys)
+
+# 删除数据源中已不存在的概念
+if incremental:
+    removed = [cid for cid in existing_hashes if cid not in source_concept_ids]
+    for i in range(0, len(removed), batch_size):
+        client.delete(collection_name=collection_name, filter=milvus_in_filter("concept_id", removed[i:i + batch_size]))
+    sync_counts["deleted"] = len(removed)
+
+logging.info(f"Insert process completed. added={sync_counts['added']}, updated={sync_counts['updated']}, "
+             f"deleted={sync_counts['deleted']}, unchanged={sync_counts['unchanged']}")
 
-logging.info("Insert process completed.")
+# 词法索引（BM25 + 字符 n-gram，混合检索使用），按完整数据源重建，BUILD_LEXICAL_INDEX=false 可关闭
+if os.getenv("BUILD_LEXICAL_INDEX", "true").lower() == "true":
+    lexical_df = df.drop_duplicates("concept_id", keep="last")
+    LexicalIndex.build(
+        lexical_df['concept_id'].tolist(),
+        [lexical_text(row['concept_name'], row.get('FSN')) for _, row in lexical_df.iterrows()],
+        fields={"domain_id": lexical_df['domain_id'].tolist()}
+    ).save(lexical_index_path(db_path, collection_name))
 
 # 示例查询
 # query = "somatic hallucination"
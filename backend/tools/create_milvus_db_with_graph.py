@@ -9,6 +9,17 @@ import torch
 from pymilvus import MilvusClient, DataType, FieldSchema, CollectionSchema
 from neo4j import GraphDatabase
 import os
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.append(str(Path(__file__).parent.parent))
+from utils.index_sync import (
+    MissingContentHashError, content_hash, plan_sync, fetch_milvus_index, milvus_in_filter, row_metadata
+)
+from utils.domain_routing import insert_by_domain_partition
+from utils.index_config import add_vector_index
+from utils.lexical_index import LexicalIndex, lexical_index_path, lexical_text
 
 # 设置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -67,40 +78,42 @@ except Exception as e:
     raise
 
 def get_concept_descriptions(concept_id, concept_code):
-    with neo4j_driver.session() as session:
-        # 首先检查概念是否存在
-        concept_check = session.run("""
-            MATCH (c:ObjectConcept {id: $concept_code})
-            RETURN c.id as id, c.FSN as fsn
-        """, concept_code=concept_code)
-        concept = concept_check.single()
-        
-        if not concept:
-            logging.warning(f"Concept {concept_id} (code: {concept_code}) not found in Neo4j")
-            return []
-            
-        logging.info(f"Found concept: {concept['id']} with FSN: {concept['fsn']}")
+    """获取单个概念的描述（调试用，批量构建请使用 get_batch_concept_descriptions）"""
+    return get_batch_concept_descriptions([concept_code]).get(concept_code, [])
+
+def get_batch_concept_descriptions(concept_codes):
+    """
+    一次 Cypher 往返批量获取一组概念的全部描述
+    
+    Args:
+        concept_codes: 概念代码列表（对应 ObjectConcept.id）
         
-        # 修改查询以获取所有描述
+    Returns:
+        {concept_code: [term, ...]} 字典，Neo4j 中不存在的概念不会出现在结果中
+    """
+    codes = list(dict.fromkeys(concept_codes))  # 去重并保持顺序
+    if not codes:
+        return {}
+
+    with neo4j_driver.session() as session:
+        # UNWIND 展开整批代码，OPTIONAL MATCH 保证没有描述的概念也能返回
         result = session.run("""
-            MATCH (c:ObjectConcept {id: $concept_code})-[:HAS_DESCRIPTION]->(d:Description)
-            RETURN d.term as term, d.descriptionType as type, d.active as active
-            ORDER BY d.descriptionType
-        """, concept_code=concept_code)
-        
-        # 获取所有结果
-        descriptions = [(record["term"], record["type"], record["active"]) for record in result]
-        
-        # 添加日志
-        if descriptions:
-            logging.info(f"Found {len(descriptions)} descriptions for concept {concept['id']}:")
-            for term, type_, active in descriptions:
-                logging.info(f"  - Term: {term}, Type: {type_}, Active: {active}")
-        else:
-            logging.warning(f"No descriptions found for concept {concept['id']}")
-            
-        # 只返回术语文本
-        return [desc[0] for desc in descriptions]
+            UNWIND $codes AS code
+            MATCH (c:ObjectConcept {id: code})
+            OPTIONAL MATCH (c)-[:HAS_DESCRIPTION]->(d:Description)
+            WITH c, d ORDER BY d.descriptionType
+            RETURN c.id AS concept_code, collect(d.term) AS terms
+        """, codes=codes)
+        descriptions = {record["concept_code"]: record["terms"] for record in result}
+
+    missing = len(codes) - len(descriptions)
+    if missing:
+        logging.warning(f"{missing}/{len(codes)} concepts not found in Neo4j")
+    logging.debug(f"Fetched descriptions for {len(descriptions)} concepts in one query")
+    return descriptions
+
+# 嵌入模型名称（参与内容哈希计算，换模型会触发全部重新嵌入）
+embedding_model_name = 'BAAI/bge-m3'
 
 # 初始化 OpenAI 嵌入函数
 embedding_function = model.dense.SentenceTransformerEmbeddingFunction(
@@ -109,7 +122,7 @@ embedding_function = model.dense.SentenceTransformerEmbeddingFunction(
             # model_name='all-mpnet-base-v2',
             # model_name='intfloat/multilingual-e5-large-instruct',
             # model_name='Alibaba-NLP/gte-Qwen2-1.5B-instruct',
-            model_name='BAAI/bge-m3',
+            model_name=embedding_model_name,
             # model_name='jinaai/jina-embeddings-v3',
             device='cuda:0' if torch.cuda.is_available() else 'cpu',
             trust_remote_code=True
@@ -125,8 +138,21 @@ client = MilvusClient(db_path)
 
 collection_name = "concepts_with_synonym"
 
-# 如果集合存在，先删除它
-if client.has_collection(collection_name):
+# 增量同步模式：INCREMENTAL_SYNC=true 时只重新嵌入新增/变化的概念，并删除数据源中已移除的概念
+incremental = os.getenv("INCREMENTAL_SYNC", "false").lower() == "true"
+existing_hashes, existing_primary_keys = {}, {}
+
+if incremental and client.has_collection(collection_name):
+    try:
+        existing_hashes, existing_primary_keys = fetch_milvus_index(client, collection_name)
+        logging.info(f"Incremental sync: {len(existing_hashes)} concepts already indexed")
+    except MissingContentHashError as e:
+        # 旧集合没有内容哈希，无法判断哪些概念变化：删除后全量重建
+        logging.warning(f"{e}; dropping {collection_name} and rebuilding it from scratch")
+        client.drop_collection(collection_name)
+        incremental = False
+elif client.has_collection(collection_name):
+    # 如果集合存在，先删除它
     logging.info(f"Dropping existing collection: {collection_name}")
     client.drop_collection(collection_name)
 
@@ -159,6 +185,7 @@ fields = [
     FieldSchema(name="synonyms", dtype=DataType.VARCHAR, max_length=1000),
     # FieldSchema(name="definitions", dtype=DataType.VARCHAR, max_length=1000), # 定义
     FieldSchema(name="input_file", dtype=DataType.VARCHAR, max_length=500),
+    FieldSchema(name="content_hash", dtype=DataType.VARCHAR, max_length=64), # 名称+同义词+模型+元数据的哈希，用于增量同步
 ]
 schema = CollectionSchema(fields, 
                           "SNOMED-CT Concepts", 
@@ -174,36 +201,41 @@ if not client.has_collection(collection_name):
     logging.info(f"Created new collection: {collection_name}")
 
 # # 在创建集合后添加索引
+# 使用 tools/tune_milvus_index.py 调优得到的索引类型和参数（config/milvus_index.json），未调优时使用 AUTOINDEX
 index_params = client.prepare_index_params()
-index_params.add_index(
-    field_name="vector",  # 指定要为哪个字段创建索引，这里是向量字段
-    index_type="AUTOINDEX",  # 使用自动索引类型，Milvus会根据数据特性选择最佳索引
-    metric_type="COSINE",  # 使用余弦相似度作为向量相似度度量方式
-    params={"nlist": 1024}  # 索引参数：nlist表示聚类中心的数量，值越大检索精度越高但速度越慢
-)
+add_vector_index(index_params, collection_name, field_name="vector")
 
 client.create_index(
     collection_name=collection_name,
     index_params=index_params
 )
 
+# 按 domain_id 分区（PARTITION_BY_DOMAIN=false 可关闭）
+partition_by_domain = os.getenv("PARTITION_BY_DOMAIN", "true").lower() == "true"
+
 # 批量处理
 batch_size = 1024
+sync_counts = {"added": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+source_concept_ids = set()
+# 词法索引文本（概念名称 + FSN + 同义词）和领域，包括增量同步中未变化的概念
+lexical_docs = {}
 
 for start_idx in tqdm(range(0, len(df), batch_size), desc="Processing batches"):
     end_idx = min(start_idx + batch_size, len(df))
     batch_df = df.iloc[start_idx:end_idx]
 
+    # 从Neo4j批量获取整批概念的同义词（每批一次往返）
+    batch_descriptions = get_batch_concept_descriptions(batch_df['concept_code'].tolist())
+
     # 准备文档
     docs = []
+    batch_synonyms = []
     for _, row in batch_df.iterrows():
-        concept_id = row['concept_id']
-        concept_code = row['concept_code']
         concept_name = row['concept_name']
         
-        # 从Neo4j获取同义词
-        synonyms = get_concept_descriptions(concept_id, concept_code)
+        synonyms = batch_descriptions.get(row['concept_code'], [])
         synonyms_text = " ".join(synonyms) if synonyms else ""
+        batch_synonyms.append(synonyms_text)
         
         # 组合概念名称和同义词 - 这就好比是图数据库资源和普通文本资源的组合检索呀！！！！
         doc_parts = [concept_name]
@@ -212,6 +244,41 @@ for start_idx in tqdm(range(0, len(df), batch_size), desc="Processing batches"):
             
         docs.append(" ".join(doc_parts))
 
+    batch_hashes = [
+        content_hash(row['concept_name'], batch_synonyms[idx], embedding_model_name, row_metadata(row))
+        for idx, (_, row) in enumerate(batch_df.iterrows())
+    ]
+    batch_ids = [str(cid) for cid in batch_df['concept_id']]
+    source_concept_ids.update(batch_ids)
+    for idx, (_, row) in enumerate(batch_df.iterrows()):
+        lexical_docs[batch_ids[idx]] = (
+            lexical_text(row['concept_name'], row.get('FSN'), batch_synonyms[idx]), str(row['domain_id'])
+        )
+
+    if incremental:
+        # 只保留新增或内容变化的概念
+        plan = plan_sync(
+            dict(zip(batch_ids, batch_hashes)),
+            {cid: existing_hashes[cid] for cid in batch_ids if cid in existing_hashes}
+        )
+        for key, value in plan.summary().items():
+            sync_counts[key] += value
+        to_embed = set(plan.to_embed)
+        keep = [idx for idx, cid in enumerate(batch_ids) if cid in to_embed]
+        if not keep:
+            continue
+        batch_df = batch_df.iloc[keep]
+        docs = [docs[idx] for idx in keep]
+        batch_synonyms = [batch_synonyms[idx] for idx in keep]
+        batch_hashes = [batch_hashes[idx] for idx in keep]
+
+        # 更新的概念的旧向量（主键为 auto_id，无法直接 upsert）在新向量写入成功后按旧主键删除，
+        # 嵌入或写入失败时保留旧向量，概念不会从索引中消失
+        stale_primary_keys = [pk for cid in plan.updated for pk in existing_primary_keys.get(cid, [])]
+    else:
+        sync_counts["added"] += len(batch_ids)
+        stale_primary_keys = []
+
     # 生成嵌入
     try:
         embeddings = embedding_function(docs)
@@ -223,10 +290,7 @@ for start_idx in tqdm(range(0, len(df), batch_size), desc="Processing batches"):
     # 准备数据
     data = []
     for idx, (_, row) in enumerate(batch_df.iterrows()):
-        concept_id = row['concept_id']
-        concept_code = row['concept_code']
-        synonyms = get_concept_descriptions(concept_id, concept_code)
-        synonyms_text = " ".join(synonyms) if synonyms else ""
+        synonyms_text = batch_synonyms[idx]
         
         data.append({
             "vector": embeddings[idx],
@@ -240,20 +304,46 @@ for start_idx in tqdm(range(0, len(df), batch_size), desc="Processing batches"):
             "valid_start_date": str(row['valid_start_date']),
             "valid_end_date": str(row['valid_end_date']),
             "synonyms": synonyms_text,
-            "input_file": file_path
+            "input_file": file_path,
+            "content_hash": batch_hashes[idx]
         })
 
     # 插入数据 - 1024个向量条目，即1024个医疗术语（标准概念）
     try:
-        res = client.insert(
-            collection_name=collection_name,
-            data=data
-        )
+        if partition_by_domain:
+            # 按 domain_id 写入分区，检索时可按实体类型只检索相关领域
+            res = insert_by_domain_partition(client, collection_name, data)
+        else:
+            res = client.insert(
+                collection_name=collection_name,
+                data=data
+            )
         logging.info(f"Inserted batch {start_idx // batch_size + 1}, result: {res}")
     except Exception as e:
         logging.error(f"Error inserting batch {start_idx // batch_size + 1}: {e}")
+        continue
+
+    if stale_primary_keys:
+        client.delete(collection_name=collection_name, ids=stale_primary_keys)
+
+# 删除数据源中已不存在的概念
+if incremental:
+    removed = [cid for cid in existing_hashes if cid not in source_concept_ids]
+    for i in range(0, len(removed), batch_size):
+        client.delete(collection_name=collection_name, filter=milvus_in_filter("concept_id", removed[i:i + batch_size]))
+    sync_counts["deleted"] = len(removed)
+
+logging.info(f"Insert process completed. added={sync_counts['added']}, updated={sync_counts['updated']}, "
+             f"deleted={sync_counts['deleted']}, unchanged={sync_counts['unchanged']}")
 
-logging.info("Insert process completed.")
+# 词法索引（BM25 + 字符 n-gram，混合检索使用），BUILD_LEXICAL_INDEX=false 可关闭
+if os.getenv("BUILD_LEXICAL_INDEX", "true").lower() == "true":
+    lexical_ids = list(lexical_docs)
+    LexicalIndex.build(
+        lexical_ids,
+        [lexical_docs[cid][0] for cid in lexical_ids],
+        fields={"domain_id": [lexical_docs[cid][1] for cid in lexical_ids]}
+    ).save(lexical_index_path(db_path, collection_name))
 
 # 关闭Neo4j连接
 neo4j_driver.close()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+拼写纠正离线评测工具
+读取 generate_error_corpus.py 生成的 JSONL 语料，评测本地拼写检查器的纠正准确率与吞吐量：
+- fixed: 加错的词被纠正回原词
+- wrong: 加错的词被改成了其他词
+- escalated: 加错的词被标记为未解决（预过滤模式下会交给 LLM）
+- missed: 加错的词未被发现
+- false_positive: 原本正确的词被改动
+"""
+
+import sys
+import json
+import time
+import argparse
+import logging
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from utils.spell_checker import SpellChecker, get_spell_checker
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def corrupted_spans(record):
+    """加错后文本中每处错误的区间 -> 原词（edits 中的偏移相对于原文，按累计长度变化换算）"""
+    spans, shift = {}, 0
+    for edit in sorted(record["edits"], key=lambda e: e["start"]):
+        start = edit["start"] + shift
+        spans[(start, start + len(edit["corrupted"]))] = edit["original"]
+        shift += len(edit["corrupted"]) - len(edit["original"])
+    return spans
+
+
+def evaluate(checker, records):
+    stats = {"errors": 0, "fixed": 0, "wrong": 0, "escalated": 0, "missed": 0, "false_positive": 0,
+             "escalated_sentences": 0}
+    elapsed = 0.0
+    for record in records:
+        spans = corrupted_spans(record)
+        t = time.perf_counter()
+        result = checker.check(record["corrupted"])
+        elapsed += time.perf_counter() - t
+
+        corrections = {(c["start"], c["end"]): c["correction"] for c in result["corrections"]}
+        unresolved = {(u["start"], u["end"]) for u in result["unresolved"]}
+        stats["errors"] += len(spans)
+        stats["escalated_sentences"] += bool(result["unresolved"])
+        for span, original in spans.items():
+            if span in corrections:
+                stats["fixed" if corrections[span].lower() == original.lower() else "wrong"] += 1
+            elif span in unresolved:
+                stats["escalated"] += 1
+            else:
+                stats["missed"] += 1
+        stats["false_positive"] += sum(span not in spans for span in corrections)
+    return stats, elapsed
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="评测本地拼写检查器")
+    parser.add_argument("corpus", help="generate_error_corpus.py 生成的 JSONL 语料")
+    parser.add_argument("--vocabulary", default=None, help="词表路径，默认使用服务端的词表")
+    parser.add_argument("--limit", type=int, default=None, help="最多评测的文档数")
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f][:args.limit]
+    checker = SpellChecker.load(args.vocabulary) if args.vocabulary else get_spell_checker()
+    logger.info(f"评测 {len(records)} 篇文档，词表 {len(checker)} 个词")
+
+    stats, elapsed = evaluate(checker, records)
+    errors = max(stats["errors"], 1)
+    for key in ("fixed", "wrong", "escalated", "missed"):
+        print(f"{key:>15}: {stats[key]:>8} ({stats[key] / errors:.1%})")
+    print(f"{'false_positive':>15}: {stats['false_positive']:>8}")
+    print(f"{'escalated docs':>15}: {stats['escalated_sentences']:>8} ({stats['escalated_sentences'] / max(len(records), 1):.1%})")
+    words = sum(len(record["corrupted"].split()) for record in records)
+    print(f"{'throughput':>15}: {words / max(elapsed, 1e-9):,.0f} 词/秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+本地模拟 Ollama 服务
+实现 /api/generate、/api/chat（流式 NDJSON 或一次性返回）和 /api/tags，响应耗时服从可配置的对数正态分布
+（可叠加长尾），客户端中途断开时记为取消。用于离线测试多后端负载均衡与对冲请求
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class LatencyModel:
+    """
+    响应耗时分布：中位数为 median 秒的对数正态分布，
+    以 tail_probability 的概率再乘以 tail_factor（模拟排队、换页等造成的长尾）
+    """
+
+    def __init__(self, median=0.5, sigma=0.3, tail_probability=0.0, tail_factor=5.0, seed=None):
+        self.median = median
+        self.sigma = sigma
+        self.tail_probability = tail_probability
+        self.tail_factor = tail_factor
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec: str, seed=None):
+        """MEDIAN[:SIGMA[:TAIL_PROBABILITY[:TAIL_FACTOR]]]，如 0.4:0.3:0.05:8"""
+        values = [float(v) for v in spec.split(":")]
+        return cls(*values, seed=seed)
+
+    def sample(self) -> float:
+        with self._lock:
+            latency = self.median * self._random.lognormvariate(0.0, self.sigma) if self.sigma else self.median
+            if self._random.random() < self.tail_probability:
+                latency *= self.tail_factor
+        return latency
+
+    def __str__(self):
+        return f"median={self.median}s sigma={self.sigma} tail={self.tail_probability}x{self.tail_factor}"
+
+
+class FakeOllama:
+    """
+    在后台线程中运行的模拟 Ollama 服务
+
+    与 OLLAMA_NUM_PARALLEL 相同，最多同时生成 parallel 个响应，其余请求排队，排队时间计入响应耗时
+    """
+
+    def __init__(self, port=0, latency=None, fail_rate=0.0, tokens=20, parallel=1, host="127.0.0.1"):
+        self.latency = latency or LatencyModel()
+        self.parallel = threading.Semaphore(parallel)
+        self.fail_rate = fail_rate
+        self.tokens = tokens
+        self.stats = {"requests": 0, "completed": 0, "cancelled": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # HTTP/1.0：流式响应不带 Content-Length，以关闭连接结束
+            protocol_version = "HTTP/1.0"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _json(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._json(200, {"models": [{"name": "fake"}]})
+                elif self.path == "/stats":
+                    self._json(200, fake.stats)
+                else:
+                    self._json(404, {"error": "not found"})
+
+            def do_POST(self):
+                if self.path not in ("/api/generate", "/api/chat"):
+                    self._json(404, {"error": "not found"})
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                fake._count("requests")
+                if random.random() < fake.fail_rate:
+                    fake._count("failed")
+                    self._json(500, {"error": "simulated failure"})
+                    return
+
+                latency = fake.latency.sample()
+                words = [f"token{i}" for i in range(fake.tokens)]
+                chat = self.path == "/api/chat"
+
+                def chunk(text, done):
+                    payload = {"model": request.get("model", "fake"), "created_at": "", "done": done}
+                    if chat:
+                        payload["message"] = {"role": "assistant", "content": text}
+                    else:
+                        payload["response"] = text
+                    if done:
+                        payload.update({"total_duration": int(latency * 1e9), "eval_count": len(words)})
+                    return payload
+
+                try:
+                    with fake.parallel:
+                        self._generate(request, latency, words, chunk)
+                    fake._count("completed")
+                except (BrokenPipeError, ConnectionResetError):
+                    fake._count("cancelled")
+
+            def _generate(self, request, latency, words, chunk):
+                if request.get("stream", True):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.end_headers()
+                    # 把耗时均摊到每个 token 上，客户端断开时在下一次写入时发现
+                    for word in words:
+                        time.sleep(latency / len(words))
+                        self.wfile.write((json.dumps(chunk(word + " ", False)) + "\n").encode("utf-8"))
+                        self.wfile.flush()
+                    self.wfile.write((json.dumps(chunk("", True)) + "\n").encode("utf-8"))
+                    self.wfile.flush()
+                else:
+                    time.sleep(latency)
+                    self._json(200, chunk(" ".join(words), True))
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="启动本地模拟 Ollama 服务")
+    parser.add_argument("--port", type=int, nargs="+", default=[11435], help="端口，可指定多个以启动多个后端")
+    parser.add_argument("--latency", nargs="+", default=["0.5:0.3"],
+                        help="每个后端的耗时分布 MEDIAN[:SIGMA[:TAIL_PROBABILITY[:TAIL_FACTOR]]]，个数不足时复用最后一个")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="返回 500 的概率")
+    parser.add_argument("--tokens", type=int, default=20, help="每个响应的 token 数")
+    parser.add_argument("--parallel", type=int, default=1, help="每个后端同时生成的响应数（OLLAMA_NUM_PARALLEL）")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    args = parser.parse_args()
+
+    servers = []
+    for i, port in enumerate(args.port):
+        latency = LatencyModel.parse(args.latency[min(i, len(args.latency) - 1)], seed=args.seed)
+        server = FakeOllama(port, latency, args.fail_rate, args.tokens, args.parallel).start()
+        logger.info(f"模拟 Ollama: {server.url} ({latency})")
+        servers.append(server)
+    logger.info(f"OLLAMA_BACKENDS={','.join(server.url for server in servers)}")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for server in servers:
+            server.stop()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Chroma 集合迁移工具
+按当前 HNSW 配置（hnsw:space / M / construction_ef / search_ef）重建已有集合，
+直接复制已存储的向量、文档和元数据，无需重新运行嵌入模型
+"""
+
+import sys
+import argparse
+import logging
+from pathlib import Path
+
+import chromadb
+from chromadb.config import Settings
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from utils.index_config import get_chroma_hnsw_metadata
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def migrate_collection(client, collection_name, hnsw_metadata=None, batch_size=1000, force=False):
+    """
+    按新的 HNSW 配置重建集合
+
+    先写入临时集合，复制完成后删除旧集合并把临时集合改名为原名称
+
+    Args:
+        client: Chroma 客户端
+        collection_name: 集合名称
+        hnsw_metadata: HNSW 元数据，默认读取配置
+        batch_size: 每批复制的记录数
+        force: 配置未变化时也重建
+
+    Returns:
+        复制的记录数
+    """
+    hnsw_metadata = hnsw_metadata or get_chroma_hnsw_metadata(collection_name)
+    source = client.get_collection(collection_name)
+    current = source.metadata or {}
+
+    if not force and all(current.get(k) == v for k, v in hnsw_metadata.items()):
+        logger.info(f"集合 {collection_name} 的 HNSW 配置已是最新，无需迁移")
+        return 0
+
+    logger.info(f"迁移集合 {collection_name}: {current} -> {hnsw_metadata}")
+    metadata = {**{k: v for k, v in current.items() if not k.startswith("hnsw:")}, **hnsw_metadata}
+
+    tmp_name = f"{collection_name}__migrating"
+    try:
+        client.delete_collection(tmp_name)
+    except Exception:
+        pass
+    target = client.create_collection(name=tmp_name, metadata=metadata)
+
+    total = source.count()
+    copied = 0
+    for offset in range(0, total, batch_size):
+        batch = source.get(
+            limit=batch_size,
+            offset=offset,
+            include=["embeddings", "documents", "metadatas"]
+        )
+        if not batch["ids"]:
+            break
+        target.add(
+            ids=batch["ids"],
+            embeddings=batch["embeddings"],
+            documents=batch["documents"],
+            metadatas=batch["metadatas"]
+        )
+        copied += len(batch["ids"])
+        logger.info(f"已复制 {copied}/{total} 条记录")
+
+    if copied != total:
+        client.delete_collection(tmp_name)
+        raise RuntimeError(f"迁移中断: 只复制了 {copied}/{total} 条记录，原集合未改动")
+
+    client.delete_collection(collection_name)
+    target.modify(name=collection_name)
+    logger.info(f"集合 {collection_name} 迁移完成，共 {copied} 条记录")
+    return copied
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="按当前 HNSW 配置重建 Chroma 集合")
+    parser.add_argument("--db-path", default="backend/db/financial_bge_m3.db", help="Chroma 数据库路径")
+    parser.add_argument("--collection", default="financial_concepts", help="集合名称")
+    parser.add_argument("--force", action="store_true", help="配置未变化时也重建")
+    args = parser.parse_args()
+
+    client = chromadb.PersistentClient(
+        path=args.db_path,
+        settings=Settings(anonymized_telemetry=False, allow_reset=True)
+    )
+    migrate_collection(client, args.collection, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Milvus 向量索引选择与调优工具
+在同一份向量上分别构建 FLAT / IVF_FLAT / HNSW / IVF_SQ8 索引，扫描 nlist/nprobe、M/ef 参数，
+以精确检索结果为基准测量 recall@k 和 p50/p99 延迟，并把选中的索引与检索参数写入配置文件，
+StdService 启动时读取该配置
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+from pathlib import Path
+
+import numpy as np
+from pymilvus import MilvusClient, DataType
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from utils.vector_store import NumpyVectorStore
+from utils.index_config import save_collection_index_config, DEFAULT_INDEX_CONFIG_PATH
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 候选索引及其构建参数 / 检索参数扫描范围
+INDEX_CANDIDATES = [
+    {"index_type": "FLAT", "index_params": {}, "search_sweep": [{}]},
+    *[
+        {"index_type": index_type, "index_params": {"nlist": nlist},
+         "search_sweep": [{"nprobe": nprobe} for nprobe in (4, 8, 16, 32, 64) if nprobe <= nlist]}
+        for index_type in ("IVF_FLAT", "IVF_SQ8")
+        for nlist in (64, 128, 256)
+    ],
+    *[
+        {"index_type": "HNSW", "index_params": {"M": m, "efConstruction": 200},
+         "search_sweep": [{"ef": ef} for ef in (16, 32, 64, 128, 256)]}
+        for m in (8, 16, 32)
+    ],
+]
+
+
+class MilvusIndexTuner:
+    """Milvus 索引调优器"""
+
+    def __init__(self, uri, metric_type="COSINE", top_k=5):
+        """
+        初始化调优器
+
+        Args:
+            uri: Milvus 地址（Milvus Lite 数据库文件路径或 http://host:19530）
+            metric_type: 向量度量方式
+            top_k: recall@k 中的 k
+        """
+        self.client = MilvusClient(uri)
+        self.metric_type = metric_type
+        self.top_k = top_k
+
+    def load_vectors(self, collection_name=None, artifact_path=None):
+        """从向量产物或已有集合加载全部向量"""
+        if artifact_path:
+            logger.info(f"从向量产物加载向量: {artifact_path}")
+            return NumpyVectorStore.from_artifact(artifact_path, metric="cosine").matrix
+        logger.info(f"从集合加载向量: {collection_name}")
+        self.client.load_collection(collection_name)
+        try:
+            store = NumpyVectorStore.from_milvus(self.client, collection_name, [], metric="cosine")
+        finally:
+            self.client.release_collection(collection_name)
+        return store.matrix
+
+    def split_queries(self, vectors, num_queries, seed=42):
+        """留出一部分向量作为查询集，其余作为被检索的底库"""
+        rng = np.random.default_rng(seed)
+        num_queries = min(num_queries, len(vectors) // 10 or 1)
+        query_rows = rng.choice(len(vectors), size=num_queries, replace=False)
+        mask = np.ones(len(vectors), dtype=bool)
+        mask[query_rows] = False
+        return vectors[mask], vectors[query_rows]
+
+    def ground_truth(self, base, queries):
+        """精确检索得到的 top-k 行号"""
+        exact = NumpyVectorStore(base, [str(i) for i in range(len(base))], [{}] * len(base), metric="cosine")
+        return [[row for row, _ in hits] for hits in exact.topk(queries, self.top_k)]
+
+    def _create_scratch_collection(self, name, base, candidate):
+        """创建临时集合、写入底库并按候选参数建索引"""
+        if self.client.has_collection(name):
+            self.client.drop_collection(name)
+
+        schema = self.client.create_schema(auto_id=False, enable_dynamic_field=False)
+        schema.add_field("id", DataType.INT64, is_primary=True)
+        schema.add_field("vector", DataType.FLOAT_VECTOR, dim=base.shape[1])
+        self.client.create_collection(collection_name=name, schema=schema)
+
+        batch_size = 1000
+        for start in range(0, len(base), batch_size):
+            chunk = base[start:start + batch_size]
+            self.client.insert(
+                collection_name=name,
+                data=[{"id": start + i, "vector": vec.tolist()} for i, vec in enumerate(chunk)]
+            )
+
+        index_params = self.client.prepare_index_params()
+        index_params.add_index(
+            field_name="vector",
+            index_type=candidate["index_type"],
+            metric_type=self.metric_type,
+            params=candidate["index_params"]
+        )
+        build_start = time.perf_counter()
+        self.client.create_index(collection_name=name, index_params=index_params)
+        self.client.load_collection(name)
+        return time.perf_counter() - build_start
+
+    def _measure(self, name, queries, truth, search_params):
+        """逐条查询测量延迟，并计算 recall@k"""
+        latencies = []
+        hits_found = 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            result = self.client.search(
+                collection_name=name,
+                data=[query.tolist()],
+                limit=self.top_k,
+                search_params={"metric_type": self.metric_type, "params": search_params}
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+            found = {hit["id"] for hit in result[0]}
+            hits_found += len(found & set(expected))
+        latencies = np.array(latencies)
+        return {
+            "recall_at_k": hits_found / (len(truth) * self.top_k),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+        }
+
+    def tune(self, base, queries, candidates=INDEX_CANDIDATES, scratch_name="index_tuning_scratch"):
+        """对所有候选索引和检索参数进行测量"""
+        truth = self.ground_truth(base, queries)
+        results = []
+        try:
+            for candidate in candidates:
+                build_seconds = self._create_scratch_collection(scratch_name, base, candidate)
+                for search_params in candidate["search_sweep"]:
+                    metrics = self._measure(scratch_name, queries, truth, search_params)
+                    row = {
+                        "index_type": candidate["index_type"],
+                        "index_params": candidate["index_params"],
+                        "search_params": search_params,
+                        "build_seconds": round(build_seconds, 3),
+                        **metrics,
+                    }
+                    results.append(row)
+                    logger.info(
+                        f"{row['index_type']:<8} {row['index_params']} {search_params}: "
+                        f"recall@{self.top_k}={metrics['recall_at_k']:.4f} "
+                        f"p50={metrics['p50_ms']:.2f}ms p99={metrics['p99_ms']:.2f}ms"
+                    )
+        finally:
+            if self.client.has_collection(scratch_name):
+                self.client.drop_collection(scratch_name)
+        return results
+
+    @staticmethod
+    def choose(results, min_recall):
+        """选择满足召回率要求且 p50 延迟最低的配置，都不满足时选召回率最高的"""
+        eligible = [r for r in results if r["recall_at_k"] >= min_recall]
+        if eligible:
+            return min(eligible, key=lambda r: (r["p50_ms"], r["p99_ms"]))
+        return max(results, key=lambda r: (r["recall_at_k"], -r["p50_ms"]))
+
+    def apply(self, collection_name, choice):
+        """用选中的索引重建目标集合的向量索引"""
+        self.client.release_collection(collection_name)
+        for index_name in self.client.list_indexes(collection_name, field_name="vector"):
+            self.client.drop_index(collection_name, index_name)
+        index_params = self.client.prepare_index_params()
+        index_params.add_index(
+            field_name="vector",
+            index_type=choice["index_type"],
+            metric_type=self.metric_type,
+            params=choice["index_params"]
+        )
+        self.client.create_index(collection_name=collection_name, index_params=index_params)
+        logger.info(f"已为集合 {collection_name} 重建 {choice['index_type']} 索引")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="Milvus 向量索引选择与调优")
+    parser.add_argument("--uri", default="backend/db/snomed_bge_m3.db", help="Milvus 地址或 Milvus Lite 数据库文件")
+    parser.add_argument("--collection", default="concepts_only_name", help="目标集合（配置按该名称保存）")
+    parser.add_argument("--artifact", default=None, help="向量产物目录，提供时从产物加载向量")
+    parser.add_argument("--num-queries", type=int, default=200, help="留出查询集大小")
+    parser.add_argument("--top-k", type=int, default=5, help="recall@k 中的 k")
+    parser.add_argument("--min-recall", type=float, default=0.95, help="选择索引时要求的最低召回率")
+    parser.add_argument("--config", default=str(DEFAULT_INDEX_CONFIG_PATH), help="写出的索引配置文件")
+    parser.add_argument("--apply", action="store_true", help="同时用选中的索引重建目标集合")
+    args = parser.parse_args()
+
+    if os.path.exists(args.uri):
+        logger.warning("Milvus Lite 只支持 FLAT 索引，其它索引类型会退化为 FLAT；请对 Milvus 服务端调优以获得有意义的对比")
+
+    tuner = MilvusIndexTuner(args.uri, top_k=args.top_k)
+    vectors = tuner.load_vectors(args.collection, args.artifact)
+    base, queries = tuner.split_queries(vectors, args.num_queries)
+    logger.info(f"底库 {len(base)} 条，查询 {len(queries)} 条")
+
+    results = tuner.tune(base, queries)
+    choice = MilvusIndexTuner.choose(results, args.min_recall)
+    logger.info(f"选中配置: {choice}")
+
+    save_collection_index_config(args.collection, {
+        "metric_type": tuner.metric_type,
+        **choice,
+        "min_recall": args.min_recall,
+        "num_vectors": int(len(vectors)),
+        "num_queries": int(len(queries)),
+        "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }, args.config)
+
+    if args.apply:
+        tuner.apply(args.collection, choice)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import json
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ABBREVIATION_DICT_VERSION = 1
+
+_DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+# 离线挖掘的缩写词典（tools/build_abbreviation_dictionary.py 写出），不存在时只使用人工整理的列表
+DEFAULT_ABBREVIATION_DICT_PATH = _DATA_DIR / "abbreviations.json"
+DEFAULT_CURATED_ABBREVIATIONS_PATH = _DATA_DIR / "abbreviations_curated.json"
+
+# 文本中形如缩写的 token：点号分隔的大写字母（S.O.B.、S.O.B），
+# 或大写字母开头、可包含数字和 / & + - 连接的部分（N/V、HbA1c、COVID-19）
+_ABBR_TOKEN_RE = re.compile(
+    r"(?<![\w/&+-])(?:[A-Z](?:\.[A-Z])+\.?|[A-Z][A-Za-z0-9]*(?:[/&+-][A-Za-z0-9]+)*)(?![\w/&+-])"
+)
+# token 后紧跟冒号时为小节标题（PHYSICAL EXAM:、PLAN:）
+_HEADER_SUFFIX_RE = re.compile(r"[ \t]*:")
+# 点号缩写后为文本结尾、换行或下一句（空白后大写字母）时，末尾的点号兼作句号
+_SENTENCE_END_RE = re.compile(r"\s*$|[ \t]*[\r\n]|\s+[A-Z]")
+# 罗马数字（type II、stage III）不视为缩写
+_ROMAN_NUMERALS = {"II", "III", "VI", "VII", "VIII", "IX", "XI", "XII"}
+# 病历中全大写书写的普通单词（小节标题、模板中的虚词），不在词典中时不视为未知缩写；
+# 超过 6 个字母的全大写单词已由 is_abbreviation_like 排除
+_COMMON_WORDS = frozenset("""
+    AN AND ARE AS AT BE BUT BY DO FOR FROM HAS HAD HE HER HIS IF IN INTO IS IT ITS NO NOR NOT OF OFF ON OR OUT
+    OVER PER SHE THE THEN THIS TO UP WAS WITH YES NONE ALL ANY
+    PLAN PLANS EXAM EXAMS LAB LABS MEDS NOTE NOTES DATE TIME NAME AGE SEX VITAL VITALS SIGNS REVIEW SOCIAL
+    FAMILY CHIEF PAST OTHER HEAD NECK CHEST HEART LUNGS SKIN EYES EARS NOSE MOUTH THROAT BACK NEURO PSYCH
+    STATUS DENIES NORMAL LEFT RIGHT STABLE ACTIVE ALERT CLEAR SOFT WARM DRY ORDERS RESULT HOME DAILY
+""".split())
+# 次选扩展的得分不低于首选的该比例时视为有歧义
+AMBIGUITY_RATIO = 0.2
+
+
+def normalize_abbreviation(token: str) -> str:
+    """词典键：去掉首尾标点和缩写中的点号（S.O.B. -> SOB），转为大写"""
+    token = token.strip().strip(".,;:()[]").replace(".", "")
+    return token.upper()
+
+
+def is_abbreviation_like(token: str) -> bool:
+    """
+    判断 token 是否形如缩写
+
+    至少两个大写字母且大写字母不少于字母总数的一半；纯字母 token 最长 6 个字母，
+    更长的全大写单词（如标题中的 HISTORY）不视为缩写
+    """
+    letters = [c for c in token if c.isalpha()]
+    upper = sum(c.isupper() for c in letters)
+    if upper < 2 or upper * 2 < len(letters) or token in _ROMAN_NUMERALS:
+        return False
+    if token.isalpha() and len(token) > 6:
+        return False
+    return 2 <= len(token) <= 12
+
+
+def find_abbreviation_candidates(text: str) -> List[Tuple[int, int, str]]:
+    """
+    找出文本中形如缩写的 token，返回 (起始偏移, 结束偏移, token)
+
+    位于句末的点号缩写（"Pt has S.O.B."）末尾的点号同时是句号，不计入 token，替换为扩展时保留句号
+    """
+    candidates = []
+    for match in _ABBR_TOKEN_RE.finditer(text):
+        start, end, token = match.start(), match.end(), match.group()
+        if not is_abbreviation_like(token):
+            continue
+        if token.endswith(".") and _SENTENCE_END_RE.match(text, end):
+            end, token = end - 1, token[:-1]
+        candidates.append((start, end, token))
+    return candidates
+
+
+def is_common_word(token: str) -> bool:
+    """全大写书写的普通单词（ASSESSMENT AND PLAN 中的 AND、LABS），不是缩写"""
+    return token.upper() in _COMMON_WORDS
+
+
+def inline_case(expansion: str) -> str:
+    """句中替换时把首字母小写（Dyspnea -> dyspnea），保留 HIV、X-ray 这类本身的大写"""
+    if len(expansion) > 1 and expansion[0].isupper() and expansion[1].islower():
+        return expansion[0].lower() + expansion[1:]
+    return expansion
+
+
+@dataclass
+class AbbreviationEntry:
+    """
+    单个缩写的词典条目
+
+    expansions 按得分降序排列，每项为 {"expansion", "concept_ids", "score", "sources"}
+    """
+    abbreviation: str
+    expansions: List[Dict] = field(default_factory=list)
+    ambiguous: bool = False
+
+    @property
+    def best(self) -> Optional[Dict]:
+        return self.expansions[0] if self.expansions else None
+
+    def to_dict(self) -> Dict:
+        return {"ambiguous": self.ambiguous, "expansions": self.expansions}
+
+
+class AbbreviationDictionary:
+    """
+    缩写词典
+
+    无歧义的常见缩写（SOB、HTN、MI）在本地直接展开，只有有歧义或未知的缩写才交给 LLM
+    """
+
+    def __init__(self, entries: Dict[str, AbbreviationEntry]):
+        self.entries = entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, token: str) -> bool:
+        return normalize_abbreviation(token) in self.entries
+
+    def lookup(self, token: str) -> Optional[AbbreviationEntry]:
+        """查询缩写，不存在时返回 None"""
+        return self.entries.get(normalize_abbreviation(token))
+
+    def candidates(self, text: str) -> List[Tuple[int, int, str]]:
+        """
+        文本中需要展开的缩写，返回 (起始偏移, 结束偏移, token)
+
+        词典中的缩写全部保留（HPI: 中的 HPI 照常展开）；不在词典中的 token 后面紧跟冒号（小节标题 EXAM:、LABS:）
+        或是普通单词（AND、PLAN）时不视为缩写，不再作为未知缩写交给 LLM
+        """
+        return [
+            (start, end, token) for start, end, token in find_abbreviation_candidates(text)
+            if normalize_abbreviation(token) in self.entries
+            or not (_HEADER_SUFFIX_RE.match(text, end) or is_common_word(token))
+        ]
+
+    def expand(self, text: str) -> Dict:
+        """
+        在本地展开文本中所有无歧义的已知缩写
+
+        Returns:
+            {
+                "text": 展开后的文本,
+                "resolved": [{"abbreviation", "start", "end", "expansion", "concept_ids"}],
+                "unresolved": [{"abbreviation", "start", "end", "reason": "ambiguous" / "unknown",
+                                "candidates": 有歧义时的候选扩展}]
+            }
+            偏移均相对于原始文本
+        """
+        resolved, unresolved = [], []
+        for start, end, token in self.candidates(text):
+            entry = self.lookup(token)
+            if entry is None or not entry.expansions:
+                unresolved.append({"abbreviation": token, "start": start, "end": end, "reason": "unknown"})
+            elif entry.ambiguous:
+                unresolved.append({
+                    "abbreviation": token, "start": start, "end": end, "reason": "ambiguous",
+                    "candidates": [e["expansion"] for e in entry.expansions],
+                })
+            else:
+                resolved.append({
+                    "abbreviation": token, "start": start, "end": end,
+                    "expansion": entry.best["expansion"],
+                    "concept_ids": list(entry.best.get("concept_ids", [])),
+                })
+
+        # 从后往前替换，保持前面的偏移不变
+        expanded = text
+        for item in reversed(resolved):
+            expanded = expanded[:item["start"]] + inline_case(item["expansion"]) + expanded[item["end"]:]
+        return {"text": expanded, "resolved": resolved, "unresolved": unresolved}
+
+    @classmethod
+    def from_evidence(cls, evidence: Iterable[Tuple[str, str, Optional[str], str, float]],
+                      explicit_ambiguous: Iterable[str] = (),
+                      authoritative: Iterable[str] = ()) -> "AbbreviationDictionary":
+        """
+        由挖掘到的证据构建词典
+
+        Args:
+            evidence: (缩写, 扩展, 概念ID或None, 来源, 权重) 序列，相同扩展（忽略大小写）的证据合并计分
+            explicit_ambiguous: 人工标注为有歧义的缩写
+            authoritative: 歧义标注以人工列表为准的缩写（人工整理过的缩写），其余缩写按证据判断
+        """
+        grouped: Dict[str, Dict[str, Dict]] = {}
+        for abbreviation, expansion, concept_id, source, weight in evidence:
+            key = normalize_abbreviation(abbreviation)
+            expansion = expansion.strip()
+            if not key or not expansion:
+                continue
+            item = grouped.setdefault(key, {}).setdefault(expansion.lower(), {
+                "expansion": expansion, "concept_ids": [], "score": 0.0, "sources": [],
+            })
+            item["score"] += weight
+            if concept_id and concept_id not in item["concept_ids"]:
+                item["concept_ids"].append(concept_id)
+            if source not in item["sources"]:
+                item["sources"].append(source)
+
+        explicit_ambiguous = {normalize_abbreviation(a) for a in explicit_ambiguous}
+        authoritative = {normalize_abbreviation(a) for a in authoritative}
+        entries = {}
+        for key, items in grouped.items():
+            expansions = sorted(items.values(), key=lambda e: e["score"], reverse=True)
+            if key in authoritative:
+                ambiguous = key in explicit_ambiguous
+            else:
+                senses = _sense_scores(expansions)
+                ambiguous = any(score >= AMBIGUITY_RATIO * senses[0] for score in senses[1:])
+            entries[key] = AbbreviationEntry(key, expansions, ambiguous)
+        return cls(entries)
+
+    @classmethod
+    def from_curated(cls, path=DEFAULT_CURATED_ABBREVIATIONS_PATH) -> "AbbreviationDictionary":
+        """只由人工整理的列表构建（列出多个扩展的缩写视为有歧义）"""
+        return cls.from_evidence(curated_evidence(path), curated_ambiguous(path), curated_abbreviations(path))
+
+    @classmethod
+    def load(cls, path) -> "AbbreviationDictionary":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != ABBREVIATION_DICT_VERSION:
+            raise ValueError(f"Unsupported abbreviation dictionary version {data.get('version')} at {path}")
+        return cls({
+            key: AbbreviationEntry(key, value["expansions"], value.get("ambiguous", False))
+            for key, value in data["entries"].items()
+        })
+
+    def save(self, path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "version": ABBREVIATION_DICT_VERSION,
+            "entries": {key: entry.to_dict() for key, entry in sorted(self.entries.items())},
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        logger.info(f"Saved {len(self.entries)} abbreviations to {path}")
+        return path
+
+
+def _sense_scores(expansions: List[Dict]) -> List[float]:
+    """
+    按含义合并扩展的得分（降序）
+
+    指向同一概念的不同写法（Dyspnea / Shortness of breath）算作同一含义
+    """
+    senses: List[Tuple[set, float]] = []
+    for expansion in expansions:
+        ids = set(expansion["concept_ids"])
+        for i, (sense_ids, score) in enumerate(senses):
+            if ids & sense_ids:
+                senses[i] = (sense_ids | ids, score + expansion["score"])
+                break
+        else:
+            senses.append((ids, expansion["score"]))
+    return sorted((score for _, score in senses), reverse=True)
+
+
+def _read_curated(path) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("abbreviations", {})
+
+
+def curated_evidence(path=DEFAULT_CURATED_ABBREVIATIONS_PATH, weight: float = 5.0):
+    """
+    人工整理列表中的证据
+
+    同一缩写的多个扩展按列出顺序递减计分（首选 weight，其后每项减 1），保持人工排序
+    """
+    for abbreviation, value in _read_curated(path).items():
+        for rank, expansion in enumerate(value.get("expansions", [])):
+            yield abbreviation, expansion, None, "curated", max(weight - rank, 1.0)
+
+
+def curated_abbreviations(path=DEFAULT_CURATED_ABBREVIATIONS_PATH) -> List[str]:
+    """人工整理列表中的全部缩写"""
+    return list(_read_curated(path))
+
+
+def curated_ambiguous(path=DEFAULT_CURATED_ABBREVIATIONS_PATH) -> List[str]:
+    """人工整理列表中有歧义的缩写：列出多个扩展或显式标注 ambiguous"""
+    return [
+        abbreviation for abbreviation, value in _read_curated(path).items()
+        if value.get("ambiguous") or len(value.get("expansions", [])) > 1
+    ]
+
+
+_dictionary: Optional[AbbreviationDictionary] = None
+_dictionary_lock = threading.Lock()
+
+
+def get_abbreviation_dictionary() -> AbbreviationDictionary:
+    """
+    进程内共享的缩写词典
+
+    优先加载挖掘得到的词典（ABBREVIATION_DICT_PATH 环境变量或默认路径），不存在时使用人工整理的列表
+    """
+    global _dictionary
+    if _dictionary is None:
+        with _dictionary_lock:
+            if _dictionary is None:
+                path = Path(os.getenv("ABBREVIATION_DICT_PATH", str(DEFAULT_ABBREVIATION_DICT_PATH)))
+                if path.exists():
+                    _dictionary = AbbreviationDictionary.load(path)
+                    logger.info(f"Loaded {len(_dictionary)} abbreviations from {path}")
+                else:
+                    _dictionary = AbbreviationDictionary.from_curated()
+                    logger.info(f"Abbreviation dictionary not found at {path}; "
+                                f"using {len(_dictionary)} curated abbreviations")
+    return _dictionary
@@ -0,0 +1,179 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 每个 (provider, model) 同时进行的 LLM 生成数上限，LLM_CONCURRENCY_LIMITS 可按 "provider/model" 单独配置，
+# 如 {"ollama/qwen2.5:7b": 2, "openai/gpt-4o-mini": 16}
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+CONCURRENCY_LIMITS: Dict[str, int] = json.loads(os.getenv("LLM_CONCURRENCY_LIMITS", "{}"))
+# 等待队列长度上限（按请求数计），队列满时立即拒绝
+DEFAULT_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "16"))
+# 在队列中等待的最长时间（秒），超时同样拒绝
+QUEUE_TIMEOUT_S = float(os.getenv("LLM_QUEUE_TIMEOUT_S", "30"))
+
+# 优先级：交互式请求总是排在批量请求之前
+PRIORITIES = {"interactive": 0, "batch": 1}
+DEFAULT_PRIORITY = "interactive"
+
+
+class AdmissionRejected(Exception):
+    """请求未被接纳（队列已满或等待超时），retry_after 为建议的重试间隔（秒）"""
+
+    def __init__(self, key: str, reason: str, retry_after: int):
+        super().__init__(f"LLM {key} is overloaded ({reason}), retry after {retry_after}s")
+        self.key = key
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class ModelQueue:
+    """
+    单个 (provider, model) 的准入队列
+
+    容量按生成数计：请求声明自身最多同时发起的生成数（weight），空闲容量不小于队首请求的 weight 时才放行，
+    队首按优先级、同优先级按到达顺序排列，不会被后到的小请求插队
+    """
+
+    def __init__(self, key: str, max_concurrency: int, max_queue: int):
+        self.key = key
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.in_use = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._wait_ms = deque(maxlen=500)
+        # 单个请求持有容量的平均时长（秒），用于估算 Retry-After
+        self._service_s: Optional[float] = None
+        self.stats = {"admitted": 0, "rejected_full": 0, "rejected_timeout": 0}
+
+    def _queued(self):
+        return [w for w in self._waiters if not w[3].done()]
+
+    def _retry_after(self, weight: int) -> int:
+        """前面排队的生成都完成所需的大致时间"""
+        queued = sum(w[2] for w in self._queued()) + weight
+        service_s = self._service_s or 1.0
+        return max(1, math.ceil(service_s * queued / self.max_concurrency))
+
+    def _dispatch(self):
+        while self._waiters:
+            priority, seq, weight, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self.in_use + weight > self.max_concurrency:
+                return
+            heapq.heappop(self._waiters)
+            self.in_use += weight
+            future.set_result(None)
+
+    async def acquire(self, priority: str = DEFAULT_PRIORITY, weight: int = 1,
+                      timeout: float = QUEUE_TIMEOUT_S) -> float:
+        """
+        申请 weight 个生成容量
+
+        Returns:
+            排队等待的毫秒数
+
+        Raises:
+            AdmissionRejected: 队列已满或等待超时
+        """
+        weight = max(1, min(weight, self.max_concurrency))
+        started_at = time.perf_counter()
+        if not self._queued() and self.in_use + weight <= self.max_concurrency:
+            self.in_use += weight
+        else:
+            if len(self._queued()) >= self.max_queue:
+                self.stats["rejected_full"] += 1
+                raise AdmissionRejected(self.key, "queue_full", self._retry_after(weight))
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (PRIORITIES.get(priority, 0), next(self._seq), weight, future))
+            try:
+                await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                if future.done():
+                    # 超时的同时刚好被放行：归还容量
+                    self.release(weight)
+                future.cancel()
+                # 放弃的等待方可能在队首挡住后面较小的请求：重新分配空闲容量
+                self._dispatch()
+                self.stats["rejected_timeout"] += 1
+                raise AdmissionRejected(self.key, "queue_timeout", self._retry_after(weight))
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self.release(weight)
+                future.cancel()
+                self._dispatch()
+                raise
+        waited_ms = (time.perf_counter() - started_at) * 1000
+        self._wait_ms.append(waited_ms)
+        self.stats["admitted"] += 1
+        return waited_ms
+
+    def release(self, weight: int = 1, service_s: Optional[float] = None):
+        weight = max(1, min(weight, self.max_concurrency))
+        self.in_use -= weight
+        if service_s is not None:
+            self._service_s = service_s if self._service_s is None else 0.8 * self._service_s + 0.2 * service_s
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: str = DEFAULT_PRIORITY, weight: int = 1):
+        await self.acquire(priority, weight)
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(weight, time.perf_counter() - started_at)
+
+    def snapshot(self) -> Dict:
+        queued = self._queued()
+        waits = sorted(self._wait_ms)
+
+        def percentile(q):
+            return round(waits[min(len(waits) - 1, int(q * len(waits)))], 2) if waits else 0.0
+
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_use": self.in_use,
+            "queue_depth": len(queued),
+            "queue_depth_by_priority": {
+                name: sum(1 for w in queued if w[0] == rank) for name, rank in PRIORITIES.items()
+            },
+            "max_queue": self.max_queue,
+            "wait_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "max": round(waits[-1], 2) if waits else 0.0},
+            "service_ms": round(self._service_s * 1000, 2) if self._service_s is not None else None,
+            **self.stats,
+        }
+
+
+_queues: Dict[str, ModelQueue] = {}
+
+
+def model_key(llm_options: dict) -> str:
+    return f"{llm_options.get('provider', 'ollama')}/{llm_options.get('model', 'llama3.1:8b')}"
+
+
+def get_model_queue(llm_options: dict) -> ModelQueue:
+    """按 (provider, model) 共享的准入队列（只在事件循环中使用，无需加锁）"""
+    key = model_key(llm_options)
+    queue = _queues.get(key)
+    if queue is None:
+        queue = _queues[key] = ModelQueue(
+            key, CONCURRENCY_LIMITS.get(key, DEFAULT_MAX_CONCURRENCY), DEFAULT_MAX_QUEUE
+        )
+    return queue
+
+
+def admission_metrics() -> Dict[str, Dict]:
+    return {key: queue.snapshot() for key, queue in _queues.items()}
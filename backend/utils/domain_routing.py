@@ -0,0 +1,82 @@
+import json
+import logging
+import os
+import re
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# NER entity_group -> SNOMED domain_id 列表
+# 未出现在映射中的实体类型检索整个集合
+DEFAULT_ENTITY_DOMAIN_MAP: Dict[str, List[str]] = {
+    "DISEASE_DISORDER": ["Condition"],
+    "SIGN_SYMPTOM": ["Condition", "Observation"],
+    "COMBINED_BIO_SYMPTOM": ["Condition", "Observation"],
+    "THERAPEUTIC_PROCEDURE": ["Procedure"],
+    "DIAGNOSTIC_PROCEDURE": ["Procedure", "Measurement"],
+    "MEDICATION": ["Drug"],
+    "BIOLOGICAL_STRUCTURE": ["Spec Anatomic Site"],
+    "LAB_VALUE": ["Measurement", "Meas Value"],
+}
+
+_entity_domain_map: Optional[Dict[str, List[str]]] = None
+
+
+def load_entity_domain_map(path: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    加载实体类型到 SNOMED 领域的映射
+
+    默认映射可被 JSON 文件覆盖（ENTITY_DOMAIN_MAP_PATH 环境变量或 path 参数），
+    文件格式为 {"DISEASE_DISORDER": ["Condition"], ...}，值为空列表表示该类型检索全部领域
+    """
+    mapping = {k: list(v) for k, v in DEFAULT_ENTITY_DOMAIN_MAP.items()}
+    path = path or os.getenv("ENTITY_DOMAIN_MAP_PATH")
+    if path:
+        with open(path, encoding="utf-8") as f:
+            overrides = json.load(f)
+        mapping.update({k.upper(): list(v) for k, v in overrides.items()})
+        logger.info(f"Loaded entity domain map overrides from {path}")
+    return mapping
+
+
+def get_entity_domain_map() -> Dict[str, List[str]]:
+    global _entity_domain_map
+    if _entity_domain_map is None:
+        _entity_domain_map = load_entity_domain_map()
+    return _entity_domain_map
+
+
+def domains_for_entity(entity_group: Optional[str]) -> Optional[List[str]]:
+    """返回实体类型对应的 SNOMED 领域，None 表示不限制领域"""
+    if not entity_group:
+        return None
+    domains = get_entity_domain_map().get(entity_group.upper())
+    return list(domains) if domains else None
+
+
+def domain_partition_name(domain_id: str) -> str:
+    """SNOMED domain_id 对应的 Milvus 分区名（分区名只允许字母、数字和下划线）"""
+    return "domain_" + re.sub(r"[^0-9A-Za-z_]+", "_", domain_id).strip("_")
+
+
+def insert_by_domain_partition(client, collection_name: str, data: List[Dict], field: str = "domain_id"):
+    """
+    按 domain_id 将数据写入对应的 Milvus 分区（分区不存在时创建）
+
+    Returns:
+        每个分区的插入结果 {分区名: 结果}
+    """
+    groups: Dict[str, List[Dict]] = {}
+    for row in data:
+        groups.setdefault(domain_partition_name(str(row[field])), []).append(row)
+
+    results = {}
+    for partition_name, rows in groups.items():
+        if not client.has_partition(collection_name, partition_name):
+            client.create_partition(collection_name, partition_name)
+        results[partition_name] = client.insert(
+            collection_name=collection_name,
+            data=rows,
+            partition_name=partition_name
+        )
+    return results
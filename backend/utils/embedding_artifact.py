@@ -0,0 +1,210 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 产物格式版本，格式变化时递增，旧产物会被自动忽略
+ARTIFACT_VERSION = 1
+
+VECTORS_FILE = "vectors.npy"
+MANIFEST_FILE = "manifest.csv"
+META_FILE = "meta.json"
+
+
+def file_sha256(path, chunk_size: int = 1 << 20) -> str:
+    """计算数据源文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _slug(value: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", value).strip("_")
+
+
+@dataclass
+class EmbeddingArtifact:
+    """
+    已落盘的向量产物
+
+    vectors 为只读内存映射矩阵（行号与 ids / metadata 一一对应），读取时不复制数据
+    """
+    path: Path
+    meta: Dict
+    vectors: np.ndarray
+    ids: List[str]
+    metadata: List[Dict[str, str]]
+    _index: Optional[Dict[str, int]] = field(default=None, repr=False)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dim(self) -> int:
+        return int(self.vectors.shape[1])
+
+    def index_of(self, item_id: str) -> int:
+        """根据ID返回行号"""
+        if self._index is None:
+            self._index = {item_id: i for i, item_id in enumerate(self.ids)}
+        return self._index[item_id]
+
+    def take(self, item_ids: Sequence[str], dtype=np.float32) -> np.ndarray:
+        """按ID取出向量（复制为连续矩阵，用于写入向量库）"""
+        rows = [self.index_of(str(item_id)) for item_id in item_ids]
+        return np.asarray(self.vectors[rows], dtype=dtype)
+
+
+class ArtifactWriter:
+    """
+    流式写入向量产物
+
+    先写入临时目录，正常退出 with 块时才原子地重命名为正式目录，
+    中途失败不会留下半成品
+    """
+    def __init__(self, final_dir: Path, meta: Dict, count: int, dim: int, dtype: str):
+        self.final_dir = final_dir
+        self.tmp_dir = final_dir.with_name(final_dir.name + ".tmp")
+        self.meta = dict(meta, count=count, dim=dim, dtype=dtype)
+        self.count = count
+        self.ids: List[Optional[str]] = [None] * count
+        self.metadata: List[Optional[Dict[str, str]]] = [None] * count
+        self.vectors = None
+        self.dtype = dtype
+        self.aborted = False
+
+    def __enter__(self):
+        if self.tmp_dir.exists():
+            shutil.rmtree(self.tmp_dir)
+        self.tmp_dir.mkdir(parents=True)
+        self.vectors = np.lib.format.open_memmap(
+            self.tmp_dir / VECTORS_FILE, mode="w+",
+            dtype=np.dtype(self.dtype), shape=(self.count, self.meta["dim"])
+        )
+        return self
+
+    def write(self, start: int, vectors, ids: Sequence[str], metadata: Sequence[Dict] = None):
+        """写入从第 start 行开始的一块向量"""
+        vectors = np.asarray(vectors)
+        end = start + len(ids)
+        self.vectors[start:end] = vectors
+        self.ids[start:end] = [str(i) for i in ids]
+        self.metadata[start:end] = [
+            {k: "" if v is None else str(v) for k, v in (m or {}).items()}
+            for m in (metadata if metadata is not None else [{}] * len(ids))
+        ]
+
+    def abort(self):
+        """放弃本次写入（如部分批次嵌入失败），删除临时目录，退出 with 块时不再生成产物"""
+        self.aborted = True
+        self.vectors = None
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None or self.aborted:
+            self.vectors = None
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+            return False
+
+        if any(i is None for i in self.ids):
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+            raise ValueError("Embedding artifact is incomplete: some rows were never written")
+
+        self.vectors.flush()
+        self.vectors = None
+
+        columns = sorted({key for row in self.metadata for key in row})
+        with open(self.tmp_dir / MANIFEST_FILE, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["id"] + columns)
+            for item_id, row in zip(self.ids, self.metadata):
+                writer.writerow([item_id] + [row.get(col, "") for col in columns])
+
+        with open(self.tmp_dir / META_FILE, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+
+        if self.final_dir.exists():
+            shutil.rmtree(self.final_dir)
+        os.replace(self.tmp_dir, self.final_dir)
+        logger.info(f"Embedding artifact written: {self.final_dir} ({self.count} x {self.meta['dim']}, {self.dtype})")
+        return False
+
+
+class EmbeddingArtifactStore:
+    """
+    向量产物仓库
+
+    以 (模型名称, 数据源文件哈希, 变体) 为键保存一次性生成的向量，
+    后续切换后端（Milvus / Chroma）、索引类型或集合结构时直接复用，无需重新运行嵌入模型
+    """
+    def __init__(self, root: str = "backend/artifacts/embeddings"):
+        self.root = Path(root)
+
+    def artifact_dir(self, model_name: str, source_path: str, variant: str = "default") -> Path:
+        source_hash = file_sha256(source_path)[:16]
+        return self.root / _slug(model_name) / f"{_slug(variant)}-{source_hash}-v{ARTIFACT_VERSION}"
+
+    def exists(self, model_name: str, source_path: str, variant: str = "default") -> bool:
+        return (self.artifact_dir(model_name, source_path, variant) / META_FILE).exists()
+
+    def load(self, model_name: str, source_path: str, variant: str = "default") -> Optional[EmbeddingArtifact]:
+        """加载产物，不存在时返回 None"""
+        path = self.artifact_dir(model_name, source_path, variant)
+        if not (path / META_FILE).exists():
+            return None
+        return self.load_dir(path)
+
+    @staticmethod
+    def load_dir(path) -> EmbeddingArtifact:
+        """从产物目录加载（向量以只读内存映射方式打开）"""
+        path = Path(path)
+        with open(path / META_FILE, encoding="utf-8") as f:
+            meta = json.load(f)
+
+        vectors = np.load(path / VECTORS_FILE, mmap_mode="r")
+
+        ids, metadata = [], []
+        with open(path / MANIFEST_FILE, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                ids.append(row.pop("id"))
+                metadata.append(row)
+
+        if len(ids) != vectors.shape[0]:
+            raise ValueError(f"Corrupted embedding artifact {path}: {len(ids)} ids vs {vectors.shape[0]} vectors")
+        return EmbeddingArtifact(path=path, meta=meta, vectors=vectors, ids=ids, metadata=metadata)
+
+    def writer(self, model_name: str, source_path: str, count: int, dim: int,
+               variant: str = "default", dtype: str = "float32") -> ArtifactWriter:
+        """
+        创建产物写入器
+
+        Args:
+            model_name: 嵌入模型名称
+            source_path: 数据源文件路径（参与产物键计算）
+            count: 总行数
+            dim: 向量维度
+            variant: 同一数据源的不同文档构造方式（如仅名称 / 名称+同义词）
+            dtype: float32 或 float16
+        """
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported artifact dtype: {dtype}")
+        meta = {
+            "version": ARTIFACT_VERSION,
+            "model_name": model_name,
+            "source_path": str(source_path),
+            "source_sha256": file_sha256(source_path),
+            "variant": variant,
+        }
+        return ArtifactWriter(self.artifact_dir(model_name, source_path, variant), meta, count, dim, dtype)
@@ -0,0 +1,203 @@
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 各键盘布局中每个字母的相邻按键（只含字母键）
+KEYBOARD_NEIGHBORS = {
+    "qwerty": {
+        "q": "wa", "w": "qeas", "e": "wrsd", "r": "etdf", "t": "ryfg", "y": "tugh", "u": "yihj",
+        "i": "uojk", "o": "ipkl", "p": "ol", "a": "qwsz", "s": "weadzx", "d": "erfsxc",
+        "f": "rtgdcv", "g": "tyhfvb", "h": "yujgbn", "j": "uikhnm", "k": "iojlm", "l": "opk",
+        "z": "asx", "x": "zsdc", "c": "xdfv", "v": "cfgb", "b": "vghn", "n": "bhjm", "m": "njk",
+    },
+    "azerty": {
+        "a": "zq", "z": "aeqs", "e": "zrsd", "r": "etdf", "t": "ryfg", "y": "tugh", "u": "yihj",
+        "i": "uojk", "o": "ipkl", "p": "olm", "q": "azsw", "s": "zeqdwx", "d": "erfsxc",
+        "f": "rtgdcv", "g": "tyhfvb", "h": "yujgbn", "j": "uikhn", "k": "iojl", "l": "opkm",
+        "m": "pl", "w": "qsx", "x": "wsdc", "c": "xdfv", "v": "cfgb", "b": "vghn", "n": "bhj",
+    },
+}
+
+# 错误类型：相邻键替换、漏字、多打相邻键、相邻字母换位
+ERROR_TYPES = ("substitution", "deletion", "insertion", "transposition")
+DEFAULT_ERROR_WEIGHTS = (0.4, 0.2, 0.2, 0.2)
+# 短于该长度的单词和全大写的缩写不加错误
+MIN_WORD_LENGTH = 3
+
+
+def _neighbor_table(keyboard: str):
+    """按码点索引的相邻键表：neighbors[c, :count[c]] 为字母 c（小写）的相邻键"""
+    layout = KEYBOARD_NEIGHBORS.get(keyboard)
+    if layout is None:
+        raise ValueError(f"Unsupported keyboard layout: {keyboard}")
+    width = max(len(keys) for keys in layout.values())
+    neighbors = np.zeros((128, width), dtype=np.uint32)
+    counts = np.zeros(128, dtype=np.int64)
+    for letter, keys in layout.items():
+        neighbors[ord(letter), :len(keys)] = [ord(k) for k in keys]
+        counts[ord(letter)] = len(keys)
+    return neighbors, counts
+
+
+def _to_codes(text: str) -> np.ndarray:
+    """文本转为码点数组：纯 ASCII 文本用 uint8，其余用 uint32"""
+    if text.isascii():
+        return np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+    return np.frombuffer(text.encode("utf-32-le"), dtype="<u4")
+
+
+def _from_codes(codes: np.ndarray) -> str:
+    if codes.dtype == np.uint8:
+        return codes.tobytes().decode("ascii")
+    return codes.tobytes().decode("utf-32-le")
+
+
+@dataclass
+class CorruptionResult:
+    """
+    加错结果
+
+    edits 中的 start / end 为原词在原文中的偏移，批量加错时相对于各自的文档
+    """
+    text: str
+    edits: List[Dict]
+
+
+class ErrorGenerator:
+    """
+    带随机种子、考虑键盘相邻关系的拼写错误生成器
+
+    分词、选词、错误类型和位置的抽取全部在 NumPy 数组上批量完成，
+    用于构造拼写纠正的基准语料，每秒可处理数百万个词
+    """
+
+    def __init__(self, probability: float = 0.3, max_errors: Optional[int] = 5, keyboard: str = "qwerty",
+                 seed: Optional[int] = None, weights: Sequence[float] = DEFAULT_ERROR_WEIGHTS):
+        """
+        Args:
+            probability: 每个可加错的单词被加错的概率
+            max_errors: 每篇文档最多的错误数，None 表示不限制
+            keyboard: 键盘布局 (qwerty/azerty)
+            seed: 随机种子，相同种子和输入得到相同结果
+            weights: 替换 / 漏字 / 多字 / 换位四种错误的相对权重
+        """
+        if not 0.0 <= probability <= 1.0:
+            raise ValueError(f"probability must be in [0, 1], got {probability}")
+        self.probability = probability
+        self.max_errors = max_errors
+        self.keyboard = keyboard
+        self.neighbors, self.neighbor_counts = _neighbor_table(keyboard)
+        weights = np.asarray(weights, dtype=np.float64)
+        self.type_cdf = np.cumsum(weights / weights.sum())
+        self.rng = np.random.default_rng(seed)
+
+    def _neighbor_of(self, codes: np.ndarray) -> np.ndarray:
+        """为每个字母随机取一个相邻键，保持原字母的大小写"""
+        lower = codes | 32
+        counts = self.neighbor_counts[lower]
+        picks = (self.rng.random(len(codes)) * counts).astype(np.int64)
+        result = self.neighbors[lower, picks].astype(codes.dtype)
+        result[codes < 97] -= 32
+        return result
+
+    def corrupt_batch(self, texts: Sequence[str], with_edits: bool = True) -> List[CorruptionResult]:
+        """
+        批量加错：所有文档拼接后一次完成分词和随机抽取
+
+        Args:
+            texts: 文档列表
+            with_edits: 是否返回每处错误的明细（只需要加错文本时关闭可省去构造明细的开销）
+        """
+        if not texts:
+            return []
+        lengths = np.array([len(text) for text in texts], dtype=np.int64)
+        doc_starts = np.concatenate([[0], np.cumsum(lengths + 1)[:-1]])
+        codes = _to_codes("\n".join(texts))
+
+        # 分词：连续的字母为一个单词，非 ASCII 字符（é、中文）也算作单词的一部分
+        lower = codes | 32
+        is_ascii_letter = (lower >= 97) & (lower <= 122)
+        non_ascii = codes > 127
+        is_word = np.zeros(len(codes) + 2, dtype=bool)
+        is_word[1:-1] = is_ascii_letter | non_ascii
+        edges = np.flatnonzero(is_word[1:] != is_word[:-1])
+        starts, ends = edges[0::2], edges[1::2]
+        word_len = ends - starts
+
+        # 可加错的单词：不短于 MIN_WORD_LENGTH、只含 ASCII 字母且不是全大写的缩写
+        # （从一个词首到下一个词首之间只有该词含字母，reduceat 的分段和即为该词的计数）
+        if len(starts):
+            upper_counts = np.add.reduceat((codes >= 65) & (codes <= 90), starts, dtype=np.int64)
+            non_ascii_counts = np.add.reduceat(non_ascii, starts, dtype=np.int64)
+        else:
+            upper_counts = non_ascii_counts = starts
+        eligible = (word_len >= MIN_WORD_LENGTH) & (upper_counts < word_len) & (non_ascii_counts == 0)
+        chosen = np.flatnonzero(eligible & (self.rng.random(len(starts)) < self.probability))
+
+        # 每篇文档最多 max_errors 个错误：按随机键排序后保留每篇的前 max_errors 个
+        doc_of_word = np.searchsorted(doc_starts, starts[chosen], side="right") - 1
+        if self.max_errors is not None and len(chosen):
+            order = np.lexsort((self.rng.random(len(chosen)), doc_of_word))
+            sorted_docs = doc_of_word[order]
+            first = np.searchsorted(sorted_docs, sorted_docs, side="left")
+            keep = order[np.arange(len(order)) - first < self.max_errors]
+            keep.sort()
+            chosen, doc_of_word = chosen[keep], doc_of_word[keep]
+
+        # 抽取错误类型和位置（换位需要至少两个字母，位置取 [0, len-1)）
+        kinds = np.searchsorted(self.type_cdf, self.rng.random(len(chosen)), side="right")
+        kinds = np.minimum(kinds, len(ERROR_TYPES) - 1)
+        lengths_chosen = word_len[chosen]
+        span = np.where(kinds == 3, lengths_chosen - 1, lengths_chosen)
+        positions = starts[chosen] + (self.rng.random(len(chosen)) * span).astype(np.int64)
+        # 相邻两个字母相同（如 "ll"）时换位不改变单词，改为替换该字母，避免记录不存在的错误
+        same = (kinds == 3) & (codes[np.minimum(positions + 1, len(codes) - 1)] == codes[positions])
+        kinds[same] = 0
+
+        output = codes.copy()
+        sub = positions[kinds == 0]
+        output[sub] = self._neighbor_of(codes[sub])
+        swap = positions[kinds == 3]
+        output[swap], output[swap + 1] = codes[swap + 1], codes[swap]
+        # 多字：在该字母后插入其相邻键；漏字：删除该字母（每个词只有一处错误，位置均已升序）
+        insert_at = positions[kinds == 2] + 1
+        delete_at = positions[kinds == 1]
+        output = np.insert(output, insert_at, self._neighbor_of(codes[insert_at - 1]))
+        output = np.delete(output, delete_at + np.searchsorted(insert_at, delete_at, side="right"))
+
+        # 原文位置 i 在输出中的位置：i 加上插在 i 之前的字符数，减去 i 之前被删除的字符数
+        def shift(index):
+            return (index + np.searchsorted(insert_at, index, side="right")
+                    - np.searchsorted(delete_at, index, side="left"))
+
+        out_starts = shift(doc_starts)
+        out_ends = shift(doc_starts + lengths)
+        joined = _from_codes(output)
+        results = [
+            CorruptionResult(joined[start:end], [])
+            for start, end in zip(out_starts.tolist(), out_ends.tolist())
+        ]
+
+        if with_edits and len(chosen):
+            word_starts, word_ends = starts[chosen], ends[chosen]
+            new_starts, new_ends = shift(word_starts), shift(word_ends)
+            for doc, kind, ws, we, ns, ne in zip(doc_of_word.tolist(), kinds.tolist(),
+                                                 word_starts.tolist(), word_ends.tolist(),
+                                                 new_starts.tolist(), new_ends.tolist()):
+                offset = int(doc_starts[doc])
+                results[doc].edits.append({
+                    "type": ERROR_TYPES[kind],
+                    "start": ws - offset,
+                    "end": we - offset,
+                    "original": texts[doc][ws - offset:we - offset],
+                    "corrupted": joined[ns:ne],
+                })
+        return results
+
+    def corrupt(self, text: str, with_edits: bool = True) -> CorruptionResult:
+        """给单篇文本加错"""
+        return self.corrupt_batch([text], with_edits)[0]
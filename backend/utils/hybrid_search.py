@@ -0,0 +1,115 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import Callable, Dict, List, Optional, Sequence
+
+from utils.lexical_index import LexicalIndex, rrf_fuse
+from utils.vector_store import SearchHit, VectorStore
+
+logger = logging.getLogger(__name__)
+
+# 稠密检索（嵌入 + 向量库检索）在线程池中执行，与当前线程中的词法检索并行
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hybrid-dense")
+
+
+class HybridSearcher:
+    """
+    混合检索：稠密向量检索 + 词法检索（BM25 + 字符 n-gram），按 RRF 融合
+
+    缩写和代码（SOB、P/E、EBITDA）的嵌入效果较差，词法检索可以直接命中；
+    融合后每条结果的 fusion 字段记录两路的排名
+    """
+
+    def __init__(self, store: VectorStore, lexical: LexicalIndex,
+                 embed: Callable[[List[str]], List[List[float]]],
+                 rrf_k: int = 60, depth: Optional[int] = None):
+        """
+        Args:
+            store: 向量库适配器
+            lexical: 词法索引（ID 与向量库一致）
+            embed: 批量文本嵌入函数
+            rrf_k: RRF 平滑常数
+            depth: 每一路召回的候选数，默认 max(4 * limit, 20)
+        """
+        self.store = store
+        self.lexical = lexical
+        self.embed = embed
+        self.rrf_k = rrf_k
+        self.depth = depth
+
+    def _dense(self, queries: List[str], depth: int, filters: Optional[Dict]) -> List[List[SearchHit]]:
+        return self.store.search_batch(self.embed(queries), depth, filters)
+
+    def search_batch(self, queries: Sequence[str], limit: int = 5,
+                     filters: Optional[Dict] = None) -> List[List[SearchHit]]:
+        """
+        批量混合检索
+
+        过滤条件涉及词法索引中没有的字段时，只返回稠密检索结果
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+        depth = self.depth or max(4 * limit, 20)
+
+        dense_future = _executor.submit(self._dense, queries, depth, filters)
+        if self.lexical.supports_filters(filters):
+            lexical_batch = self.lexical.search_batch(queries, depth, filters)
+        else:
+            logger.debug(f"Lexical index cannot apply filters {filters}; using dense results only")
+            lexical_batch = [[] for _ in queries]
+        dense_batch = dense_future.result()
+
+        fused_batch = []
+        missing = set()
+        for dense_hits, lexical_hits in zip(dense_batch, lexical_batch):
+            dense_ids = [hit.id for hit in dense_hits]
+            lexical_ids = [item_id for item_id, _ in lexical_hits]
+            fused = rrf_fuse([dense_ids, lexical_ids], self.rrf_k)[:limit]
+            fused_batch.append(fused)
+            known = set(dense_ids)
+            missing.update(item_id for item_id, _ in fused if item_id not in known)
+
+        # 只由词法检索命中的记录，一次性从向量库取回元数据
+        fetched = {hit.id: hit for hit in self.store.get_by_ids(sorted(missing))} if missing else {}
+
+        results = []
+        for dense_hits, lexical_hits, fused in zip(dense_batch, lexical_batch, fused_batch):
+            dense_by_id = {hit.id: (rank, hit) for rank, hit in enumerate(dense_hits)}
+            lexical_rank = {item_id: rank for rank, (item_id, _) in enumerate(lexical_hits)}
+            hits = []
+            for item_id, rrf_score in fused:
+                dense_rank, hit = dense_by_id.get(item_id, (None, fetched.get(item_id)))
+                if hit is None:
+                    continue
+                hits.append(replace(hit, fusion={
+                    "rrf_score": rrf_score,
+                    "dense_rank": dense_rank,
+                    "lexical_rank": lexical_rank.get(item_id),
+                }))
+            results.append(hits)
+        return results
+
+
+def lexical_search_batch(store: VectorStore, lexical: LexicalIndex, queries: Sequence[str], limit: int = 5,
+                         filters: Optional[Dict] = None) -> List[List[SearchHit]]:
+    """
+    只用词法索引检索（嵌入服务不可用时的降级路径），元数据一次性从向量库取回
+
+    返回的命中与混合检索中只由词法检索命中的记录格式相同（fusion.dense_rank 为 None）；
+    过滤条件涉及词法索引中没有的字段时返回空结果，不返回领域不符的候选
+    """
+    queries = list(queries)
+    if not lexical.supports_filters(filters):
+        logger.debug(f"Lexical index cannot apply filters {filters}; no fallback results")
+        return [[] for _ in queries]
+    lexical_batch = lexical.search_batch(queries, limit, filters)
+    ids = sorted({item_id for hits in lexical_batch for item_id, _ in hits})
+    fetched = {hit.id: hit for hit in store.get_by_ids(ids)} if ids else {}
+    return [
+        [
+            replace(fetched[item_id], fusion={"rrf_score": score, "dense_rank": None, "lexical_rank": rank})
+            for rank, (item_id, score) in enumerate(hits) if item_id in fetched
+        ]
+        for hits in lexical_batch
+    ]
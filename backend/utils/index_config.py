@@ -0,0 +1,103 @@
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 索引调优工具（tools/tune_milvus_index.py）写出的配置文件，相对于 backend 目录
+DEFAULT_INDEX_CONFIG_PATH = Path(__file__).resolve().parent.parent / "config" / "milvus_index.json"
+
+# Chroma 集合的 HNSW 配置文件（tools/bench_chroma_hnsw.py --save 写出）
+DEFAULT_CHROMA_INDEX_CONFIG_PATH = Path(__file__).resolve().parent.parent / "config" / "chroma_index.json"
+
+# Chroma 默认使用 l2 空间，而 bge-m3 向量按余弦相似度比较，因此显式指定 cosine 和 HNSW 参数
+DEFAULT_CHROMA_HNSW = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 16,
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 64,
+}
+
+
+def index_config_path() -> Path:
+    return Path(os.getenv("MILVUS_INDEX_CONFIG", str(DEFAULT_INDEX_CONFIG_PATH)))
+
+
+def load_index_config(path: Optional[str] = None) -> Dict:
+    """读取索引配置文件，不存在时返回空配置"""
+    path = Path(path) if path else index_config_path()
+    if not path.exists():
+        return {"collections": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_collection_index_config(collection_name: str, path: Optional[str] = None) -> Optional[Dict]:
+    """
+    获取集合的索引配置
+
+    Returns:
+        {"index_type", "metric_type", "index_params", "search_params", ...}，未调优时返回 None
+    """
+    return load_index_config(path).get("collections", {}).get(collection_name)
+
+
+def get_search_params(collection_name: str, path: Optional[str] = None) -> Optional[Dict]:
+    """返回 MilvusClient.search 使用的 search_params，未调优时返回 None（使用 Milvus 默认值）"""
+    config = get_collection_index_config(collection_name, path)
+    if not config:
+        return None
+    return {"metric_type": config.get("metric_type", "COSINE"), "params": config.get("search_params", {})}
+
+
+def save_collection_index_config(collection_name: str, config: Dict, path: Optional[str] = None) -> Path:
+    """写入（合并）单个集合的索引配置"""
+    path = Path(path) if path else index_config_path()
+    data = load_index_config(path)
+    data.setdefault("collections", {})[collection_name] = config
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    logger.info(f"Saved index config for {collection_name} to {path}")
+    return path
+
+
+def add_vector_index(index_params, collection_name: str, field_name: str = "vector", path: Optional[str] = None):
+    """
+    按调优结果为向量字段添加索引，未调优时使用 AUTOINDEX
+
+    Args:
+        index_params: client.prepare_index_params() 的返回值
+    """
+    config = get_collection_index_config(collection_name, path)
+    if config:
+        index_params.add_index(
+            field_name=field_name,
+            index_type=config["index_type"],
+            metric_type=config.get("metric_type", "COSINE"),
+            params=config.get("index_params", {})
+        )
+    else:
+        index_params.add_index(
+            field_name=field_name,
+            index_type="AUTOINDEX",  # 使用自动索引类型，Milvus会根据数据特性选择最佳索引
+            metric_type="COSINE"  # 使用余弦相似度作为向量相似度度量方式
+        )
+    return index_params
+
+
+def get_chroma_hnsw_metadata(collection_name: str, path: Optional[str] = None) -> Dict:
+    """
+    返回创建 Chroma 集合时使用的 HNSW 元数据（默认值合并配置文件中该集合的覆盖项）
+    """
+    path = Path(path) if path else Path(os.getenv("CHROMA_INDEX_CONFIG", str(DEFAULT_CHROMA_INDEX_CONFIG_PATH)))
+    overrides = load_index_config(str(path)).get("collections", {}).get(collection_name, {})
+    return {**DEFAULT_CHROMA_HNSW, **{k: v for k, v in overrides.items() if k.startswith("hnsw:")}}
+
+
+def save_chroma_hnsw_config(collection_name: str, config: Dict, path: Optional[str] = None) -> Path:
+    """写入（合并）单个 Chroma 集合的 HNSW 配置"""
+    path = path or os.getenv("CHROMA_INDEX_CONFIG", str(DEFAULT_CHROMA_INDEX_CONFIG_PATH))
+    return save_collection_index_config(collection_name, config, path)
@@ -0,0 +1,167 @@
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# 写入 Milvus 的 SNOMED 概念元数据字段，参与内容哈希：domain_id 等变化时概念会重新写入（并移到新的领域分区）
+SNOMED_METADATA_FIELDS = (
+    "domain_id", "vocabulary_id", "concept_class_id", "standard_concept", "concept_code",
+    "valid_start_date", "valid_end_date",
+)
+
+
+def content_hash(name: str, synonyms: str = "", model_name: str = "",
+                 metadata: Optional[Mapping[str, object]] = None) -> str:
+    """
+    计算概念内容哈希（名称 + 同义词 + 嵌入模型 + 写入索引的元数据）
+
+    任一部分变化都会改变哈希，从而触发该概念重新嵌入并写入。
+    """
+    parts = [str(name), str(synonyms or ""), str(model_name)]
+    if metadata:
+        parts += [f"{key}={metadata[key]}" for key in sorted(metadata)]
+    payload = "\x1f".join(parts)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def row_metadata(row, fields=SNOMED_METADATA_FIELDS) -> Dict[str, str]:
+    """取出一行数据中参与内容哈希的元数据字段"""
+    return {field_name: str(row[field_name]) for field_name in fields}
+
+
+@dataclass
+class SyncPlan:
+    """增量同步计划：记录需要新增、更新、删除和保持不变的概念ID"""
+    added: List[str] = field(default_factory=list)
+    updated: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+
+    @property
+    def to_embed(self) -> List[str]:
+        """需要重新生成向量的概念ID（新增 + 更新）"""
+        return self.added + self.updated
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "added": len(self.added),
+            "updated": len(self.updated),
+            "deleted": len(self.deleted),
+            "unchanged": len(self.unchanged),
+        }
+
+
+def plan_sync(source_hashes: Dict[str, str], existing_hashes: Dict[str, str]) -> SyncPlan:
+    """
+    对比数据源与索引中的内容哈希，生成增量同步计划
+
+    Args:
+        source_hashes: 数据源中 {概念ID: 内容哈希}
+        existing_hashes: 索引中已有的 {概念ID: 内容哈希}，旧数据没有哈希时值为空字符串
+
+    Returns:
+        SyncPlan
+    """
+    plan = SyncPlan()
+    for concept_id, digest in source_hashes.items():
+        if concept_id not in existing_hashes:
+            plan.added.append(concept_id)
+        elif existing_hashes[concept_id] != digest:
+            plan.updated.append(concept_id)
+        else:
+            plan.unchanged.append(concept_id)
+    plan.deleted = [cid for cid in existing_hashes if cid not in source_hashes]
+    return plan
+
+
+class MissingContentHashError(RuntimeError):
+    """集合在加入 content_hash 字段之前创建，无法增量同步"""
+
+
+def iter_milvus_rows(client, collection_name: str, output_fields: List[str], batch_size: int = 1000):
+    """
+    逐批读取 Milvus 集合中的全部行
+
+    优先使用 pymilvus 的查询迭代器（按主键顺序分页）；旧版本客户端没有 query_iterator 时按主键游标分页，
+    普通 query 不保证返回最小的主键，每页检查主键有序并在最后核对总行数，
+    漏掉行时报错而不是静默跳过（被跳过的概念会在增量同步时重复写入）
+    """
+    fields = list(dict.fromkeys(["id"] + list(output_fields)))
+    if hasattr(client, "query_iterator"):
+        iterator = client.query_iterator(
+            collection_name=collection_name, batch_size=batch_size, filter="id >= 0", output_fields=fields
+        )
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    break
+                yield rows
+        finally:
+            iterator.close()
+        return
+
+    last_id = None
+    total = 0
+    while True:
+        rows = client.query(
+            collection_name=collection_name,
+            filter="id >= 0" if last_id is None else f"id > {last_id}",
+            output_fields=fields,
+            limit=batch_size,
+        )
+        if not rows:
+            break
+        ids = [row["id"] for row in rows]
+        if ids != sorted(ids):
+            raise RuntimeError(f"Milvus query on {collection_name} did not return rows in primary key order; "
+                               f"upgrade pymilvus to use query_iterator")
+        total += len(rows)
+        yield rows
+        last_id = ids[-1]
+        if len(rows) < batch_size:
+            break
+
+    expected = client.query(collection_name=collection_name, filter="", output_fields=["count(*)"])[0]["count(*)"]
+    if total != expected:
+        raise RuntimeError(f"Read {total} of {expected} rows from {collection_name}; "
+                           f"paging by primary key skipped rows, upgrade pymilvus to use query_iterator")
+
+
+def fetch_milvus_index(client, collection_name: str, batch_size: int = 1000) -> Tuple[Dict[str, str], Dict[str, List[int]]]:
+    """
+    读取 Milvus 集合中每个概念的内容哈希和主键
+
+    Returns:
+        ({概念ID: 内容哈希}, {概念ID: [主键]})，更新概念时写入新行后按旧主键删除旧行
+
+    Raises:
+        MissingContentHashError: 集合没有 content_hash 字段（在增量同步之前创建），需要全量重建
+    """
+    field_names = {f["name"] for f in client.describe_collection(collection_name).get("fields", [])}
+    if "content_hash" not in field_names:
+        raise MissingContentHashError(
+            f"Collection {collection_name} has no content_hash field (created before incremental sync); "
+            f"a full rebuild is required"
+        )
+    hashes, primary_keys = {}, {}
+    for rows in iter_milvus_rows(client, collection_name, ["concept_id", "content_hash"], batch_size):
+        for row in rows:
+            concept_id = str(row["concept_id"])
+            hashes[concept_id] = row.get("content_hash") or ""
+            primary_keys.setdefault(concept_id, []).append(row["id"])
+    return hashes, primary_keys
+
+
+def fetch_milvus_hashes(client, collection_name: str, batch_size: int = 1000) -> Dict[str, str]:
+    """读取 Milvus 集合中每个概念的内容哈希"""
+    return fetch_milvus_index(client, collection_name, batch_size)[0]
+
+
+def milvus_in_filter(field_name: str, values: Iterable[str]) -> str:
+    """构造 Milvus `field in [...]` 过滤表达式"""
+    quoted = ", ".join('"' + str(v).replace('\\', '\\\\').replace('"', '\\"') + '"' for v in values)
+    return f"{field_name} in [{quoted}]"
@@ -0,0 +1,318 @@
+import hashlib
+import json
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_INDEX_VERSION = 1
+
+# 词级分词：连续的字母数字为一个词，中文按单字切分
+_WORD_RE = re.compile(r"[0-9a-z]+|[一-鿿]")
+# 字符 n-gram 以空白切块，去掉块首尾的标点（保留 P/E、A+/A1 这类内部符号）
+_EDGE_PUNCT_RE = re.compile(r"^[^\w]+|[^\w]+$")
+
+ANALYZERS = ("word", "char")
+
+
+def word_tokens(text: str) -> List[str]:
+    """词级 token"""
+    return _WORD_RE.findall(str(text).lower())
+
+
+def char_ngrams(text: str, n: int = 3) -> List[str]:
+    """字符 n-gram（每个块前后加 # 边界），对缩写、代码和拼写变体更鲁棒"""
+    grams = []
+    for chunk in str(text).lower().split():
+        chunk = _EDGE_PUNCT_RE.sub("", chunk)
+        if not chunk:
+            continue
+        padded = f"#{chunk}#"
+        if len(padded) <= n:
+            grams.append(padded)
+        else:
+            grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return grams
+
+
+def term_hash(token: str) -> int:
+    """token 的 64 位哈希，词表以排序后的哈希数组保存，加载时无需解析字符串"""
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def lexical_index_path(db_path: str, collection_name: str) -> Path:
+    """向量库对应的词法索引目录：<db_path>.lexical/<collection_name>"""
+    return Path(f"{db_path}.lexical") / collection_name
+
+
+def lexical_text(*parts) -> str:
+    """拼接概念名称、FSN、同义词等字段作为词法索引文本（跳过空值、NA 和重复项）"""
+    seen = []
+    for part in parts:
+        part = str(part or "").strip()
+        if part and part != "NA" and part not in seen:
+            seen.append(part)
+    return " ".join(seen)
+
+
+def rrf_fuse(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    倒数排名融合（Reciprocal Rank Fusion）
+
+    Args:
+        rankings: 多个按相关性降序排列的 ID 列表
+        k: 平滑常数
+
+    Returns:
+        按融合分数降序排列的 (ID, 分数)
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class _Postings:
+    """单个分析器的倒排表（CSR 格式：词按哈希排序，indptr 指向 docs/tfs 中的区间）"""
+
+    def __init__(self, hashes, indptr, docs, tfs, doc_len):
+        self.hashes = hashes
+        self.indptr = indptr
+        self.docs = docs
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.avgdl = float(doc_len.mean()) if len(doc_len) else 0.0
+
+    @classmethod
+    def build(cls, token_lists: Sequence[List[str]]) -> "_Postings":
+        vocab: Dict[str, int] = {}
+        term_ids, doc_ids, freqs = [], [], []
+        doc_len = np.zeros(len(token_lists), dtype=np.int32)
+        for doc, tokens in enumerate(token_lists):
+            doc_len[doc] = len(tokens)
+            for token, tf in Counter(tokens).items():
+                term_ids.append(vocab.setdefault(token, len(vocab)))
+                doc_ids.append(doc)
+                freqs.append(tf)
+
+        # 按哈希重新编号词，查询时用 searchsorted 定位
+        hashes = np.array([term_hash(token) for token in vocab], dtype=np.uint64)
+        order = np.argsort(hashes, kind="stable")
+        sorted_hashes = hashes[order]
+        if len(sorted_hashes) > 1 and np.any(sorted_hashes[1:] == sorted_hashes[:-1]):
+            logger.warning("Lexical index has term hash collisions; colliding terms share postings")
+        new_id = np.empty_like(order)
+        new_id[order] = np.arange(len(order))
+
+        term_ids = new_id[np.asarray(term_ids, dtype=np.int64)]
+        doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        freqs = np.minimum(np.asarray(freqs, dtype=np.int64), np.iinfo(np.uint16).max).astype(np.uint16)
+        entry_order = np.lexsort((doc_ids, term_ids))
+
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=indptr[1:])
+        return cls(sorted_hashes, indptr, doc_ids[entry_order], freqs[entry_order], doc_len)
+
+    def save(self, path: Path, prefix: str):
+        for name in ("hashes", "indptr", "docs", "tfs", "doc_len"):
+            np.save(path / f"{prefix}_{name}.npy", getattr(self, name))
+
+    @classmethod
+    def load(cls, path: Path, prefix: str, mmap: bool = True) -> "_Postings":
+        mode = "r" if mmap else None
+        return cls(*[np.load(path / f"{prefix}_{name}.npy", mmap_mode=mode)
+                     for name in ("hashes", "indptr", "docs", "tfs", "doc_len")])
+
+    def score(self, tokens: Sequence[str], k1: float, b: float) -> Tuple[np.ndarray, np.ndarray]:
+        """BM25 打分，只累加命中的文档，返回 (文档行号, 分数)"""
+        n_docs = len(self.doc_len)
+        if not tokens or not n_docs:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        query = np.array(sorted({term_hash(t) for t in tokens}), dtype=np.uint64)
+        pos = np.searchsorted(self.hashes, query)
+        valid = pos < len(self.hashes)
+        pos, query = pos[valid], query[valid]
+        pos = pos[self.hashes[pos] == query]
+        if not len(pos):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        doc_parts, score_parts = [], []
+        for term in pos:
+            start, end = self.indptr[term], self.indptr[term + 1]
+            docs = np.asarray(self.docs[start:end])
+            tf = np.asarray(self.tfs[start:end], dtype=np.float32)
+            df = end - start
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            norm = k1 * (1.0 - b + b * np.asarray(self.doc_len[docs], dtype=np.float32) / self.avgdl)
+            doc_parts.append(docs)
+            score_parts.append(idf * tf * (k1 + 1.0) / (tf + norm))
+
+        docs, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts)).astype(np.float32)
+        return docs, scores
+
+
+class LexicalIndex:
+    """
+    进程内词法索引：词级 BM25 + 字符 n-gram BM25
+
+    两个分析器各自打分后按 RRF 融合。索引以若干 .npy 文件保存（词表为排序后的 64 位哈希，
+    倒排表为 CSR 数组），加载时直接内存映射，不需要解析或重建
+    """
+
+    def __init__(self, ids, postings: Dict[str, _Postings], fields: Dict[str, Tuple[np.ndarray, List[str]]],
+                 ngram: int = 3, k1: float = 1.2, b: float = 0.75):
+        self.ids = ids
+        self.postings = postings
+        self.fields = fields
+        self.ngram = ngram
+        self.k1 = k1
+        self.b = b
+        self._filter_cache: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _tokens(self, analyzer: str, text: str) -> List[str]:
+        return word_tokens(text) if analyzer == "word" else char_ngrams(text, self.ngram)
+
+    @classmethod
+    def build(cls, ids: Sequence[str], texts: Sequence[str],
+              fields: Optional[Dict[str, Sequence[str]]] = None, ngram: int = 3) -> "LexicalIndex":
+        """
+        构建索引
+
+        Args:
+            ids: 文档ID（与向量库中的ID一致）
+            texts: 文档文本（概念名称、FSN、同义词等拼接）
+            fields: 可用于过滤的类别字段，如 {"domain_id": [...]}
+            ngram: 字符 n-gram 长度
+        """
+        if len(ids) != len(texts):
+            raise ValueError(f"{len(ids)} ids but {len(texts)} texts")
+        postings = {
+            "word": _Postings.build([word_tokens(t) for t in texts]),
+            "char": _Postings.build([char_ngrams(t, ngram) for t in texts]),
+        }
+        encoded = {}
+        for name, values in (fields or {}).items():
+            labels, codes = np.unique(np.array([str(v) for v in values]), return_inverse=True)
+            encoded[name] = (codes.astype(np.int32), [str(label) for label in labels])
+        return cls(np.array([str(i) for i in ids]), postings, encoded, ngram=ngram)
+
+    def save(self, path) -> Path:
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / "ids.npy", np.asarray(self.ids))
+        for analyzer, postings in self.postings.items():
+            postings.save(path, analyzer)
+        for name, (codes, _) in self.fields.items():
+            np.save(path / f"field_{name}.npy", codes)
+        meta = {
+            "version": LEXICAL_INDEX_VERSION,
+            "count": len(self.ids),
+            "ngram": self.ngram,
+            "k1": self.k1,
+            "b": self.b,
+            "fields": {name: labels for name, (_, labels) in self.fields.items()},
+        }
+        with open(path / "meta.json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        logger.info(f"Saved lexical index ({len(self.ids)} docs) to {path}")
+        return path
+
+    @classmethod
+    def load(cls, path, mmap: bool = True) -> "LexicalIndex":
+        path = Path(path)
+        with open(path / "meta.json", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != LEXICAL_INDEX_VERSION:
+            raise ValueError(f"Unsupported lexical index version {meta.get('version')} at {path}")
+        mode = "r" if mmap else None
+        postings = {analyzer: _Postings.load(path, analyzer, mmap) for analyzer in ANALYZERS}
+        fields = {
+            name: (np.load(path / f"field_{name}.npy", mmap_mode=mode), labels)
+            for name, labels in meta.get("fields", {}).items()
+        }
+        return cls(np.load(path / "ids.npy", mmap_mode=mode), postings, fields,
+                   ngram=meta["ngram"], k1=meta["k1"], b=meta["b"])
+
+    def supports_filters(self, filters: Optional[Dict]) -> bool:
+        """索引中是否保存了过滤条件涉及的全部字段"""
+        return not filters or all(name in self.fields for name in filters)
+
+    def _filter_mask(self, filters: Optional[Dict]) -> Optional[np.ndarray]:
+        if not filters:
+            return None
+        key = json.dumps(filters, sort_keys=True, default=str)
+        mask = self._filter_cache.get(key)
+        if mask is None:
+            mask = np.ones(len(self.ids), dtype=bool)
+            for name, value in filters.items():
+                codes, labels = self.fields[name]
+                values = {str(v) for v in (value if isinstance(value, (list, tuple, set)) else [value])}
+                allowed = [i for i, label in enumerate(labels) if label in values]
+                mask &= np.isin(codes, allowed)
+            self._filter_cache[key] = mask
+        return mask
+
+    def search(self, query: str, limit: int = 20, filters: Optional[Dict] = None,
+               rrf_k: int = 60) -> List[Tuple[str, float]]:
+        """
+        检索单个查询
+
+        Returns:
+            按相关性降序排列的 (文档ID, 融合分数)
+        """
+        if not self.supports_filters(filters):
+            raise ValueError(f"Lexical index has no fields for filters {sorted(filters)}")
+        mask = self._filter_mask(filters)
+        rankings = []
+        for analyzer, postings in self.postings.items():
+            docs, scores = postings.score(self._tokens(analyzer, query), self.k1, self.b)
+            if mask is not None and len(docs):
+                keep = mask[docs]
+                docs, scores = docs[keep], scores[keep]
+            if len(docs) > limit:
+                top = np.argpartition(-scores, limit - 1)[:limit]
+                docs, scores = docs[top], scores[top]
+            order = np.argsort(-scores, kind="stable")
+            rankings.append([str(self.ids[d]) for d in docs[order]])
+        return rrf_fuse(rankings, rrf_k)[:limit]
+
+    def search_batch(self, queries: Sequence[str], limit: int = 20,
+                     filters: Optional[Dict] = None) -> List[List[Tuple[str, float]]]:
+        return [self.search(query, limit, filters) for query in queries]
+
+
+# 已加载的词法索引缓存，服务在每个请求中重新构造，避免重复加载
+_lexical_cache: Dict[str, LexicalIndex] = {}
+_lexical_lock = threading.Lock()
+
+
+def get_cached_lexical_index(path) -> LexicalIndex:
+    """按路径缓存 LexicalIndex"""
+    key = str(Path(path).resolve())
+    index = _lexical_cache.get(key)
+    if index is not None:
+        return index
+    with _lexical_lock:
+        index = _lexical_cache.get(key)
+        if index is None:
+            index = LexicalIndex.load(path)
+            _lexical_cache[key] = index
+    return index
+
+
+def clear_lexical_index_cache():
+    """重建索引后清空缓存"""
+    with _lexical_lock:
+        _lexical_cache.clear()
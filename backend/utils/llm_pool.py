@@ -0,0 +1,294 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Ollama 后端列表：逗号分隔的地址（所有模型共用），或按模型配置的 JSON，"*" 为默认，如
+# {"*": ["http://gpu1:11434", "http://gpu2:11434"], "qwen2.5:7b": ["http://gpu3:11434"]}
+# 未配置或只有一个后端时与直接使用 Ollama(model=...) 相同
+OLLAMA_BACKENDS = os.getenv("OLLAMA_BACKENDS", "")
+# 请求耗时超过近期 p95 仍未返回时，向另一个后端发出对冲请求，先返回的胜出，另一个被取消
+HEDGE_ENABLED = os.getenv("OLLAMA_HEDGE", "0") == "1"
+HEDGE_QUANTILE = float(os.getenv("OLLAMA_HEDGE_QUANTILE", "0.95"))
+# 样本数不足时不对冲（p95 还不可靠）
+HEDGE_MIN_SAMPLES = 20
+# 连续失败多少次后标记为不健康，由健康检查恢复
+MAX_CONSECUTIVE_FAILURES = 3
+HEALTH_CHECK_INTERVAL_S = float(os.getenv("OLLAMA_HEALTH_INTERVAL_S", "10"))
+HEALTH_CHECK_TIMEOUT_S = 2.0
+# 模型在 Ollama 中的常驻时间：模型被卸载时前缀的 KV 缓存随之丢失，下次调用要重新处理整个提示
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# 固定上下文长度：num_ctx 与已加载的模型不同时 Ollama 会重新加载模型（同样丢失缓存）
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "0")) or None
+
+
+def ollama_client_options() -> Dict:
+    """所有 Ollama 客户端共用的选项，保证同一模型的调用能复用前缀缓存"""
+    options = {"keep_alive": OLLAMA_KEEP_ALIVE}
+    if OLLAMA_NUM_CTX:
+        options["num_ctx"] = OLLAMA_NUM_CTX
+    return options
+
+
+def backend_urls(model: str) -> List[str]:
+    """模型对应的后端地址列表"""
+    config = OLLAMA_BACKENDS.strip()
+    if not config:
+        return []
+    if config.startswith("{"):
+        urls = json.loads(config)
+        return urls.get(model, urls.get("*", []))
+    return [url.strip() for url in config.split(",") if url.strip()]
+
+
+def _quantile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Backend:
+    """单个 Ollama 后端的状态：进行中的请求数、健康状况和近期耗时"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.latencies = deque(maxlen=200)
+        self.stats = {"requests": 0, "errors": 0, "cancelled": 0}
+
+    def snapshot(self) -> Dict:
+        p50, p95 = _quantile(self.latencies, 0.5), _quantile(self.latencies, 0.95)
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "latency_ms": {
+                "p50": round(p50 * 1000, 2) if p50 is not None else None,
+                "p95": round(p95 * 1000, 2) if p95 is not None else None,
+            },
+            **self.stats,
+        }
+
+
+class BackendPool:
+    """
+    同一模型的多个 Ollama 后端
+
+    - 负载均衡：选择健康后端中进行中请求最少的一个，相同时选近期耗时较短的
+    - 健康检查：连续失败的后端被摘除，后台线程定期探测 /api/tags 恢复；全部不健康时仍按最少请求选择
+    - 对冲：开启后请求超过近期 p95 仍未返回时，向另一个后端再发一次，先返回的结果胜出，另一个被取消
+
+    sync 调用（服务在工作线程中的 chain.invoke）在当前线程运行独立的事件循环，计数在多个线程间共享，需加锁
+    """
+
+    def __init__(self, model: str, urls: List[str], hedge: bool = HEDGE_ENABLED,
+                 hedge_quantile: float = HEDGE_QUANTILE):
+        self.model = model
+        self.backends = [Backend(url) for url in urls]
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self._latencies = deque(maxlen=500)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "hedged": 0, "hedge_wins": 0}
+
+    def _pick(self, exclude=()) -> Optional[Backend]:
+        """进行中请求最少的健康后端（占用计数在锁内完成，避免并发请求选中同一个）"""
+        with self._lock:
+            candidates = [b for b in self.backends if b not in exclude]
+            healthy = [b for b in candidates if b.healthy] or candidates
+            if not healthy:
+                return None
+            backend = min(healthy, key=lambda b: (b.outstanding, _quantile(b.latencies, 0.5) or 0.0))
+            backend.outstanding += 1
+            return backend
+
+    def hedge_delay(self) -> Optional[float]:
+        """对冲前等待的秒数；未开启、后端不足或样本不足时为 None"""
+        if not self.hedge or sum(b.healthy for b in self.backends) < 2:
+            return None
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            return _quantile(self._latencies, self.hedge_quantile)
+
+    async def _call_on(self, backend: Backend, call: Callable[[str], Awaitable[T]]) -> T:
+        started_at = time.perf_counter()
+        try:
+            result = await call(backend.url)
+        except asyncio.CancelledError:
+            with self._lock:
+                backend.stats["cancelled"] += 1
+            raise
+        except Exception:
+            with self._lock:
+                backend.stats["errors"] += 1
+                backend.failures += 1
+                if backend.failures >= MAX_CONSECUTIVE_FAILURES and backend.healthy:
+                    backend.healthy = False
+                    logger.warning(f"Ollama 后端 {backend.url} 连续失败 {backend.failures} 次，暂时摘除")
+            raise
+        else:
+            elapsed = time.perf_counter() - started_at
+            with self._lock:
+                backend.failures = 0
+                backend.latencies.append(elapsed)
+                self._latencies.append(elapsed)
+            return result
+        finally:
+            with self._lock:
+                backend.outstanding -= 1
+                backend.stats["requests"] += 1
+
+    async def run(self, call: Callable[[str], Awaitable[T]]) -> T:
+        """
+        在选中的后端上执行 call(base_url)，需要时对冲到第二个后端
+
+        Raises:
+            RuntimeError: 池中没有后端
+            Exception: 所有发出的请求都失败时抛出最后一个异常
+        """
+        primary = self._pick()
+        if primary is None:
+            raise RuntimeError(f"No Ollama backend configured for model {self.model}")
+        with self._lock:
+            self.stats["requests"] += 1
+        first = asyncio.ensure_future(self._call_on(primary, call))
+        tasks = {first}
+        try:
+            delay = self.hedge_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    secondary = self._pick(exclude=(primary,))
+                    if secondary is not None:
+                        with self._lock:
+                            self.stats["hedged"] += 1
+                        tasks.add(asyncio.ensure_future(self._call_on(secondary, call)))
+
+            # 先成功返回的胜出；一个失败时继续等待另一个
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            with self._lock:
+                                self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            # 等待被取消的请求退出，确保连接关闭、计数归还
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def check_health(self):
+        """探测每个后端的 /api/tags，恢复或摘除后端"""
+        for backend in self.backends:
+            try:
+                with urllib.request.urlopen(f"{backend.url}/api/tags", timeout=HEALTH_CHECK_TIMEOUT_S) as response:
+                    healthy = response.status == 200
+            except Exception:
+                healthy = False
+            with self._lock:
+                if healthy != backend.healthy:
+                    logger.info(f"Ollama 后端 {backend.url} {'恢复' if healthy else '不可用'}")
+                backend.healthy = healthy
+                if healthy:
+                    backend.failures = 0
+
+    def as_llm(self):
+        """
+        可与 prompt 组成 chain 的 LLM：sync / async 调用都经过负载均衡和对冲，返回值与 Ollama 相同
+        """
+        from langchain_community.llms import Ollama
+        from langchain_core.runnables import RunnableLambda
+
+        clients = {
+            backend.url: Ollama(model=self.model, base_url=backend.url, **ollama_client_options())
+            for backend in self.backends
+        }
+
+        async def ainvoke(prompt):
+            return await self.run(lambda url: clients[url].ainvoke(prompt))
+
+        def invoke(prompt):
+            return asyncio.run(ainvoke(prompt))
+
+        return RunnableLambda(invoke, afunc=ainvoke, name=f"ollama_pool[{self.model}]")
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            delay = _quantile(self._latencies, self.hedge_quantile)
+            return {
+                "hedge": self.hedge,
+                "hedge_delay_ms": round(delay * 1000, 2) if self.hedge and delay is not None
+                and len(self._latencies) >= HEDGE_MIN_SAMPLES else None,
+                **self.stats,
+                "backends": [backend.snapshot() for backend in self.backends],
+            }
+
+
+_pools: Dict[str, BackendPool] = {}
+_pools_lock = threading.Lock()
+_health_thread: Optional[threading.Thread] = None
+
+
+def _health_loop():
+    while True:
+        time.sleep(HEALTH_CHECK_INTERVAL_S)
+        with _pools_lock:
+            pools = list(_pools.values())
+        for pool in pools:
+            pool.check_health()
+
+
+def get_backend_pool(model: str) -> Optional[BackendPool]:
+    """按模型共享的后端池；配置的后端少于两个时返回 None"""
+    global _health_thread
+    urls = backend_urls(model)
+    if len(urls) < 2:
+        return None
+    with _pools_lock:
+        pool = _pools.get(model)
+        if pool is None:
+            pool = _pools[model] = BackendPool(model, urls)
+            logger.info(f"模型 {model} 使用 {len(urls)} 个 Ollama 后端，对冲: {pool.hedge}")
+        if _health_thread is None:
+            _health_thread = threading.Thread(target=_health_loop, name="ollama-health", daemon=True)
+            _health_thread.start()
+        return pool
+
+
+def get_ollama_llm(model: str):
+    """Ollama 模型实例：配置了多个后端时使用后端池，否则为单个 Ollama 客户端（均保持模型常驻）"""
+    pool = get_backend_pool(model)
+    if pool is not None:
+        return pool.as_llm()
+
+    from langchain_community.llms import Ollama
+
+    urls = backend_urls(model)
+    if urls:
+        return Ollama(model=model, base_url=urls[0], **ollama_client_options())
+    return Ollama(model=model, **ollama_client_options())
+
+
+def llm_pool_metrics() -> Dict[str, Dict]:
+    with _pools_lock:
+        return {model: pool.snapshot() for model, pool in _pools.items()}
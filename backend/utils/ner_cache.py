@@ -0,0 +1,117 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# NER_SENTENCE_CACHE=0 时关闭句子级缓存（整篇文本一次交给模型，与原来相同）
+NER_SENTENCE_CACHE_ENABLED = os.getenv("NER_SENTENCE_CACHE", "1") != "0"
+# 内存中最多缓存的句子数（LRU 淘汰）
+NER_CACHE_SIZE = int(os.getenv("NER_CACHE_SIZE", "50000"))
+# 可选的磁盘缓存（SQLite 文件），服务重启后模板句子无需重新识别
+NER_CACHE_PATH = os.getenv("NER_CACHE_PATH", "")
+# 缓存未命中的句子每批交给模型的句子数
+NER_BATCH_SIZE = int(os.getenv("NER_BATCH_SIZE", "16"))
+
+
+def _digest(model: str, sentence: str) -> str:
+    return hashlib.sha256(f"{model}\0{sentence}".encode("utf-8")).hexdigest()
+
+
+class SentenceEntityCache:
+    """
+    (模型, 句子) → 实体列表的缓存，实体偏移相对于句子开头
+
+    病历高度模板化，"No known drug allergies." 这类句子在不同患者之间原样重复，
+    命中的句子不再经过模型。内存中为 LRU，配置 path 时同时写入 SQLite，内存未命中时再查磁盘
+    """
+
+    def __init__(self, max_entries: int = NER_CACHE_SIZE, path: str = NER_CACHE_PATH):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS ner_sentences (key TEXT PRIMARY KEY, entities TEXT NOT NULL)")
+            self._db.commit()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evicted": 0}
+
+    def _remember(self, key: str, entities: List[Dict]):
+        self._entries[key] = entities
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evicted"] += 1
+
+    def get(self, model: str, sentence: str) -> Optional[List[Dict]]:
+        """缓存的实体列表（调用方不得修改），未命中时为 None"""
+        key = _digest(model, sentence)
+        with self._lock:
+            entities = self._entries.get(key)
+            if entities is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entities
+            if self._db is not None:
+                row = self._db.execute("SELECT entities FROM ner_sentences WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entities = json.loads(row[0])
+                    self._remember(key, entities)
+                    self.stats["disk_hits"] += 1
+                    return entities
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, model: str, sentence: str, entities: List[Dict]):
+        self.put_many(model, {sentence: entities})
+
+    def put_many(self, model: str, results: Dict[str, List[Dict]]):
+        """写入一批句子的实体（{句子: 实体列表}），磁盘上在一个事务中完成，只提交一次"""
+        keyed = [(_digest(model, sentence), entities) for sentence, entities in results.items()]
+        rows = None
+        if self._db is not None:
+            rows = [(key, json.dumps(entities, ensure_ascii=False)) for key, entities in keyed]
+        with self._lock:
+            for key, entities in keyed:
+                self._remember(key, entities)
+            if rows:
+                with self._db:
+                    self._db.executemany("INSERT OR REPLACE INTO ner_sentences (key, entities) VALUES (?, ?)", rows)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "disk": self._db is not None,
+                **self.stats,
+                "hit_rate": round((self.stats["hits"] + self.stats["disk_hits"]) / lookups, 4) if lookups else None,
+            }
+
+
+_cache: Optional[SentenceEntityCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_sentence_cache() -> Optional[SentenceEntityCache]:
+    """进程内共享的句子缓存；关闭时返回 None"""
+    global _cache
+    if not NER_SENTENCE_CACHE_ENABLED or NER_CACHE_SIZE <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = SentenceEntityCache()
+            logger.info(f"NER 句子缓存: 最多 {NER_CACHE_SIZE} 句，磁盘: {NER_CACHE_PATH or '无'}")
+        return _cache
+
+
+def ner_cache_metrics() -> Dict:
+    with _cache_lock:
+        return _cache.snapshot() if _cache is not None else {}
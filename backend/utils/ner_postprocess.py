@@ -0,0 +1,156 @@
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence
+
+
+class Entity:
+    """
+    识别出的实体（__slots__，不为每个实体创建 dict）
+
+    偏移相对于全文；score 在构造时转换为 float，后处理过程中不再修改。
+    original_entities 为合并实体（如 COMBINED_BIO_SYMPTOM）的组成部分；
+    source 为由模型输出构造时对应的 dict（偏移相对于句子），to_dict 由它生成而不是逐个字段重建
+    """
+    __slots__ = ("entity_group", "word", "start", "end", "score", "original_entities", "source")
+
+    def __init__(self, entity_group: str, word: str, start: int, end: int, score: float,
+                 original_entities: Optional[Sequence["Entity"]] = None):
+        self.entity_group = entity_group
+        self.word = word
+        self.start = start
+        self.end = end
+        self.score = float(score)
+        self.original_entities = original_entities
+        self.source = None
+
+    @classmethod
+    def from_dict(cls, entity: Dict, offset: int = 0) -> "Entity":
+        """由模型输出的单个实体 dict 构造，offset 为所在句子在全文中的位置"""
+        return cls.from_dicts((entity,), offset)[0]
+
+    @classmethod
+    def from_dicts(cls, entities: Iterable[Dict], offset: int = 0) -> List["Entity"]:
+        """
+        由模型输出的实体 dict 批量构造（每个实体都经过这里：循环内联，不经过 __init__，也不复制 dict）
+
+        原 dict 只被引用、不被修改，to_dict 时才为保留下来的实体生成平移偏移后的 dict
+        """
+        new = cls.__new__
+        result = []
+        append = result.append
+        for entity in entities:
+            self = new(cls)
+            self.entity_group = entity['entity_group']
+            self.word = entity['word']
+            self.start = entity['start'] + offset
+            self.end = entity['end'] + offset
+            self.score = float(entity['score'])
+            self.original_entities = None
+            self.source = entity
+            append(self)
+        return result
+
+    def to_dict(self) -> Dict:
+        """
+        接口返回的实体格式
+
+        由模型输出构造的实体保留模型输出的全部字段：偏移和得分未变时直接返回原 dict，否则返回更新了偏移和得分的副本
+        """
+        source = self.source
+        if source is not None:
+            if type(source['score']) is not float:
+                return {**source, 'start': self.start, 'end': self.end, 'score': self.score}
+            if source['start'] != self.start:
+                return {**source, 'start': self.start, 'end': self.end}
+            return source
+        entity = {
+            'entity_group': self.entity_group,
+            'word': self.word,
+            'start': self.start,
+            'end': self.end,
+            'score': self.score,
+        }
+        if self.original_entities is not None:
+            entity['original_entities'] = [e.to_dict() for e in self.original_entities]
+        return entity
+
+    def __repr__(self):
+        return f"Entity({self.entity_group!r}, {self.word!r}, {self.start}, {self.end}, {self.score:.4f})"
+
+
+# 可与相邻生物结构合并的实体类型
+_COMBINABLE_GROUPS = frozenset(['SIGN_SYMPTOM', 'DISEASE_DISORDER'])
+
+
+def combine_bio_structure(entities: Sequence[Entity], text: str) -> List[Entity]:
+    """
+    症状 / 疾病与相邻的生物结构合并为 COMBINED_BIO_SYMPTOM（先检查前一个实体，再检查后一个实体）
+
+    生物结构实体本身仍保留，由重叠处理决定去留
+    """
+    combined = []
+    last = len(entities) - 1
+    for i, entity in enumerate(entities):
+        if entity.entity_group in _COMBINABLE_GROUPS:
+            if i > 0 and entities[i - 1].entity_group == 'BIOLOGICAL_STRUCTURE':
+                first, second = entities[i - 1], entity
+            elif i < last and entities[i + 1].entity_group == 'BIOLOGICAL_STRUCTURE':
+                first, second = entity, entities[i + 1]
+            else:
+                combined.append(entity)
+                continue
+            start, end = min(first.start, second.start), max(first.end, second.end)
+            entity = Entity('COMBINED_BIO_SYMPTOM', text[start:end], start, end,
+                            (first.score + second.score) / 2, (first, second))
+        combined.append(entity)
+    return combined
+
+
+def _sort_key(entity: Entity):
+    return entity.start, -entity.end, -entity.score
+
+
+def remove_overlapping(entities: Iterable[Entity]) -> List[Entity]:
+    """
+    移除重叠的实体
+
+    按开始位置、结束位置（降序）和得分（降序）排序一次后线性扫描：实体与已保留的实体不重叠，
+    或比已保留的实体延伸得更远时保留。相同区间的实体中排在最前（得分最高，得分相同时取先出现）的一个保留，
+    其余因不再延伸而被跳过
+    """
+    non_overlapping = []
+    last_end = -1
+    for entity in sorted(entities, key=_sort_key):
+        if entity.start >= last_end or entity.end > last_end:
+            non_overlapping.append(entity)
+            last_end = entity.end
+    return non_overlapping
+
+
+def allowed_groups(term_types: Mapping[str, bool], group_map: Mapping[str, Sequence[str]],
+                   all_key: str) -> Optional[frozenset]:
+    """
+    由请求的术语类型预先计算允许的实体类型集合
+
+    Args:
+        term_types: 请求的术语类型开关
+        group_map: 术语类型 → 实体类型
+        all_key: 表示全部术语的开关（开启时返回 None，不过滤）
+    """
+    if term_types.get(all_key, False):
+        return None
+    return frozenset(group for term_type, groups in group_map.items() if term_types.get(term_type, False)
+                     for group in groups)
+
+
+def filter_entities(entities: Iterable[Entity], allowed: Optional[frozenset]) -> List[Entity]:
+    """只保留类型在 allowed 中的实体；allowed 为 None 时全部保留"""
+    if allowed is None:
+        return list(entities)
+    return [entity for entity in entities if entity.entity_group in allowed]
+
+
+def postprocess(entities: Iterable[Entity], allowed: Optional[frozenset]) -> List[Dict]:
+    """移除重叠实体、按类型过滤，转换为接口返回的格式"""
+    non_overlapping = remove_overlapping(entities)
+    if allowed is None:
+        return [entity.to_dict() for entity in non_overlapping]
+    return [entity.to_dict() for entity in non_overlapping if entity.entity_group in allowed]
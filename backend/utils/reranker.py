@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RERANK_MODEL = "BAAI/bge-reranker-v2-m3"
+
+
+class CrossEncoderReranker:
+    """
+    交叉编码器重排序
+
+    第一阶段由向量库召回 top-N 候选，第二阶段把所有查询的 (query, 候选) 对拼成一个批次，
+    一次前向计算相关性分数后重新排序
+    """
+
+    def __init__(self, model_name: str = DEFAULT_RERANK_MODEL, max_length: int = 512,
+                 batch_size: Optional[int] = None, device: Optional[str] = None):
+        """
+        Args:
+            model_name: 交叉编码器模型名称
+            max_length: (query, 候选) 对的最大 token 长度
+            batch_size: 单次前向的最大对数，None 表示所有对一次前向
+            device: 运行设备，None 时自动选择
+        """
+        from sentence_transformers import CrossEncoder
+
+        logger.info(f"Loading cross-encoder reranker: {model_name}")
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = CrossEncoder(model_name, max_length=max_length, device=device)
+        # 每个 (query, 候选) 对的平均耗时（毫秒），用于在执行前估算是否超出延迟预算
+        self.ms_per_pair: Optional[float] = None
+
+    def score_pairs(self, pairs: Sequence[Tuple[str, str]]) -> np.ndarray:
+        """对 (query, 候选文本) 对打分，分数越大越相关"""
+        if not pairs:
+            return np.zeros(0, dtype=np.float32)
+        start = time.perf_counter()
+        scores = self.model.predict(
+            list(pairs),
+            batch_size=self.batch_size or len(pairs),
+            show_progress_bar=False
+        )
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        per_pair = elapsed_ms / len(pairs)
+        self.ms_per_pair = per_pair if self.ms_per_pair is None else 0.8 * self.ms_per_pair + 0.2 * per_pair
+        return np.asarray(scores, dtype=np.float32)
+
+    def estimate_ms(self, num_pairs: int) -> float:
+        """估算对 num_pairs 个对重排序的耗时，尚无统计时返回 0"""
+        return (self.ms_per_pair or 0.0) * num_pairs
+
+    def rerank(self, queries: Sequence[str], candidates: Sequence[List[Dict]], text_field: str,
+               top_k: int = 5, budget_ms: Optional[float] = None,
+               started_at: Optional[float] = None) -> Tuple[List[List[Dict]], Dict]:
+        """
+        批量重排序多个查询的候选结果
+
+        Args:
+            queries: 查询文本列表
+            candidates: 与 queries 对应的候选列表（向量检索结果，按向量相似度排序）
+            text_field: 候选中用于打分的文本字段
+            top_k: 每个查询保留的结果数
+            budget_ms: 延迟预算（毫秒），从 started_at 起算；已耗时加预估重排序耗时超出预算时跳过重排序
+            started_at: 请求开始时间（time.perf_counter()），为 None 时只比较预估耗时
+
+        Returns:
+            (结果列表, 重排序信息)；结果中每个候选增加 rerank_score 字段，
+            跳过重排序时保持向量检索顺序并截断到 top_k
+        """
+        pairs = []
+        owners = []
+        for qi, (query, hits) in enumerate(zip(queries, candidates)):
+            for ci, hit in enumerate(hits):
+                pairs.append((query, str(hit.get(text_field) or "")))
+                owners.append((qi, ci))
+
+        info = {"applied": False, "model": self.model_name, "pairs": len(pairs), "elapsed_ms": 0.0}
+        truncated = [list(hits[:top_k]) for hits in candidates]
+        if not pairs:
+            return truncated, info
+
+        if budget_ms is not None:
+            spent_ms = (time.perf_counter() - started_at) * 1000 if started_at is not None else 0.0
+            estimate_ms = self.estimate_ms(len(pairs))
+            if spent_ms + estimate_ms > budget_ms:
+                info["skipped"] = "latency_budget"
+                info["estimated_ms"] = round(estimate_ms, 2)
+                logger.info(f"Skipping rerank: spent {spent_ms:.1f}ms + estimated {estimate_ms:.1f}ms > {budget_ms}ms")
+                return truncated, info
+
+        start = time.perf_counter()
+        scores = self.score_pairs(pairs)
+        info["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        info["applied"] = True
+
+        scored: List[List[Dict]] = [[] for _ in candidates]
+        for (qi, ci), score in zip(owners, scores):
+            scored[qi].append({**candidates[qi][ci], "rerank_score": float(score)})
+        results = [
+            sorted(hits, key=lambda h: h["rerank_score"], reverse=True)[:top_k]
+            for hits in scored
+        ]
+        return results, info
+
+
+# 已加载的重排序模型缓存，服务在每个请求中重新构造，避免重复加载模型
+_reranker_cache: Dict[str, CrossEncoderReranker] = {}
+_reranker_lock = threading.Lock()
+
+
+def get_reranker(model_name: str = DEFAULT_RERANK_MODEL) -> CrossEncoderReranker:
+    """按模型名称缓存 CrossEncoderReranker，首次访问时加载"""
+    reranker = _reranker_cache.get(model_name)
+    if reranker is not None:
+        return reranker
+    with _reranker_lock:
+        reranker = _reranker_cache.get(model_name)
+        if reranker is None:
+            reranker = CrossEncoderReranker(model_name)
+            _reranker_cache[model_name] = reranker
+    return reranker
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 单次调用的截止时间（秒）
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "60"))
+EMBEDDING_TIMEOUT_S = float(os.getenv("EMBEDDING_TIMEOUT_S", "15"))
+# 连续失败（含超时）多少次后熔断，熔断多久后放行一个探测请求
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_S = float(os.getenv("BREAKER_RESET_S", "30"))
+
+# 同步调用在线程中执行以便按截止时间放弃等待；超时的调用无法强行终止，会在后台线程中自然结束
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="guarded-call")
+
+
+class ProviderUnavailable(Exception):
+    """模型提供方不可用：调用超过截止时间（deadline_exceeded）或熔断器打开（circuit_open）"""
+
+    def __init__(self, name: str, reason: str, retry_after: Optional[float] = None):
+        super().__init__(f"{name} unavailable ({reason})")
+        self.name = name
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    按提供方的熔断器
+
+    closed：正常调用，连续失败达到阈值后转为 open；
+    open：直接拒绝，reset_s 后转为 half_open；
+    half_open：只放行一个探测请求，成功则恢复 closed，失败则重新 open
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_s: float = BREAKER_RESET_S):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_s = reset_s
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "failures": 0, "timeouts": 0, "rejected": 0, "opened": 0}
+
+    def before_call(self):
+        """
+        Raises:
+            ProviderUnavailable: 熔断器打开，或半开状态下已有探测请求
+        """
+        with self._lock:
+            if self.state == "open":
+                remaining = self.opened_at + self.reset_s - time.monotonic()
+                if remaining > 0:
+                    self.stats["rejected"] += 1
+                    raise ProviderUnavailable(self.name, "circuit_open", retry_after=remaining)
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self._probing:
+                    self.stats["rejected"] += 1
+                    raise ProviderUnavailable(self.name, "circuit_open", retry_after=self.reset_s)
+                self._probing = True
+            self.stats["calls"] += 1
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"{self.name} 恢复，熔断器关闭")
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def release_probe(self):
+        """调用被取消、结果未知时归还半开状态的探测名额"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self, timeout: bool = False):
+        with self._lock:
+            self.failures += 1
+            self.stats["failures"] += 1
+            self.stats["timeouts"] += timeout
+            self._probing = False
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                logger.warning(f"{self.name} 连续失败 {self.failures} 次，熔断 {self.reset_s}s")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.stats["opened"] += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, **self.stats}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """按名称（如 llm:ollama、embedding:openai）共享的熔断器"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def guarded_call(name: str, fn: Callable[[], T], timeout: float) -> T:
+    """
+    在熔断器保护下执行同步调用，超过 timeout 秒不再等待
+
+    Raises:
+        ProviderUnavailable: 熔断器打开或超时
+        Exception: fn 本身抛出的异常（同时计为一次失败）
+    """
+    breaker = get_breaker(name)
+    breaker.before_call()
+    future = _executor.submit(fn)
+    try:
+        result = future.result(timeout=timeout)
+    except FutureTimeoutError:
+        future.cancel()
+        breaker.record_failure(timeout=True)
+        raise ProviderUnavailable(name, "deadline_exceeded")
+    except Exception:
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    return result
+
+
+async def guarded_acall(name: str, fn: Callable[[], Awaitable[T]], timeout: float) -> T:
+    """guarded_call 的 async 版本，超时时取消调用（关闭连接，提供方随之停止生成）"""
+    breaker = get_breaker(name)
+    breaker.before_call()
+    try:
+        result = await asyncio.wait_for(fn(), timeout)
+    except asyncio.TimeoutError:
+        breaker.record_failure(timeout=True)
+        raise ProviderUnavailable(name, "deadline_exceeded")
+    except asyncio.CancelledError:
+        # 调用方取消（如客户端断开）不说明提供方有问题，只释放探测名额
+        breaker.release_probe()
+        raise
+    except Exception:
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    return result
+
+
+def guarded_llm(llm, provider: str, timeout: float = LLM_TIMEOUT_S):
+    """
+    带截止时间和熔断的 LLM，可与 prompt 组成 chain，返回值与 llm 相同
+
+    sync 调用在当前线程的独立事件循环中执行 async 版本，超时时能真正取消请求
+    """
+    from langchain_core.runnables import RunnableLambda
+
+    name = f"llm:{provider}"
+
+    async def ainvoke(prompt):
+        return await guarded_acall(name, lambda: llm.ainvoke(prompt), timeout)
+
+    def invoke(prompt):
+        return asyncio.run(ainvoke(prompt))
+
+    return RunnableLambda(invoke, afunc=ainvoke, name=f"guarded[{provider}]")
+
+
+class GuardedEmbeddings:
+    """带截止时间和熔断的嵌入函数（embed_query / embed_documents 与被包装的嵌入模型相同）"""
+
+    def __init__(self, embeddings, provider: str, timeout: float = EMBEDDING_TIMEOUT_S):
+        self.embeddings = embeddings
+        self.name = f"embedding:{provider}"
+        self.timeout = timeout
+
+    def embed_query(self, text: str) -> List[float]:
+        return guarded_call(self.name, lambda: self.embeddings.embed_query(text), self.timeout)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return guarded_call(self.name, lambda: self.embeddings.embed_documents(texts), self.timeout)
+
+
+def breaker_metrics() -> Dict[str, Dict]:
+    with _breakers_lock:
+        breakers = list(_breakers.items())
+    return {name: breaker.snapshot() for name, breaker in breakers}
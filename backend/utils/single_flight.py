@@ -0,0 +1,84 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# SINGLE_FLIGHT_ENABLED=0 时关闭请求合并（每个请求独立计算）
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "1") != "0"
+
+
+def request_key(endpoint: str, payload: BaseModel) -> str:
+    """
+    请求的规范化键：端点名 + 校验后输入的 JSON（键排序）的哈希
+
+    校验后的输入已补全默认值，字段顺序或省略默认值不同的相同请求得到相同的键
+    """
+    canonical = json.dumps(payload.model_dump(mode="json"), sort_keys=True, ensure_ascii=False,
+                           separators=(",", ":"))
+    return f"{endpoint}:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}"
+
+
+class SingleFlight:
+    """
+    相同请求合并（single-flight）
+
+    同一个键的计算在进行中时，后到的相同请求不再重新计算，而是等待同一个计算并共享其结果（或异常）。
+    计算结束后立即移除，不缓存结果
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {"executed": 0, "coalesced": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """执行 fn，或等待同一个键正在进行的计算"""
+        future = self._inflight.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            # shield：某个等待方被取消时不影响计算本身和其他等待方
+            return await asyncio.shield(future)
+
+        self.stats["executed"] += 1
+        future = asyncio.ensure_future(fn())
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "inflight": len(self._inflight)}
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_single_flight(name: str) -> SingleFlight:
+    """按端点名共享的合并组"""
+    with _groups_lock:
+        group = _groups.get(name)
+        if group is None:
+            group = _groups[name] = SingleFlight(name)
+        return group
+
+
+async def coalesce(endpoint: str, payload: BaseModel, fn: Callable[[], Awaitable[T]]) -> T:
+    """按校验后的输入合并相同的并发请求；未开启时直接执行"""
+    if not SINGLE_FLIGHT_ENABLED:
+        return await fn()
+    return await get_single_flight(endpoint).do(request_key(endpoint, payload), fn)
+
+
+def single_flight_metrics() -> Dict[str, Dict[str, Any]]:
+    """各端点的执行次数、被合并的请求数和进行中的计算数"""
+    with _groups_lock:
+        return {name: group.snapshot() for name, group in _groups.items()}
@@ -0,0 +1,384 @@
+import csv
+import logging
+import os
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.abbreviation_dictionary import get_abbreviation_dictionary, is_abbreviation_like
+
+logger = logging.getLogger(__name__)
+
+_DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+# 离线构建的词表（tools/build_spell_vocabulary.py 写出），每行 "词\t词频"
+DEFAULT_SPELL_VOCABULARY_PATH = _DATA_DIR / "spell_vocabulary.txt"
+# 词表不存在时退回到只用 SNOMED 概念名称构建
+DEFAULT_SNOMED_PATH = _DATA_DIR / "SNOMED_5000.csv"
+# 词表首行标记：合并了通用英文词表，可以在本地自动纠正（只有医学词时 since 会被纠正为 sine）
+GENERAL_LEXICON_MARKER = "#general_lexicon"
+
+# 英文单词：与数字相连的 token（10mg、x2）不检查
+_EN_TOKEN_RE = re.compile(r"(?<![A-Za-z0-9_])[A-Za-z]+(?:'[A-Za-z]+)?(?![A-Za-z0-9_])")
+_CJK_RUN_RE = re.compile(r"[\u4e00-\u9fff]+")
+_FSN_TAG_RE = re.compile(r"\s*\([a-z /]+\)$")
+# 同一编辑距离有多个候选时，首选词频不低于次选的该倍数才视为无歧义
+DOMINANCE_RATIO = 10.0
+# 短于该长度的英文单词不检查（候选过多，误纠率高）
+MIN_TOKEN_LENGTH = 3
+# 编辑距离为 2 的纠正只对不短于该长度的词在本地执行，较短的词交给 LLM（可能是词表外的正确单词）
+LOCAL_DISTANCE_2_MIN_LENGTH = 8
+# 最长中文词长度（正向最大匹配）
+MAX_CJK_WORD_LENGTH = 8
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    限制最大距离的 Damerau-Levenshtein（OSA）编辑距离
+
+    超过 max_distance 时返回 max_distance + 1
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    prev_prev = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(prev[j] + 1, current[j - 1] + 1, prev[j - 1] + cost)
+            if prev_prev is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, prev_prev[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > max_distance:
+            return max_distance + 1
+        prev_prev, prev = prev, current
+    return prev[-1] if prev[-1] <= max_distance else max_distance + 1
+
+
+@dataclass
+class Suggestion:
+    term: str
+    distance: int
+    count: int
+
+
+class SymSpell:
+    """
+    对称删除拼写纠错索引
+
+    预先为词表中每个词生成删除 max_edit_distance 个字符以内的全部变体（只取前 prefix_length 个字符），
+    查询时对输入做同样的删除并在索引中查找，候选数量很少，单次查询为亚毫秒级
+    """
+
+    def __init__(self, max_edit_distance: int = 2, prefix_length: int = 7):
+        self.max_edit_distance = max_edit_distance
+        self.prefix_length = prefix_length
+        self.words: Dict[str, int] = {}
+        self.deletes: Dict[str, List[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.words
+
+    def _edits(self, word: str, distance: int, out: set):
+        distance += 1
+        if len(word) <= 1:
+            return
+        for i in range(len(word)):
+            delete = word[:i] + word[i + 1:]
+            if delete not in out:
+                out.add(delete)
+                if distance < self.max_edit_distance:
+                    self._edits(delete, distance, out)
+
+    def _deletes_of(self, word: str) -> set:
+        prefix = word[:self.prefix_length]
+        out = {prefix}
+        self._edits(prefix, 0, out)
+        return out
+
+    def add_word(self, word: str, count: int = 1):
+        """加入词表，已存在的词累加词频"""
+        if word in self.words:
+            self.words[word] += count
+            return
+        self.words[word] = count
+        for delete in self._deletes_of(word):
+            self.deletes.setdefault(delete, []).append(word)
+
+    def lookup(self, term: str, max_edit_distance: Optional[int] = None) -> List[Suggestion]:
+        """
+        查找编辑距离最小的候选（距离相同时按词频降序）
+
+        Returns:
+            距离最小的全部候选；词在词表中时只返回自身（距离 0），找不到时返回空列表
+        """
+        max_distance = min(self.max_edit_distance if max_edit_distance is None else max_edit_distance,
+                           self.max_edit_distance)
+        if term in self.words:
+            return [Suggestion(term, 0, self.words[term])]
+
+        best_distance = max_distance
+        suggestions: List[Suggestion] = []
+        checked = set()
+        prefix = term[:self.prefix_length]
+        for candidate in self._deletes_of(term):
+            # 删除次数超过当前最优距离的变体不可能给出更近的候选
+            if len(prefix) - len(candidate) > best_distance:
+                continue
+            for word in self.deletes.get(candidate, ()):
+                if word in checked or abs(len(word) - len(term)) > best_distance:
+                    continue
+                checked.add(word)
+                distance = edit_distance(term, word, best_distance)
+                if distance > best_distance:
+                    continue
+                if distance < best_distance:
+                    best_distance = distance
+                    suggestions = [s for s in suggestions if s.distance <= distance]
+                suggestions.append(Suggestion(word, distance, self.words[word]))
+        suggestions = [s for s in suggestions if s.distance == best_distance]
+        return sorted(suggestions, key=lambda s: -s.count)
+
+
+# 常见屈折后缀及还原方式（denies -> deny，noted -> note），词表中只有原形时也视为正确拼写
+_INFLECTIONS = (
+    ("ies", "y"), ("ied", "y"), ("ing", ""), ("ing", "e"), ("es", ""), ("ed", ""), ("ed", "e"),
+    ("ly", ""), ("s", ""), ("d", ""),
+)
+
+
+def _match_case(original: str, correction: str) -> str:
+    """按原词的大小写形式输出纠正结果（Pateint -> Patient，PATEINT -> PATIENT）"""
+    if original.isupper() and len(original) > 1:
+        return correction.upper()
+    if original[:1].isupper():
+        return correction[:1].upper() + correction[1:]
+    return correction
+
+
+class SpellChecker:
+    """
+    本地拼写检查器
+
+    词表来自 SNOMED 概念名称 / 同义词和通用英文、中文词表。无歧义的英文拼写错误直接在本地纠正，
+    未知词、有歧义的错误和中文的可疑片段标记为未解决，交给 LLM 处理
+    """
+
+    def __init__(self, index: SymSpell, cjk_words: Optional[set] = None, auto_correct: bool = True):
+        """
+        Args:
+            index: 对称删除索引
+            cjk_words: 中文词集合，None 时从索引中取出中文词
+            auto_correct: 是否在本地纠正；为 False 时只检查，词表外的词全部标记为未解决
+        """
+        self.index = index
+        self.auto_correct = auto_correct
+        self.cjk_words = cjk_words if cjk_words is not None else {w for w in index.words if _CJK_RUN_RE.fullmatch(w)}
+        self.abbreviations = get_abbreviation_dictionary()
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def is_known(self, token: str) -> bool:
+        """token（小写）或其去掉屈折后缀后的原形在词表中"""
+        if token in self.index:
+            return True
+        return any(
+            token.endswith(suffix) and len(token) - len(suffix) >= MIN_TOKEN_LENGTH
+            and token[:-len(suffix)] + replacement in self.index
+            for suffix, replacement in _INFLECTIONS
+        )
+
+    def _resolve(self, token: str, max_distance: int) -> Tuple[Optional[str], Optional[Dict]]:
+        """
+        查询单个 token
+
+        Returns:
+            (纠正结果, 未解决原因)；token 在词表中时两者均为 None
+        """
+        if self.is_known(token):
+            return None, None
+        suggestions = self.index.lookup(token, max_distance)
+        if not suggestions:
+            return None, {"reason": "unknown"}
+        if not self.auto_correct:
+            return None, {"reason": "unverified", "candidates": [s.term for s in suggestions[:5]]}
+        if (len(suggestions) > 1 and suggestions[0].count < DOMINANCE_RATIO * suggestions[1].count) \
+                or (suggestions[0].distance > 1 and len(token) < LOCAL_DISTANCE_2_MIN_LENGTH):
+            return None, {"reason": "ambiguous", "candidates": [s.term for s in suggestions[:5]]}
+        return suggestions[0].term, None
+
+    def _english_tokens(self, text: str) -> Iterable[Tuple[int, int, str, int]]:
+        """需要检查的英文 token 及其最大编辑距离：缩写、过短的词不检查"""
+        for match in _EN_TOKEN_RE.finditer(text):
+            token = match.group()
+            if len(token) < MIN_TOKEN_LENGTH or is_abbreviation_like(token) \
+                    or (not token.islower() and token in self.abbreviations):
+                continue
+            yield match.start(), match.end(), token.lower(), 1 if len(token) <= 4 else 2
+
+    def _cjk_tokens(self, text: str) -> Iterable[Tuple[int, int, str]]:
+        """
+        中文片段按词表正向最大匹配分词，连续两个以上未匹配到多字词的单字作为可疑片段
+
+        未加载中文词表时不检查中文
+        """
+        if not self.cjk_words:
+            return
+        for run in _CJK_RUN_RE.finditer(text):
+            chars, pieces, i = run.group(), [], 0
+            while i < len(chars):
+                size = next((size for size in range(min(MAX_CJK_WORD_LENGTH, len(chars) - i), 1, -1)
+                             if chars[i:i + size] in self.cjk_words), 1)
+                pieces.append((i, size))
+                i += size
+            singles_start = None
+            for pos, size in pieces + [(len(chars), 0)]:
+                if size == 1:
+                    singles_start = pos if singles_start is None else singles_start
+                    continue
+                if singles_start is not None and pos - singles_start >= 2:
+                    yield run.start() + singles_start, run.start() + pos, chars[singles_start:pos]
+                singles_start = None
+
+    def check(self, text: str) -> Dict:
+        """
+        检查并在本地纠正文本中的拼写错误
+
+        Returns:
+            {
+                "text": 本地纠正后的文本,
+                "corrections": [{"token", "start", "end", "correction"}],
+                "unresolved": [{"token", "start", "end", "reason": "unknown" / "ambiguous" / "unverified",
+                                "candidates"}]
+            }
+            偏移均相对于原始文本；unverified 表示有候选但未开启本地纠正
+        """
+        corrections, unresolved = [], []
+        for start, end, token, max_distance in self._english_tokens(text):
+            correction, problem = self._resolve(token, max_distance)
+            original = text[start:end]
+            if correction is not None:
+                corrections.append({
+                    "token": original, "start": start, "end": end,
+                    "correction": _match_case(original, correction)
+                })
+            elif problem is not None:
+                unresolved.append({"token": original, "start": start, "end": end, **problem})
+
+        # 中文的错别字多为同音 / 形近的合法单字，编辑距离无法可靠判断，可疑片段一律交给 LLM
+        for start, end, token in self._cjk_tokens(text):
+            candidates = [s.term for s in self.index.lookup(token, 1)[:5]]
+            unresolved.append({
+                "token": token, "start": start, "end": end,
+                "reason": "ambiguous" if candidates else "unknown", "candidates": candidates
+            })
+        unresolved.sort(key=lambda item: item["start"])
+
+        # 从后往前替换，保持前面的偏移不变
+        corrected = text
+        for item in reversed(corrections):
+            corrected = corrected[:item["start"]] + item["correction"] + corrected[item["end"]:]
+        return {"text": corrected, "corrections": corrections, "unresolved": unresolved}
+
+    @classmethod
+    def from_counts(cls, counts: Dict[str, int], max_edit_distance: int = 2,
+                    auto_correct: bool = True) -> "SpellChecker":
+        index = SymSpell(max_edit_distance=max_edit_distance)
+        for word, count in counts.items():
+            index.add_word(word, count)
+        return cls(index, auto_correct=auto_correct)
+
+    @classmethod
+    def load(cls, path, max_edit_distance: int = 2) -> "SpellChecker":
+        """加载词表；词表没有通用英文词表标记时只检查，不在本地纠正"""
+        checker = cls.from_counts(dict(read_vocabulary(path)), max_edit_distance,
+                                  auto_correct=has_general_lexicon(path))
+        if not checker.auto_correct:
+            logger.warning(f"Spell vocabulary {path} has no general English lexicon; local auto-correction disabled")
+        return checker
+
+
+def vocabulary_words(text: str) -> List[str]:
+    """词表中收录的词：小写英文单词（缩写除外）和中文片段"""
+    words = [
+        match.group().lower() for match in _EN_TOKEN_RE.finditer(text)
+        if not is_abbreviation_like(match.group())
+    ]
+    return words + _CJK_RUN_RE.findall(text)
+
+
+def snomed_word_counts(path=DEFAULT_SNOMED_PATH) -> Counter:
+    """统计 SNOMED 概念名称和 FSN / 同义词中的词频（只依赖标准库，服务端可直接调用）"""
+    counts: Counter = Counter()
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            terms = [row.get("concept_name") or ""] + (row.get("FSN") or "").split("; ")
+            for term in terms:
+                counts.update(vocabulary_words(_FSN_TAG_RE.sub("", term)))
+    return counts
+
+
+def has_general_lexicon(path) -> bool:
+    """词表是否由 build_spell_vocabulary.py 合并了通用英文词表（首行为 GENERAL_LEXICON_MARKER）"""
+    with open(path, encoding="utf-8") as f:
+        return f.readline().split("\t")[0].strip() == GENERAL_LEXICON_MARKER
+
+
+def read_vocabulary(path) -> Iterable[Tuple[str, int]]:
+    """读取 "词<空白>词频" 格式的词表（兼容 SymSpell 的频率词典和 jieba 词典），缺少词频时记为 1，跳过 # 开头的标记行"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if not parts or parts[0].startswith("#"):
+                continue
+            count = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 1
+            yield parts[0], count
+
+
+def write_vocabulary(counts: Dict[str, int], path, general_lexicon: bool = False) -> Path:
+    """写出词表；general_lexicon 为 True 时写入首行标记，加载时才开启本地自动纠正"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        if general_lexicon:
+            f.write(f"{GENERAL_LEXICON_MARKER}\t1\n")
+        for word, count in sorted(counts.items(), key=lambda item: (-item[1], item[0])):
+            f.write(f"{word}\t{count}\n")
+    logger.info(f"Saved {len(counts)} words to {path}")
+    return path
+
+
+_checker: Optional[SpellChecker] = None
+_checker_lock = threading.Lock()
+
+
+def get_spell_checker() -> SpellChecker:
+    """
+    进程内共享的拼写检查器
+
+    优先加载离线构建的词表（SPELL_VOCABULARY_PATH 环境变量或默认路径），
+    不存在时只用 SNOMED 概念名称构建。词表中没有通用英文词时（since 会被当作 sine 的拼写错误），
+    只做检查不在本地纠正（auto_correct 为 False）
+    """
+    global _checker
+    if _checker is None:
+        with _checker_lock:
+            if _checker is None:
+                path = Path(os.getenv("SPELL_VOCABULARY_PATH", str(DEFAULT_SPELL_VOCABULARY_PATH)))
+                if path.exists():
+                    _checker = SpellChecker.load(path)
+                    logger.info(f"Loaded spell vocabulary of {len(_checker)} words from {path}")
+                else:
+                    _checker = SpellChecker.from_counts(snomed_word_counts(), auto_correct=False)
+                    logger.warning(f"Spell vocabulary not found at {path}; built {len(_checker)} words "
+                                   f"from {DEFAULT_SNOMED_PATH}, local auto-correction disabled")
+    return _checker
@@ -0,0 +1,111 @@
+import re
+from dataclasses import dataclass
+from typing import List
+
+# 病历中的脱敏占位符（___），分块和 LLM 输出都必须原样保留
+PLACEHOLDER_RE = re.compile(r"_{3,}")
+
+# 分隔符：空行、以 "标题:" 开头的新行为段落边界（必定分块）；句末标点后的空白为句子边界（可合并）
+_SECTION_BREAK_RE = re.compile(r"\n[ \t]*\n\s*|\n(?=[ \t]*[A-Za-z][A-Za-z /&-]{0,40}:)")
+# 句末标点前是数字时（列表序号 "1."、小数）不视为句子边界
+_SENTENCE_BREAK_RE = re.compile(r"(?<=[^\d\s][.!?;])\s+|(?<=[。！？；])\s*")
+# 需要交给 LLM 纠正的内容：含小写字母的英文单词（全大写的缩写不纠正）或中文
+_CORRECTABLE_RE = re.compile(r"\b(?=[A-Za-z]*[a-z])[A-Za-z]{3,}\b|[\u4e00-\u9fff]")
+
+
+@dataclass
+class TextChunk:
+    """原文中的一个分块，[start, end) 不含块间的分隔空白"""
+    index: int
+    start: int
+    end: int
+    text: str
+
+
+def count_placeholders(text: str) -> int:
+    return len(PLACEHOLDER_RE.findall(text))
+
+
+def needs_correction(text: str) -> bool:
+    """分块中是否有可能需要纠正的内容（只有数字、占位符、缩写或标点的分块直接跳过）"""
+    return _CORRECTABLE_RE.search(PLACEHOLDER_RE.sub(" ", text)) is not None
+
+
+def _breaks(text: str) -> List[tuple]:
+    """全部分隔符 (start, end, 是否段落边界)，按位置排序，重叠时段落边界优先"""
+    breaks = {}
+    for match in _SENTENCE_BREAK_RE.finditer(text):
+        breaks[match.start()] = (match.start(), match.end(), False)
+    for match in _SECTION_BREAK_RE.finditer(text):
+        breaks[match.start()] = (match.start(), max(match.end(), breaks.get(match.start(), (0, 0))[1]), True)
+    result, last_end = [], 0
+    for start, end, hard in sorted(breaks.values()):
+        if start < last_end:
+            # 与前一个分隔符重叠（如句号后紧跟空行）：合并为一个
+            prev_start, prev_end, prev_hard = result[-1]
+            result[-1] = (prev_start, max(prev_end, end), prev_hard or hard)
+        else:
+            result.append((start, end, hard))
+        last_end = result[-1][1]
+    return result
+
+
+def split_into_chunks(text: str, max_chars: int = 600) -> List[TextChunk]:
+    """
+    按段落 / 句子边界把病历切分为分块
+
+    段落边界必定分块；同一段落内的相邻句子合并，直到分块超过 max_chars。
+    分隔空白不属于任何分块，按分块偏移回填即可还原原文格式
+
+    Args:
+        text: 病历全文
+        max_chars: 合并句子时分块的最大字符数（单个句子超长时不再切分）
+
+    Returns:
+        按原文顺序排列的分块
+    """
+    units, pos = [], 0
+    for start, end, hard in _breaks(text) + [(len(text), len(text), True)]:
+        # 去掉单元首尾空白，空白始终留在分块之外
+        unit_start, unit_end = pos, start
+        while unit_start < unit_end and text[unit_start].isspace():
+            unit_start += 1
+        while unit_end > unit_start and text[unit_end - 1].isspace():
+            unit_end -= 1
+        if unit_end > unit_start:
+            units.append((unit_start, unit_end, hard))
+        elif units and hard:
+            units[-1] = (units[-1][0], units[-1][1], True)
+        pos = end
+
+    chunks: List[TextChunk] = []
+    chunk_start = chunk_end = None
+    for start, end, hard_after in units:
+        if chunk_start is not None and end - chunk_start > max_chars:
+            chunks.append(TextChunk(len(chunks), chunk_start, chunk_end, text[chunk_start:chunk_end]))
+            chunk_start = None
+        if chunk_start is None:
+            chunk_start = start
+        chunk_end = end
+        if hard_after:
+            chunks.append(TextChunk(len(chunks), chunk_start, chunk_end, text[chunk_start:chunk_end]))
+            chunk_start = None
+    if chunk_start is not None:
+        chunks.append(TextChunk(len(chunks), chunk_start, chunk_end, text[chunk_start:chunk_end]))
+    return chunks
+
+
+def split_into_sentences(text: str) -> List[TextChunk]:
+    """按段落 / 句子边界切分，每个句子一个分块（不合并相邻句子），偏移相对于原文"""
+    return split_into_chunks(text, max_chars=0)
+
+
+def reassemble(text: str, chunks: List[TextChunk], replacements: List[str]) -> str:
+    """用各分块的新内容替换原文中的对应区间，保留块间的分隔空白"""
+    parts, pos = [], 0
+    for chunk, replacement in zip(chunks, replacements):
+        parts.append(text[pos:chunk.start])
+        parts.append(replacement)
+        pos = chunk.end
+    parts.append(text[pos:])
+    return "".join(parts)
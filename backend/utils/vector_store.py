@@ -0,0 +1,403 @@
+import json
+import logging
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from utils.index_sync import iter_milvus_rows, milvus_in_filter
+
+logger = logging.getLogger(__name__)
+
+# 元数据过滤条件：{字段: 值} 表示相等，{字段: [值, ...]} 表示取值在列表中，多个字段之间为 AND
+MetadataFilter = Dict[str, Any]
+
+
+@dataclass
+class SearchHit:
+    """
+    统一的检索命中
+
+    score 为统一的相似度（越大越相似）：cosine 空间为余弦相似度，ip 空间为内积，
+    l2 空间按归一化向量换算为 1 - d²/2（与余弦相似度等价）
+
+    fusion 仅在混合检索中设置：{"rrf_score", "dense_rank", "lexical_rank"}，
+    只由词法检索命中的记录 dense_rank 为 None，score 没有意义
+    """
+    id: str
+    score: float
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    document: Optional[str] = None
+    fusion: Optional[Dict[str, Any]] = None
+
+
+def similarity_from_distance(distance: float, metric: str) -> float:
+    """
+    将后端原始距离换算为统一相似度
+
+    Args:
+        distance: 后端返回的距离（Chroma）
+        metric: 距离空间 cosine / ip / l2
+    """
+    metric = metric.lower()
+    if metric == "cosine":
+        return 1.0 - distance
+    if metric == "ip":
+        return 1.0 - distance
+    if metric == "l2":
+        return 1.0 - distance / 2.0
+    raise ValueError(f"Unsupported metric: {metric}")
+
+
+def _as_list(value) -> list:
+    return list(value) if isinstance(value, (list, tuple, set)) else [value]
+
+
+class VectorStore(ABC):
+    """
+    向量检索统一接口
+
+    各后端（Milvus / Chroma / 进程内 NumPy）的批量检索、按ID获取、计数和元数据过滤
+    都通过该接口暴露，相似度语义一致，服务层只需实现一次结果整形
+    """
+    metric: str = "cosine"
+
+    @abstractmethod
+    def search_batch(self, embeddings, limit: int = 5,
+                     filters: Optional[MetadataFilter] = None) -> List[List[SearchHit]]:
+        """批量检索，每个查询返回按相似度降序排列的命中列表"""
+
+    def search(self, embedding, limit: int = 5, filters: Optional[MetadataFilter] = None) -> List[SearchHit]:
+        """单条检索"""
+        return self.search_batch([embedding], limit, filters)[0]
+
+    @abstractmethod
+    def get_by_ids(self, ids: Sequence[str]) -> List[SearchHit]:
+        """按ID获取记录（score 为 1.0），不存在的ID不返回"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """记录总数"""
+
+
+class MilvusVectorStore(VectorStore):
+    """
+    Milvus 适配器
+
+    Milvus 对 COSINE / IP 直接返回相似度，L2 返回距离平方，统一换算为相似度。
+    指定 partition_field 时，若集合按该字段建立了分区，对该字段的过滤会改为只检索对应分区
+    """
+    def __init__(self, client, collection_name: str, output_fields: Sequence[str],
+                 id_field: str = "concept_id", metric: str = "COSINE",
+                 search_params: Optional[Dict] = None,
+                 partition_field: Optional[str] = None, partition_name=None):
+        self.client = client
+        self.collection_name = collection_name
+        self.output_fields = list(output_fields)
+        self.id_field = id_field
+        self.metric = metric.lower()
+        self.search_params = search_params
+        self.partition_field = partition_field
+        self.partition_name = partition_name
+        self.partitions = set()
+        if partition_field and partition_name:
+            self.partitions = set(client.list_partitions(collection_name)) - {"_default"}
+
+    def _route_partitions(self, filters: Optional[MetadataFilter]) -> Optional[List[str]]:
+        """
+        根据分区字段上的过滤条件确定需要检索的分区
+
+        _default 分区始终包含在内（兼容分区化之前写入的数据），过滤表达式仍然保留，
+        因此结果与不分区时完全一致，只是跳过了无关分区。集合未分区时返回 None
+        """
+        if not filters or not self.partitions or self.partition_field not in filters:
+            return None
+        names = {self.partition_name(str(v)) for v in _as_list(filters[self.partition_field])}
+        return sorted(names & self.partitions) + ["_default"]
+
+    @staticmethod
+    def build_filter(filters: Optional[MetadataFilter]) -> str:
+        """将元数据过滤条件转换为 Milvus 布尔表达式"""
+        if not filters:
+            return ""
+        clauses = []
+        for key, value in filters.items():
+            values = _as_list(value)
+            if len(values) == 1:
+                clauses.append(f"{key} == {json.dumps(str(values[0]), ensure_ascii=False)}")
+            else:
+                clauses.append(milvus_in_filter(key, values))
+        return " and ".join(clauses)
+
+    def _hit(self, entity: Dict, distance: float) -> SearchHit:
+        score = float(distance)
+        if self.metric == "l2":
+            score = similarity_from_distance(score, "l2")
+        metadata = {f: entity.get(f) for f in self.output_fields}
+        return SearchHit(id=str(entity.get(self.id_field)), score=score, metadata=metadata)
+
+    def search_batch(self, embeddings, limit: int = 5,
+                     filters: Optional[MetadataFilter] = None) -> List[List[SearchHit]]:
+        data = [list(map(float, e)) if not isinstance(e, list) else e for e in embeddings]
+        search_kwargs = {
+            "collection_name": self.collection_name,
+            "data": data,
+            "limit": limit,
+            "output_fields": self.output_fields,
+        }
+        partition_names = self._route_partitions(filters)
+        if partition_names is not None:
+            search_kwargs["partition_names"] = partition_names
+        expr = self.build_filter(filters)
+        if expr:
+            search_kwargs["filter"] = expr
+        if self.search_params:
+            search_kwargs["search_params"] = self.search_params
+        search_result = self.client.search(**search_kwargs)
+        return [[self._hit(hit["entity"], hit["distance"]) for hit in hits] for hits in search_result]
+
+    def get_by_ids(self, ids: Sequence[str]) -> List[SearchHit]:
+        if not ids:
+            return []
+        rows = self.client.query(
+            collection_name=self.collection_name,
+            filter=milvus_in_filter(self.id_field, ids),
+            output_fields=self.output_fields,
+        )
+        return [SearchHit(id=str(row.get(self.id_field)), score=1.0,
+                          metadata={f: row.get(f) for f in self.output_fields}) for row in rows]
+
+    def count(self) -> int:
+        stats = self.client.get_collection_stats(self.collection_name)
+        return int(stats.get("row_count", 0))
+
+
+class ChromaVectorStore(VectorStore):
+    """
+    Chroma 适配器
+
+    Chroma 返回的是距离，按集合的 hnsw:space 换算为统一相似度
+    """
+    def __init__(self, collection, metric: Optional[str] = None):
+        self.collection = collection
+        self.metric = (metric or (collection.metadata or {}).get("hnsw:space", "l2")).lower()
+
+    @staticmethod
+    def build_where(filters: Optional[MetadataFilter]) -> Optional[Dict]:
+        """将元数据过滤条件转换为 Chroma where 子句"""
+        if not filters:
+            return None
+        clauses = []
+        for key, value in filters.items():
+            values = _as_list(value)
+            clauses.append({key: values[0]} if len(values) == 1 else {key: {"$in": values}})
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def search_batch(self, embeddings, limit: int = 5,
+                     filters: Optional[MetadataFilter] = None) -> List[List[SearchHit]]:
+        query_embeddings = [list(map(float, e)) for e in embeddings]
+        query_kwargs = {
+            "query_embeddings": query_embeddings,
+            "n_results": limit,
+            "include": ["documents", "metadatas", "distances"],
+        }
+        where = self.build_where(filters)
+        if where:
+            query_kwargs["where"] = where
+        results = self.collection.query(**query_kwargs)
+
+        batch = []
+        for i in range(len(query_embeddings)):
+            batch.append([
+                SearchHit(
+                    id=results["ids"][i][j],
+                    score=similarity_from_distance(results["distances"][i][j], self.metric),
+                    metadata=results["metadatas"][i][j] or {},
+                    document=results["documents"][i][j],
+                )
+                for j in range(len(results["ids"][i]))
+            ])
+        return batch
+
+    def get_by_ids(self, ids: Sequence[str]) -> List[SearchHit]:
+        if not ids:
+            return []
+        results = self.collection.get(ids=list(ids), include=["documents", "metadatas"])
+        return [
+            SearchHit(id=item_id, score=1.0, metadata=metadata or {}, document=document)
+            for item_id, document, metadata in zip(results["ids"], results["documents"], results["metadatas"])
+        ]
+
+    def count(self) -> int:
+        return self.collection.count()
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    进程内 NumPy 精确检索
+
+    适用于几千到几万条向量的小集合：向量保存为连续的 float32 矩阵，
+    一次矩阵乘法 + argpartition 取 top-k，比 Milvus Lite / Chroma 的往返更快，且天然支持批量查询
+
+    metric:
+        - cosine: 向量预先归一化，按余弦相似度排序
+        - ip: 按内积排序
+        - l2: 按欧氏距离平方排序，分值换算为 1 - d²/2
+    """
+    def __init__(self, vectors, ids: Sequence[str], metadata: Sequence[Dict],
+                 documents: Optional[Sequence[str]] = None, metric: str = "cosine"):
+        metric = metric.lower()
+        if metric not in ("cosine", "ip", "l2"):
+            raise ValueError(f"Unsupported metric: {metric}")
+
+        matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+        if matrix.ndim != 2 or matrix.shape[0] != len(ids):
+            raise ValueError(f"Vector matrix shape {matrix.shape} does not match {len(ids)} ids")
+
+        self.metric = metric
+        self.ids = [str(i) for i in ids]
+        self.metadata = list(metadata)
+        self.documents = list(documents) if documents is not None else None
+        self._row_of = {item_id: row for row, item_id in enumerate(self.ids)}
+        self._filter_cache: Dict[str, np.ndarray] = {}
+
+        if metric == "cosine":
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix = matrix / norms
+        self.matrix = matrix
+        # l2 距离展开为 |q|^2 + |x|^2 - 2 q·x，预先计算 |x|^2
+        self.sq_norms = np.einsum("ij,ij->i", matrix, matrix) if metric == "l2" else None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _prepare_queries(self, queries) -> np.ndarray:
+        q = np.asarray(queries, dtype=np.float32)
+        if q.ndim == 1:
+            q = q[None, :]
+        if self.metric == "cosine":
+            norms = np.linalg.norm(q, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            q = q / norms
+        return q
+
+    def candidate_rows(self, filters: Optional[MetadataFilter]) -> Optional[np.ndarray]:
+        """按元数据过滤得到候选行号（同一过滤条件只扫描一次）"""
+        if not filters:
+            return None
+        key = json.dumps(filters, sort_keys=True, default=str)
+        rows = self._filter_cache.get(key)
+        if rows is None:
+            allowed = {k: {str(v) for v in _as_list(value)} for k, value in filters.items()}
+            rows = np.array([
+                row for row, meta in enumerate(self.metadata)
+                if all(str(meta.get(k)) in values for k, values in allowed.items())
+            ], dtype=np.int64)
+            self._filter_cache[key] = rows
+        return rows
+
+    def topk(self, queries, limit: int = 5, candidates: Optional[np.ndarray] = None):
+        """
+        批量 top-k 精确检索（底层接口）
+
+        Returns:
+            每个查询一个列表，元素为 (行号, 统一相似度)，按相似度从高到低排列
+        """
+        q = self._prepare_queries(queries)
+        rows = np.arange(len(self.ids)) if candidates is None else np.asarray(candidates, dtype=np.int64)
+        if len(rows) == 0 or limit <= 0:
+            return [[] for _ in range(q.shape[0])]
+
+        matrix = self.matrix if candidates is None else self.matrix[rows]
+        scores = q @ matrix.T
+        if self.metric == "l2":
+            sq = self.sq_norms if candidates is None else self.sq_norms[rows]
+            sq_dist = np.einsum("ij,ij->i", q, q)[:, None] + sq[None, :] - 2.0 * scores
+            scores = 1.0 - sq_dist / 2.0
+
+        k = min(limit, scores.shape[1])
+        if k < scores.shape[1]:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(k), (scores.shape[0], 1))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+
+        return [[(int(rows[j]), float(scores[qi, j])) for j in top[qi]] for qi in range(q.shape[0])]
+
+    def _hit(self, row: int, score: float) -> SearchHit:
+        document = self.documents[row] if self.documents is not None else None
+        return SearchHit(id=self.ids[row], score=score, metadata=self.metadata[row], document=document)
+
+    def search_batch(self, embeddings, limit: int = 5,
+                     filters: Optional[MetadataFilter] = None) -> List[List[SearchHit]]:
+        hits = self.topk(embeddings, limit, self.candidate_rows(filters))
+        return [[self._hit(row, score) for row, score in query_hits] for query_hits in hits]
+
+    def get_by_ids(self, ids: Sequence[str]) -> List[SearchHit]:
+        return [self._hit(self._row_of[str(i)], 1.0) for i in ids if str(i) in self._row_of]
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_milvus(cls, client, collection_name: str, output_fields: List[str],
+                    id_field: str = "concept_id", vector_field: str = "vector",
+                    metric: str = "cosine") -> "NumpyVectorStore":
+        """从 Milvus 集合加载全部向量和输出字段"""
+        vectors, ids, metadata = [], [], []
+        for rows in iter_milvus_rows(client, collection_name, [vector_field] + list(output_fields)):
+            for row in rows:
+                vectors.append(row[vector_field])
+                ids.append(str(row.get(id_field, row["id"])))
+                metadata.append({f: row.get(f) for f in output_fields})
+        logger.info(f"Loaded {len(ids)} vectors from Milvus collection {collection_name}")
+        return cls(np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1), ids, metadata, metric=metric)
+
+    @classmethod
+    def from_chroma(cls, collection, metric: Optional[str] = None) -> "NumpyVectorStore":
+        """从 Chroma 集合加载全部向量、文档和元数据，metric 默认取集合的 hnsw:space"""
+        if metric is None:
+            metric = (collection.metadata or {}).get("hnsw:space", "l2")
+        data = collection.get(include=["embeddings", "documents", "metadatas"])
+        vectors = np.asarray(data["embeddings"], dtype=np.float32)
+        logger.info(f"Loaded {len(data['ids'])} vectors from Chroma collection {collection.name}")
+        return cls(vectors.reshape(len(data["ids"]), -1), data["ids"], data["metadatas"],
+                   documents=data["documents"], metric=metric)
+
+    @classmethod
+    def from_artifact(cls, path, metric: str = "cosine", document_field: Optional[str] = None) -> "NumpyVectorStore":
+        """从向量产物目录加载（见 utils.embedding_artifact）"""
+        from utils.embedding_artifact import EmbeddingArtifactStore
+
+        artifact = EmbeddingArtifactStore.load_dir(path)
+        documents = [m.get(document_field, "") for m in artifact.metadata] if document_field else None
+        return cls(artifact.vectors, artifact.ids, artifact.metadata, documents=documents, metric=metric)
+
+
+# 已加载的进程内检索缓存，服务在每个请求中重新构造，避免重复加载整个集合
+_numpy_store_cache: Dict[tuple, NumpyVectorStore] = {}
+_numpy_store_lock = threading.Lock()
+
+
+def get_cached_numpy_store(key: tuple, loader) -> NumpyVectorStore:
+    """按 key 缓存 NumpyVectorStore，首次访问时调用 loader() 加载"""
+    store = _numpy_store_cache.get(key)
+    if store is not None:
+        return store
+    with _numpy_store_lock:
+        store = _numpy_store_cache.get(key)
+        if store is None:
+            store = loader()
+            _numpy_store_cache[key] = store
+    return store
+
+
+def clear_numpy_store_cache():
+    """重建集合后清空缓存"""
+    with _numpy_store_lock:
+        _numpy_store_cache.clear()